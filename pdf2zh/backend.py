@@ -1,12 +1,35 @@
-from flask import Flask, request, send_file
-from celery import Celery, Task
+from flask import Flask, Response, request, send_file, stream_with_context
+from celery import Celery, Task, chord, states
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 from celery.result import AsyncResult
+from celery.signals import worker_init, worker_process_init
 from pdf2zh import translate_stream
 import tqdm
-import json
 import io
-from pdf2zh.doclayout import ModelInstance
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pdf2zh import cache, transport
+from pdf2zh.blobstore import get_blobstore
+from pdf2zh.doclayout import ModelInstance, OnnxModel
 from pdf2zh.config import ConfigManager
+from pdf2zh.high_level import (
+    NOTO_NAME,
+    download_remote_fonts,
+    extract_pages,
+    load_font,
+    merge_shards,
+    shard_pages,
+)
+from pdf2zh.translator_pool import get_translator, pool as translator_pool
+from pdf2zh.usage import merge_summaries
+from pymupdf import Document
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
 flask_app = Flask("pdf2zh")
 flask_app.config.from_mapping(
@@ -34,49 +57,444 @@ def celery_init_app(app: Flask) -> Celery:
 
 celery_app = celery_init_app(flask_app)
 
+# 当前 worker 进程的预热状态，由 /v1/health 报告
+worker_state = {"ready": False}
+_warm_lock = threading.Lock()
+
+
+def warm_specs() -> list:
+    """
+    WARM_TRANSLATORS: translators to build when a worker starts, e.g.
+    [{"service": "openai:gpt-4o-mini", "lang_in": "en", "lang_out": "zh"}]
+    """
+    specs = ConfigManager.get("WARM_TRANSLATORS") or []
+    if isinstance(specs, str):  # 来自环境变量
+        specs = json.loads(specs)
+    return specs
+
+
+def warm_up():
+    """每个 worker 进程只初始化一次：布局模型、字体、缓存数据库和常用 translator"""
+    with _warm_lock:
+        if worker_state["ready"] and worker_state["pid"] == os.getpid():
+            return
+        start = time.monotonic()
+        # fork 继承的连接不能继续使用，持有旧会话的 translator 一并丢弃
+        cache.reconnect_db()
+        transport.reset()
+        translator_pool.clear()
+        if ModelInstance.value is None:
+            ModelInstance.value = OnnxModel.load_available()
+        specs = warm_specs()
+        fonts = {}
+        for lang_out in {spec.get("lang_out", "zh") for spec in specs}:
+            fonts[lang_out] = download_remote_fonts(lang_out.lower())
+            load_font(NOTO_NAME, fonts[lang_out])
+        translators = []
+        for spec in specs:
+            try:
+                translator = get_translator(
+                    spec["service"],
+                    spec.get("lang_in", "en"),
+                    spec.get("lang_out", "zh"),
+                    envs=spec.get("envs"),
+                    ignore_cache=spec.get("ignore_cache", False),
+                )
+                translators.append(str(translator))
+            except Exception:
+                logger.exception(f"Failed to pre-build translator {spec}")
+        worker_state.update(
+            ready=True,
+            pid=os.getpid(),
+            model=type(ModelInstance.value).__name__,
+            fonts=fonts,
+            translators=translators,
+            warmup_seconds=round(time.monotonic() - start, 3),
+        )
+        logger.info(f"Worker ready: {worker_state}")
+
+
+@worker_init.connect
+def init_worker(**kwargs):
+    # worker 使用只读配置，多个进程同时启动时不会争抢改写 config.json
+    ConfigManager.snapshot()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    warm_up()
+
+
+def blob_key(id: str, name: str) -> str:
+    return f"{id}/{name}.pdf"
+
+
+def progress_meta(t: tqdm.tqdm) -> dict:
+    return {
+        "n": t.n,
+        "total": t.total,
+        "stats": getattr(t, "stats", {}),
+        "usage": getattr(t, "usage", {}),
+        "timings": getattr(t, "timings", {}),
+    }
+
+
+class PartialWriter:
+    """每完成 PARTIAL_PAGES 页，把已完成页面的单语 PDF 写入 blob store"""
+
+    def __init__(self, id: str):
+        self.key = blob_key(id, "partial")
+        self.step = int(ConfigManager.get("PARTIAL_PAGES") or 10)
+        self.pages = 0
 
-@celery_app.task(bind=True)
+    def update(self, t: tqdm.tqdm) -> int:
+        done = len(getattr(t, "pages_done", []))
+        if done - self.pages >= self.step:
+            get_blobstore().put(self.key, t.partial())
+            self.pages = done
+        return self.pages
+
+
+def translate_task_after_return(self, status, retval, task_id, args, kwargs, einfo):
+    # 成功或失败都在结果保存之后删除源文件和部分结果
+    store = get_blobstore()
+    store.delete(args[0])
+    store.delete(blob_key(task_id, "partial"))
+
+
+@celery_app.task(bind=True, after_return=translate_task_after_return)
 def translate_task(
     self: Task,
-    stream: bytes,
+    key: str,
     args: dict,
 ):
+    """PDF 通过 blob store 传递，broker 和结果中只有 key"""
+    partial = PartialWriter(self.request.id)
+    last = {}  # 最后的进度，结束后从中读取各阶段耗时
+
     def progress_bar(t: tqdm.tqdm):
-        self.update_state(state="PROGRESS", meta={"n": t.n, "total": t.total})  # noqa
+        last["progress"] = t
+        meta = dict(progress_meta(t), partial_pages=partial.update(t))
+        self.update_state(state="PROGRESS", meta=meta)  # noqa
         print(f"Translating {t.n} / {t.total} pages")
 
-    doc_mono, doc_dual = translate_stream(
-        stream,
+    warm_up()  # solo/threads 等没有 worker_process_init 的 pool
+    store = get_blobstore()
+    doc_mono, doc_dual, usage = translate_stream(
+        store.get(key),
+        callback=progress_bar,
+        model=ModelInstance.value,
+        return_usage=True,
+        **args,
+    )
+    result = {
+        "mono": store.put(blob_key(self.request.id, "mono"), doc_mono),
+        "dual": store.put(blob_key(self.request.id, "dual"), doc_dual),
+        "usage": usage,
+        "timings": getattr(last.get("progress"), "timings", {}),
+    }
+    return result
+
+
+def manifest_key(id: str) -> str:
+    return f"{id}/manifest.json"
+
+
+def read_manifest(id: str) -> Optional[dict]:
+    """分片任务的清单，普通任务返回 None"""
+    try:
+        return json.loads(get_blobstore().get(manifest_key(id)))
+    except KeyError:
+        return None
+
+
+def translate_shard_task_after_return(
+    self, status, retval, task_id, args, kwargs, einfo
+):
+    key, job = args[0], args[1]
+    if status == states.SUCCESS:
+        if not task_exists(job):  # 其他分片已失败，整个任务已清理
+            get_blobstore().delete(retval["key"])
+        return
+    # 一个分片失败时 chord 不会再合并：停止其余分片并清理整个任务
+    manifest = read_manifest(job)
+    for shard in manifest["shards"] if manifest else []:
+        if shard["id"] != task_id:
+            celery_app.AsyncResult(shard["id"]).revoke()
+    delete_sharded_job(job, key)
+
+
+@celery_app.task(bind=True, after_return=translate_shard_task_after_return)
+def translate_shard_task(
+    self: Task,
+    key: str,
+    job: str,
+    index: int,
+    pages: list,
+    args: dict,
+):
+    """翻译文档中的一段页面，只保存这些页面的译文"""
+    last = {}
+
+    def progress_bar(t: tqdm.tqdm):
+        last["progress"] = t
+        self.update_state(state="PROGRESS", meta=progress_meta(t))  # noqa
+        print(f"Translating {t.n} / {t.total} pages of shard {index}")
+
+    warm_up()
+    store = get_blobstore()
+    # 字体在合并后统一子集化
+    args = dict(args, pages=pages, skip_subset_fonts=True)
+    doc_mono, _, usage = translate_stream(
+        store.get(key),
         callback=progress_bar,
         model=ModelInstance.value,
+        return_usage=True,
         **args,
     )
-    return doc_mono, doc_dual
+    shard_key = store.put(
+        blob_key(job, f"shard-{index}"), extract_pages(doc_mono, pages)
+    )
+    return {
+        "pages": pages,
+        "key": shard_key,
+        "usage": usage,
+        "timings": getattr(last.get("progress"), "timings", {}),
+    }
+
+
+def delete_sharded_job(id: str, key: str):
+    """删除分片任务的源文件、各分片的译文和清单，只保留合并后的结果"""
+    store = get_blobstore()
+    manifest = read_manifest(id)
+    store.delete(key)
+    for index in range(len(manifest["shards"]) if manifest else 0):
+        store.delete(blob_key(id, f"shard-{index}"))
+    store.delete(manifest_key(id))
+
+
+def merge_task_after_return(self, status, retval, task_id, args, kwargs, einfo):
+    # 结果保存之后才清理，状态查询不会在两者之间看到既无结果又无文件的任务
+    delete_sharded_job(task_id, args[1])
+
+
+@celery_app.task(bind=True, after_return=merge_task_after_return)
+def merge_task(self: Task, shards: list, key: str, args: dict):
+    """chord 的回调：把各分片的页面合并成完整的单语和双语文档"""
+    store = get_blobstore()
+    doc_mono, doc_dual = merge_shards(
+        store.get(key),
+        [(shard["pages"], store.get(shard["key"])) for shard in shards],
+        skip_subset_fonts=args.get("skip_subset_fonts", False),
+    )
+    result = {
+        "mono": store.put(blob_key(self.request.id, "mono"), doc_mono),
+        "dual": store.put(blob_key(self.request.id, "dual"), doc_dual),
+        "usage": merge_summaries([shard["usage"] for shard in shards]),
+        "timings": merge_summaries([shard["timings"] for shard in shards]),
+        "shards": len(shards),
+    }
+    return result
+
+
+def submit_sharded(id: str, key: str, shards: list, args: dict):
+    """每个分片一个任务，全部完成后由 merge_task 合并，job id 即 merge_task 的 id"""
+    manifest = {
+        "shards": [
+            {"id": f"{id}-{index}", "pages": pages}
+            for index, pages in enumerate(shards)
+        ]
+    }
+    get_blobstore().put(manifest_key(id), json.dumps(manifest).encode())
+    header = [
+        translate_shard_task.s(key, id, index, shard["pages"], args).set(
+            task_id=shard["id"]
+        )
+        for index, shard in enumerate(manifest["shards"])
+    ]
+    # eager 模式下 chord 忽略 apply_async 的 task_id，回调本身也要指定 id
+    body = merge_task.s(key, args).set(task_id=id)
+    chord(header, body).apply_async(task_id=id)
+
+
+def sharded_progress(manifest: dict) -> dict:
+    """汇总所有分片的进度和用量"""
+    n = total = done = partial_pages = 0
+    usage = []
+    timings = []
+    for shard in manifest["shards"]:
+        result: AsyncResult = celery_app.AsyncResult(shard["id"])
+        if str(result.state) == "PROGRESS":
+            n += result.info["n"]
+            total += result.info["total"]
+            usage.append(result.info.get("usage", {}))
+            timings.append(result.info.get("timings", {}))
+        elif result.successful():
+            done += 1
+            n += len(shard["pages"])
+            total += len(shard["pages"])
+            partial_pages += len(shard["pages"])
+            usage.append(result.result["usage"])
+            timings.append(result.result.get("timings", {}))
+        else:
+            total += len(shard["pages"])
+    return {
+        "n": n,
+        "total": total,
+        "shards": len(manifest["shards"]),
+        "done": done,
+        "usage": merge_summaries(usage),
+        "timings": merge_summaries(timings),
+        "partial_pages": partial_pages,
+    }
+
+
+@celery_app.task
+def health_task():
+    warm_up()  # prefork 下已在 worker_process_init 中完成；solo pool 在此预热
+    return dict(worker_state)
+
+
+@flask_app.route("/v1/health", methods=["GET"])
+def get_health():
+    """Liveness of the workers and the warm-up state of the one that answered."""
+    workers = [name for reply in celery_app.control.ping(timeout=1) for name in reply]
+    if not workers:
+        return {"status": "down", "workers": []}, 503
+    try:
+        worker = health_task.apply_async().get(
+            timeout=float(ConfigManager.get("HEALTH_TIMEOUT") or 5)
+        )
+    except CeleryTimeoutError:  # 所有 worker 都在处理任务
+        return {"status": "busy", "workers": workers}, 503
+    return {"status": "ok", "workers": workers, "worker": worker}
 
 
 @flask_app.route("/v1/translate", methods=["POST"])
 def create_translate_tasks():
     file = request.files["file"]
-    stream = file.stream.read()
     print(request.form.get("data"))
     args = json.loads(request.form.get("data"))
-    task = translate_task.delay(stream, args)
+    # shard_size: 每个分片的页数，页数更多的文档分给多个 worker 并行翻译
+    shard_size = int(args.pop("shard_size", 0) or 0)
+    id = str(uuid.uuid4())
+    store = get_blobstore()
+    key = store.put(blob_key(id, "source"), file.stream)
+    if shard_size:
+        page_count = Document(stream=store.get(key)).page_count
+        shards = shard_pages(page_count, shard_size, args.get("pages"))
+        if len(shards) > 1:
+            submit_sharded(id, key, shards, args)
+            return {"id": id, "shards": len(shards)}
+    task = translate_task.apply_async((key, args), task_id=id)
     return {"id": task.id}
 
 
-@flask_app.route("/v1/translate/<id>", methods=["GET"])
-def get_translate_task(id: str):
+def task_exists(id: str) -> bool:
+    """
+    Celery reports unknown ids as PENDING; a submitted task, sharded or not,
+    keeps its source PDF until its result is stored.
+    """
+    try:
+        get_blobstore().open(blob_key(id, "source")).close()
+        return True
+    except KeyError:
+        return False
+
+
+def task_status(id: str) -> dict:
     result: AsyncResult = celery_app.AsyncResult(id)
     if str(result.state) == "PROGRESS":
         return {"state": str(result.state), "info": result.info}
-    else:
-        return {"state": str(result.state)}
+    elif result.successful():  # 完成后返回本文档的用量，便于按文档计费
+        return {
+            "state": str(result.state),
+            "usage": result.result["usage"],
+            "timings": result.result.get("timings", {}),
+        }
+    manifest = read_manifest(id)
+    # 分片仍在翻译；结果过期后残留的清单不算，源文件在任务结束时已删除
+    if manifest is not None and str(result.state) == "PENDING" and task_exists(id):
+        return {"state": "PROGRESS", "info": sharded_progress(manifest)}
+    return {"state": str(result.state)}
+
+
+@flask_app.route("/v1/translate/<id>", methods=["GET"])
+def get_translate_task(id: str):
+    return task_status(id)
+
+
+@flask_app.route("/v1/translate/<id>/events", methods=["GET"])
+def get_translate_events(id: str):
+    """
+    Server-sent events with the same payload as GET /v1/translate/<id>, pushed
+    whenever it changes until the task is finished.
+    """
+    interval = float(ConfigManager.get("SSE_INTERVAL") or 1)
+    if task_status(id)["state"] == "PENDING" and not task_exists(id):
+        return {"error": "task not found"}, 404
+
+    def events():
+        last = None
+        while True:
+            status = task_status(id)
+            data = json.dumps(status)
+            if data != last:
+                yield f"event: {status['state'].lower()}\ndata: {data}\n\n"
+                last = data
+            if status["state"] in states.READY_STATES:
+                return
+            # 任务结果过期或文件被删除后不再等待
+            if status["state"] == "PENDING" and not task_exists(id):
+                return
+            time.sleep(interval)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@flask_app.route("/v1/translate/<id>/partial", methods=["GET"])
+def get_translate_partial(id: str):
+    """Monolingual PDF of the pages translated so far."""
+    result: AsyncResult = celery_app.AsyncResult(id)
+    if result.successful():
+        return get_translate_result(id, "mono")
+    store = get_blobstore()
+    manifest = read_manifest(id)
+    if manifest is not None:  # 合并已完成的分片
+        shards = [
+            (shard["pages"], store.get(blob_key(id, f"shard-{index}")))
+            for index, shard in enumerate(manifest["shards"])
+            if celery_app.AsyncResult(shard["id"]).successful()
+        ]
+        if not shards:
+            return {"error": "no pages finished"}, 404
+        doc_mono, _ = merge_shards(store.get(blob_key(id, "source")), shards)
+        pages = sorted(page for done, _ in shards for page in done)
+        return send_file(io.BytesIO(extract_pages(doc_mono, pages)), "application/pdf")
+    try:
+        doc = store.open(blob_key(id, "partial"))
+    except KeyError:
+        return {"error": "no pages finished"}, 404
+    return send_file(doc, "application/pdf")
 
 
 @flask_app.route("/v1/translate/<id>", methods=["DELETE"])
 def delete_translate_task(id: str):
     result: AsyncResult = celery_app.AsyncResult(id)
     result.revoke(terminate=True)
+    store = get_blobstore()
+    manifest = read_manifest(id)
+    if manifest is not None:
+        for index, shard in enumerate(manifest["shards"]):
+            celery_app.AsyncResult(shard["id"]).revoke(terminate=True)
+            store.delete(blob_key(id, f"shard-{index}"))
+        store.delete(manifest_key(id))
+    for name in ("source", "mono", "dual", "partial"):
+        store.delete(blob_key(id, name))
     return {"state": str(result.state)}
 
 
@@ -87,9 +505,12 @@ def get_translate_result(id: str, format: str):
         return {"error": "task not finished"}, 400
     if not result.successful():
         return {"error": "task failed"}, 400
-    doc_mono, doc_dual = result.get()
-    to_send = doc_mono if format == "mono" else doc_dual
-    return send_file(io.BytesIO(to_send), "application/pdf")
+    key = result.get()["mono" if format == "mono" else "dual"]
+    try:
+        doc = get_blobstore().open(key)
+    except KeyError:
+        return {"error": "result deleted"}, 404
+    return send_file(doc, "application/pdf")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted concurrently from many threads and runs them through
+    one batched call. A batch is dispatched when ``max_batch`` items are waiting
+    or ``max_wait`` seconds after its first item arrived.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[T]], List[R]],
+        max_batch: int = 32,
+        max_wait: float = 0.05,
+    ):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[tuple[T, Future, contextvars.Context]]" = (
+            queue.Queue()
+        )
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: T) -> Future:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+        future = Future()
+        self._queue.put((item, future, contextvars.copy_context()))
+        return future
+
+    def __call__(self, item: T) -> R:
+        return self.submit(item).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [
+                (item, future, context)
+                for item, future, context in batch
+                if future.set_running_or_notify_cancel()  # 跳过已取消的请求
+            ]
+            if not batch:
+                continue
+            logger.debug(f"Running a batch of {len(batch)}")
+            try:
+                # 在第一个请求的 context 中执行，用量记入提交它的文档
+                results = batch[0][2].run(self.fn, [item for item, _, _ in batch])
+            except BaseException as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
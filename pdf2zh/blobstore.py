@@ -0,0 +1,153 @@
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+from urllib.parse import urlparse
+
+from pdf2zh.config import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+Data = Union[bytes, BinaryIO]
+
+
+class BlobStore:
+    """Object store for the PDFs of backend jobs, so tasks only carry keys."""
+
+    def put(self, key: str, data: Data) -> str:
+        """
+        Store ``data`` (bytes or a binary file object) under ``key``.
+        :return: the key
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def open(self, key: str) -> BinaryIO:
+        """Binary file object streaming the blob, raises KeyError if it is missing."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove the blob, missing keys are ignored."""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Invalid blob key {key!r}")
+        return path
+
+    def put(self, key: str, data: Data) -> str:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，读取方不会看到写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, bytes):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return key
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.path(key).open("rb")
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+
+class S3BlobStore(BlobStore):
+    """S3 or any S3-compatible store such as MinIO, requires boto3."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+    ):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError(
+                "The S3 blob store requires boto3, install it with `pip install boto3`"
+            )
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        # 凭据使用 boto3 的默认方式读取（AWS_ACCESS_KEY_ID 等环境变量）
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, data: Data) -> str:
+        if isinstance(data, bytes):
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.object_key(key), Body=data
+            )
+        else:
+            self.client.upload_fileobj(data, self.bucket, self.object_key(key))
+        return key
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.object_key(key)
+            )
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError(key)
+        return response["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+
+def default_blob_path() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "pdf2zh", "blobs")
+
+
+def from_url(url: Optional[str]) -> BlobStore:
+    """
+    "s3://bucket/prefix" or a local directory ("file:///data/pdf2zh" or a plain
+    path). The local default lives next to the translation cache.
+    """
+    if not url:
+        return LocalBlobStore(default_blob_path())
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3BlobStore(
+            parsed.netloc,
+            parsed.path,
+            endpoint_url=ConfigManager.get("BLOBSTORE_ENDPOINT_URL"),
+        )
+    if parsed.scheme == "file":
+        return LocalBlobStore(parsed.path)
+    return LocalBlobStore(url)
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_blobstore() -> BlobStore:
+    """Blob store configured by BLOBSTORE (and BLOBSTORE_ENDPOINT_URL for MinIO)."""
+    global _store
+    if _store is None:
+        _store = from_url(ConfigManager.get("BLOBSTORE"))
+    return _store
@@ -112,6 +112,15 @@ def init_db(remove_exists=False):
     db.create_tables([_TranslationCache], safe=True)
 
 
+def reconnect_db():
+    """
+    Open a fresh connection in this process, e.g. in a worker after fork.
+    The connection inherited from the parent must not be used or closed here.
+    """
+    db._state.reset()
+    db.connect(reuse_if_open=True)
+
+
 def init_test_db():
     import tempfile
 
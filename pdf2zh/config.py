@@ -3,6 +3,7 @@ from pathlib import Path
 from threading import RLock  # 改成 RLock
 import os
 import copy
+import tempfile
 
 
 class ConfigManager:
@@ -27,6 +28,12 @@ class ConfigManager:
 
         self._config_path = Path.home() / ".config" / "PDFMathTranslate" / "config.json"
         self._config_data = {}
+        # 只读快照模式：不创建、不写回配置文件（也可通过环境变量开启）
+        self._read_only = os.environ.get("PDF2ZH_CONFIG_READONLY", "").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
 
         # 这里不要再加锁，因为外层可能已经加了锁 (get_instance), RLock也无妨
         self._ensure_config_exists()
@@ -36,7 +43,9 @@ class ConfigManager:
         # 这里也不需要显式再次加锁，原因同上，方法体中再调用 _load_config()，
         # 而 _load_config() 内部会加锁。因为 RLock 是可重入的，不会阻塞。
         if not self._config_path.exists():
-            if isInit:
+            if isInit and self._read_only:
+                self._config_data = {}
+            elif isInit:
                 self._config_path.parent.mkdir(parents=True, exist_ok=True)
                 self._config_data = {}  # 默认配置内容
                 self._save_config()
@@ -52,12 +61,23 @@ class ConfigManager:
                 self._config_data = json.load(f)
 
     def _save_config(self):
-        """保存配置到 config.json"""
+        """保存配置到 config.json，只读模式下只保留在内存中"""
+        if self._read_only:
+            return
         with self._lock:  # 加锁确保线程安全
             # 移除循环引用并写入
             cleaned_data = self._remove_circular_references(self._config_data)
-            with self._config_path.open("w", encoding="utf-8") as f:
-                json.dump(cleaned_data, f, indent=4, ensure_ascii=False)
+            # 先写临时文件再替换，其他进程不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self._config_path.parent, prefix=".config.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(cleaned_data, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self._config_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
 
     def _remove_circular_references(self, obj, seen=None):
         """递归移除循环引用"""
@@ -90,31 +110,34 @@ class ConfigManager:
             instance._ensure_config_exists(isInit=False)
             cls._instance = instance
 
+    @classmethod
+    def snapshot(cls, file_path=None):
+        """
+        切换到只读快照模式：配置文件只加载一次，set 等修改只在内存中生效，
+        不再写回文件。用于服务端和 worker，多个进程同时启动时不会争抢改写 config.json。
+        """
+        with cls._lock:
+            instance = cls.get_instance()
+            instance._read_only = True
+            if file_path is not None:
+                instance._config_path = Path(file_path)
+            if instance._config_path.exists():
+                instance._load_config()
+            else:
+                instance._config_data = {}
+
+    @classmethod
+    def read_only(cls) -> bool:
+        return cls.get_instance()._read_only
+
     @classmethod
     def get(cls, key, default=None):
-        """获取配置值"""
+        """获取配置值，依次查找配置文件、环境变量和默认值"""
         instance = cls.get_instance()
-        # 读取时，加锁或不加锁都行。但为了统一，我们在修改配置前后都要加锁。
-        # get 只要最终需要保存，则会加锁 -> _save_config()
+        # 只读取，不写回：环境变量和默认值只在本次调用中生效，写入配置只通过 set
         if key in instance._config_data:
             return instance._config_data[key]
-
-        # 若环境变量中存在该 key，则使用环境变量并写回 config
-        if key in os.environ:
-            value = os.environ[key]
-            instance._config_data[key] = value
-            instance._save_config()
-            return value
-
-        # 若 default 不为 None，则设置并保存
-        if default is not None:
-            instance._config_data[key] = default
-            instance._save_config()
-            return default
-
-        # 找不到则抛出异常
-        # raise KeyError(f"{key} is not found in config file or environment variables.")
-        return default
+        return os.environ.get(key, default)
 
     @classmethod
     def set(cls, key, value):
@@ -138,6 +161,8 @@ class ConfigManager:
     def set_translator_by_name(cls, name, new_translator_envs):
         """根据 name 设置或更新 translator 配置"""
         instance = cls.get_instance()
+        if instance._read_only:  # 只读模式下各 translator 的 envs 互不影响，不修改快照
+            return
         with instance._lock:
             translators = instance._config_data.get("translators", [])
             for translator in translators:
@@ -1,8 +1,14 @@
 import concurrent.futures
+import contextvars
 import logging
 import re
+import sys
+import threading
+import time
 import unicodedata
+from array import array
 from enum import Enum
+from itertools import chain
 from string import Template
 from typing import Dict
 
@@ -13,37 +19,30 @@ from pdfminer.pdffont import PDFCIDFont, PDFUnicodeNotDefined
 from pdfminer.pdfinterp import PDFGraphicState, PDFResourceManager
 from pdfminer.utils import apply_matrix_pt, mult_matrix
 from pymupdf import Font
-from tenacity import retry, wait_fixed
-
-from pdf2zh.translator import (
-    AnythingLLMTranslator,
-    ArgosTranslator,
-    AzureOpenAITranslator,
-    AzureTranslator,
-    BaseTranslator,
-    BingTranslator,
-    DeepLTranslator,
-    DeepLXTranslator,
-    DeepseekTranslator,
-    DifyTranslator,
-    GeminiTranslator,
-    GoogleTranslator,
-    GrokTranslator,
-    GroqTranslator,
-    ModelScopeTranslator,
-    OllamaTranslator,
-    OpenAIlikedTranslator,
-    OpenAITranslator,
-    PlamoAPITranslator,
-    PlamoTranslator, 
-    QwenMtTranslator,
-    SiliconTranslator,
-    TencentTranslator,
-    XinferenceTranslator,
-    ZhipuTranslator,
+
+from pdf2zh import transport
+from pdf2zh.ratelimit import (
+    AdaptiveConcurrencyLimiter,
+    RetryExhaustedError,
+    RetryPolicy,
+    estimate_tokens,
 )
+from pdf2zh.translator import BaseTranslator
+from pdf2zh.translator_pool import get_translator
+from pdf2zh.usage import record as record_usage
+from pdf2zh.usage_logger import get_ledger, price_data
 
 log = logging.getLogger(__name__)
+_limiter_lock = threading.Lock()  # 多个文档同时使用同一个复用的 translator
+
+try:
+    from pdfminer.utils import apply_matrix_rect
+except ImportError:  # pdfminer.six < 20250324
+    def apply_matrix_rect(matrix, rect):
+        (x0, y0, x1, y1) = rect
+        pts = [apply_matrix_pt(matrix, p) for p in ((x0, y0), (x0, y1), (x1, y0), (x1, y1))]
+        xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+        return (min(xs), min(ys), max(xs), max(ys))
 
 
 class PDFConverterEx(PDFConverter):
@@ -60,6 +59,7 @@ class PDFConverterEx(PDFConverter):
         (x1, y1) = apply_matrix_pt(ctm, (x1, y1))
         mediabox = (0, 0, abs(x0 - x1), abs(y0 - y1))
         self.cur_item = LTPage(page.pageno, mediabox)
+        self.cur_item.chars = PageChars()  # hack 插入列式字符表
 
     def end_page(self, page):
         # 重载返回指令流
@@ -70,6 +70,7 @@ class PDFConverterEx(PDFConverter):
         self._stack.append(self.cur_item)
         self.cur_item = LTFigure(name, bbox, mult_matrix(matrix, self.ctm))
         self.cur_item.pageid = self._stack[-1].pageid
+        self.cur_item.chars = PageChars()  # hack 插入列式字符表
 
     def end_figure(self, _: str) -> None:
         # 重载返回指令流
@@ -90,30 +91,186 @@ class PDFConverterEx(PDFConverter):
         ncs,
         graphicstate: PDFGraphicState,
     ) -> float:
-        # 重载设置 cid 和 font
+        # 重载写入列式字符表，不再构建 LTChar，边界计算与 LTChar 一致
         try:
             text = font.to_unichr(cid)
             assert isinstance(text, str), str(type(text))
         except PDFUnicodeNotDefined:
             text = self.handle_undefined_char(font, cid)
         textwidth = font.char_width(cid)
-        textdisp = font.char_disp(cid)
-        item = LTChar(
-            matrix,
-            font,
-            fontsize,
-            scaling,
-            rise,
+        adv = textwidth * fontsize * scaling
+        vertical = font.is_vertical()
+        if vertical:
+            (vx, vy) = font.char_disp(cid)
+            vx = fontsize * 0.5 if vx is None else vx * fontsize * 0.001
+            vy = (1000 - vy) * fontsize * 0.001
+            bbox = (-vx, vy + rise + adv, -vx + fontsize, vy + rise)
+        else:
+            descent = font.get_descent() * fontsize
+            bbox = (0, descent + rise, adv, descent + rise + fontsize)
+        (x0, y0, x1, y1) = apply_matrix_rect(matrix, bbox)
+        if x1 < x0:
+            (x0, x1) = (x1, x0)
+        if y1 < y0:
+            (y0, y1) = (y1, y0)
+        self.cur_item.chars.append(
             text,
-            textwidth,
-            textdisp,
-            ncs,
-            graphicstate,
+            x0,
+            y0,
+            x1,
+            y1,
+            x1 - x0 if vertical else y1 - y0,
+            cid,
+            font,
+            matrix[0] == 0 and matrix[3] == 0,
+            len(self.cur_item),
         )
-        self.cur_item.add(item)
-        item.cid = cid  # hack 插入原字符编码
-        item.font = font  # hack 插入原字符字体
-        return item.adv
+        return adv
+
+
+class PageChars:
+    """页面字符的列式存储
+
+    render_char 时逐列追加，freeze 之后以 numpy 数组读取。
+    seq 记录字符加入前页面中已有的元素（线条、图表）数量，用于还原两者的先后顺序。
+    """
+
+    def __init__(self) -> None:
+        self.text: list[str] = []
+        self.fonts: list = []                       # 字体对象表，font 列为其下标
+        self.fontnames: list[str] = []
+        self._fontidx: Dict[object, int] = {}
+        self._x0, self._y0 = array("d"), array("d")
+        self._x1, self._y1 = array("d"), array("d")
+        self._size = array("d")
+        self._cid, self._font, self._seq = array("i"), array("i"), array("i")
+        self._vertical = array("b")
+        self.frozen = False
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def append(self, text, x0, y0, x1, y1, size, cid, font, vertical, seq, fontname=None) -> None:
+        key = font if font is not None else fontname
+        fid = self._fontidx.get(key)
+        if fid is None:
+            fid = self._fontidx[key] = len(self.fonts)
+            self.fonts.append(font)
+            self.fontnames.append(fontname if font is None else font.fontname)
+        self.text.append(text)
+        self._x0.append(x0)
+        self._y0.append(y0)
+        self._x1.append(x1)
+        self._y1.append(y1)
+        self._size.append(size)
+        self._cid.append(cid)
+        self._font.append(fid)
+        self._vertical.append(vertical)
+        self._seq.append(seq)
+
+    def freeze(self) -> "PageChars":
+        if not self.frozen:
+            self.x0 = np.frombuffer(self._x0, dtype=np.float64)
+            self.y0 = np.frombuffer(self._y0, dtype=np.float64)
+            self.x1 = np.frombuffer(self._x1, dtype=np.float64)
+            self.y1 = np.frombuffer(self._y1, dtype=np.float64)
+            self.size = np.frombuffer(self._size, dtype=np.float64)
+            self.cid = np.frombuffer(self._cid, dtype=np.intc)
+            self.font = np.frombuffer(self._font, dtype=np.intc)
+            self.seq = np.frombuffer(self._seq, dtype=np.intc)
+            self.vertical = np.frombuffer(self._vertical, dtype=np.int8).astype(bool)
+            self.frozen = True
+        return self
+
+    def fontname(self, i: int) -> str:
+        return self.fontnames[self.font[i]]
+
+    @classmethod
+    def from_layout(cls, ltpage) -> "PageChars":
+        """从包含 LTChar 的页面构建"""
+        chars = cls()
+        seq = 0
+        for child in ltpage:
+            if isinstance(child, LTChar):
+                chars.append(
+                    child.get_text(),
+                    child.x0,
+                    child.y0,
+                    child.x1,
+                    child.y1,
+                    child.size,
+                    getattr(child, "cid", 0),
+                    getattr(child, "font", None),
+                    child.matrix[0] == 0 and child.matrix[3] == 0,
+                    seq,
+                    child.fontname,
+                )
+            else:
+                seq += 1
+        return chars
+
+
+class FormulaClassifier:
+    """匹配公式（和角标）字体与字符
+
+    正则只编译一次，判定结果按字体名和字符缓存，整页字符可用 classify_chars 一次性判定。
+    """
+
+    # latex 字体
+    LATEX_FONT = r"(CM[^R]|MS.M|XY|MT|BL|RM|EU|LA|RS|LINE|LCIRCLE|TeX-|rsfs|txsy|wasy|stmary|.*Mono|.*Code|.*Ital|.*Sym|.*Math)"
+    # 文字修饰符、数学符号、分隔符号
+    CHAR_CATEGORIES = frozenset(["Lm", "Mn", "Sk", "Sm", "Zl", "Zp", "Zs"])
+
+    def __init__(self, vfont: str = None, vchar: str = None) -> None:
+        self.vfont = re.compile(vfont or self.LATEX_FONT)
+        self.vchar = re.compile(vchar) if vchar else None
+        self._font_cache: Dict[object, bool] = {}
+        self._char_cache: Dict[str, bool] = {}
+
+    def font_flag(self, font) -> bool:
+        """基于字体名规则的判定"""
+        flag = self._font_cache.get(font)
+        if flag is None:
+            name = font
+            if isinstance(name, bytes):  # 不一定能 decode，直接转 str
+                try:
+                    name = name.decode("utf-8")
+                except UnicodeDecodeError:
+                    name = ""
+            name = name.split("+")[-1]  # 字体名截断
+            flag = self.vfont.match(name) is not None
+            self._font_cache[font] = flag
+        return flag
+
+    def char_flag(self, char: str) -> bool:
+        """基于字符集规则的判定"""
+        flag = self._char_cache.get(char)
+        if flag is None:
+            if char.startswith("(cid:"):
+                flag = True
+            elif self.vchar:
+                flag = self.vchar.match(char) is not None
+            else:
+                flag = (
+                    char != ""
+                    and char != " "  # 非空格
+                    and (
+                        unicodedata.category(char[0]) in self.CHAR_CATEGORIES
+                        or 0x370 <= ord(char[0]) < 0x400  # 希腊字母
+                    )
+                )
+            self._char_cache[char] = flag
+        return flag
+
+    def __call__(self, font, char: str) -> bool:
+        return self.font_flag(font) or self.char_flag(char)
+
+    def classify_chars(self, chars: "PageChars") -> np.ndarray:
+        """整页判定，字体只按字体表判定一次"""
+        font_flags = np.array([self.font_flag(f) for f in chars.fontnames], dtype=bool)
+        char_flag = self.char_flag
+        char_flags = np.fromiter((char_flag(c) for c in chars.text), dtype=bool, count=len(chars))
+        return font_flags[chars.font] | char_flags
 
 
 class Paragraph:
@@ -145,33 +302,130 @@ class TranslateConverter(PDFConverterEx):
         envs: Dict = None,
         prompt: Template = None,
         ignore_cache: bool = False,
+        dry_run: bool = False,
+        translator: BaseTranslator = None,
     ) -> None:
         super().__init__(rsrcmgr)
         self.vfont = vfont
         self.vchar = vchar
+        self.classifier = FormulaClassifier(vfont, vchar)
         self.thread = thread
         self.layout = layout
         self.noto_name = noto_name
         self.noto = noto
-        self.translator: BaseTranslator = None
-        # e.g. "ollama:gemma2:9b" -> ["ollama", "gemma2:9b"]
-        param = service.split(":", 1)
-        service_name = param[0]
-        service_model = param[1] if len(param) > 1 else None
-        if not envs:
-            envs = {}
-        # Force single-thread for PlamoTranslator (MLX/vLLM are not thread-safe)
-        if service_name == "plamo-local":
-            self.thread = 1
-        for translator in [
-            GoogleTranslator, BingTranslator, DeepLTranslator, DeepLXTranslator, OllamaTranslator, XinferenceTranslator, AzureOpenAITranslator,
-            OpenAITranslator, ZhipuTranslator, ModelScopeTranslator, SiliconTranslator, GeminiTranslator, AzureTranslator, TencentTranslator, DifyTranslator, AnythingLLMTranslator, ArgosTranslator, GrokTranslator, GroqTranslator, DeepseekTranslator, OpenAIlikedTranslator, QwenMtTranslator,
-            PlamoTranslator, PlamoAPITranslator
-        ]:
-            if service_name == translator.name:
-                self.translator = translator(lang_in, lang_out, service_model, envs=envs, prompt=prompt, ignore_cache=ignore_cache)
-        if not self.translator:
-            raise ValueError("Unsupported translation service")
+        self.dedupe: Dict[str, concurrent.futures.Future] = {}  # 文档级段落去重
+        self.stats = {"paragraphs": 0, "unique": 0, "failed": 0}
+        self.stats_lock = threading.Lock()
+        self.timings = {"parse": 0.0, "translate": 0.0, "typeset": 0.0}  # 各阶段累计耗时
+        self.retry_policy = RetryPolicy.from_config()
+        self.dry_run = dry_run  # 只解析段落并估算用量，不调用翻译服务
+        if dry_run:
+            self.stats.update(cached=0, characters=0, tokens=0)
+        transport.configure(pool_size=self.thread)  # 连接池大小与线程数一致
+        # 未指定时从进程级的池中取已初始化的 translator，跨文档复用客户端和本地模型
+        self.translator = translator or get_translator(
+            service, lang_in, lang_out, envs, prompt, ignore_cache
+        )
+        # --thread 为并发上限，实际并发数根据限流反馈自适应调整
+        # 复用的 translator 可能正被其他文档使用，只创建一次 limiter，上限取最大的 --thread
+        with _limiter_lock:
+            if self.translator.limiter is None:
+                self.translator.limiter = AdaptiveConcurrencyLimiter(max(self.thread, 1))
+            else:
+                self.translator.limiter.raise_max_limit(max(self.thread, 1))
+
+    def report(self) -> dict:
+        """翻译进度统计：段落去重情况和当前并发状态"""
+        report = dict(self.stats)
+        if self.translator.limiter is not None:
+            report.update(self.translator.limiter.state())
+        if self.translator.stream_guard is not None and self.translator.stream_guard.enabled:
+            report.update(self.translator.stream_guard.state())
+        return report
+
+    def add_timing(self, stage: str, tick: float) -> float:
+        """累计从 tick 到现在的耗时，返回新的起点"""
+        now = time.perf_counter()
+        self.timings[stage] += now - tick
+        return now
+
+    def dry_run_worker(self, s: str) -> str:
+        """试运行时代替翻译：查询缓存并累计需要翻译的字符数和 token 数"""
+        cached = (
+            not self.translator.ignore_cache
+            and self.translator.cache.get(s) is not None
+        )
+        with self.stats_lock:
+            if cached:
+                self.stats["cached"] += 1
+            else:
+                self.stats["characters"] += len(s)
+                self.stats["tokens"] += estimate_tokens(s, include_output=False)
+        return s
+
+    def estimate(self, elapsed: float = 0) -> dict:
+        """
+        根据试运行统计估算 token、费用和耗时。
+        费用按价格表计算，耗时按用量记录中该模型最近的平均请求时间和并发数估算，
+        没有数据时为 None。
+        """
+        requests = self.stats["unique"] - self.stats["cached"]
+        prompt_tokens = 0
+        if self.translator.CustomPrompt:  # LLM 服务每个请求都要发送提示词
+            prompt_tokens = sum(
+                estimate_tokens(message["content"], include_output=False)
+                for message in self.translator.prompt("")
+            )
+        output_tokens = self.stats["tokens"]  # 译文长度按与原文相当估算
+        input_tokens = output_tokens + prompt_tokens * requests
+        cost = None
+        prices = price_data.get_price(self.translator.model or "")
+        if prices is not None:
+            cost = round(
+                input_tokens / 1_000_000 * prices["input"]
+                + output_tokens / 1_000_000 * prices["output"],
+                6,
+            )
+        seconds = None
+        throughput = get_ledger().throughput(self.translator.model)
+        if throughput is not None:
+            seconds = round(
+                elapsed
+                + requests * throughput["seconds_per_request"] / max(self.thread, 1),
+                1,
+            )
+        return {
+            "service": self.translator.name,
+            "model": self.translator.model,
+            "paragraphs": self.stats["paragraphs"],
+            "unique": self.stats["unique"],
+            "cached": self.stats["cached"],
+            "requests": requests,
+            "characters": self.stats["characters"],
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": cost,
+            "seconds": seconds,
+        }
+
+    def submit_paragraph(self, executor, worker, s: str) -> concurrent.futures.Future:
+        """提交段落翻译，整篇文档中规范化后相同的段落只翻译一次"""
+        if not s.strip() or re.match(r"^\{v\d+\}$", s):  # 空白和公式不翻译
+            future = concurrent.futures.Future()
+            future.set_result(s)
+            return future
+        key = " ".join(s.split())
+        self.stats["paragraphs"] += 1
+        future = self.dedupe.get(key)
+        if future is None:
+            self.stats["unique"] += 1
+        elif not (future.done() and future.exception() is not None):
+            return future
+        # 首次出现或上次翻译失败；复制 context 使翻译线程计入当前文档的用量
+        future = self.dedupe[key] = executor.submit(
+            contextvars.copy_context().run, worker, s
+        )
+        return future
 
     def receive_layout(self, ltpage: LTPage):
         # 段落
@@ -179,162 +433,147 @@ class TranslateConverter(PDFConverterEx):
         pstk: list[Paragraph] = []      # 段落属性栈
         vbkt: int = 0                   # 段落公式括号计数
         # 公式组
-        vstk: list[LTChar] = []         # 公式符号组
+        vstk: list[int] = []            # 公式符号组（字符序号）
         vlstk: list[LTLine] = []        # 公式线条组
         vfix: float = 0                 # 公式纵向偏移
         # 公式组栈
-        var: list[list[LTChar]] = []    # 公式符号组栈
+        var: list[list[int]] = []       # 公式符号组栈
         varl: list[list[LTLine]] = []   # 公式线条组栈
         varf: list[float] = []          # 公式纵向偏移栈
         vlen: list[float] = []          # 公式宽度栈
         # 全局
         lstk: list[LTLine] = []         # 全局线条栈
-        xt: LTChar = None               # 上一个字符
+        xt: int = -1                    # 上一个字符序号
         xt_cls: int = -1                # 上一个字符所属段落，保证无论第一个字符属于哪个类别都可以触发新段落
         vmax: float = ltpage.width / 4  # 行内公式最大宽度
-        ops: str = ""                   # 渲染结果
-
-        def vflag(font: str, char: str):    # 匹配公式（和角标）字体
-            if isinstance(font, bytes):     # 不一定能 decode，直接转 str
-                try:
-                    font = font.decode('utf-8')  # 尝试使用 UTF-8 解码
-                except UnicodeDecodeError:
-                    font = ""
-            font = font.split("+")[-1]      # 字体名截断
-            if re.match(r"\(cid:", char):
-                return True
-            # 基于字体名规则的判定
-            if self.vfont:
-                if re.match(self.vfont, font):
-                    return True
-            else:
-                if re.match(                                            # latex 字体
-                    r"(CM[^R]|MS.M|XY|MT|BL|RM|EU|LA|RS|LINE|LCIRCLE|TeX-|rsfs|txsy|wasy|stmary|.*Mono|.*Code|.*Ital|.*Sym|.*Math)",
-                    font,
-                ):
-                    return True
-            # 基于字符集规则的判定
-            if self.vchar:
-                if re.match(self.vchar, char):
-                    return True
-            else:
-                if (
-                    char
-                    and char != " "                                     # 非空格
-                    and (
-                        unicodedata.category(char[0])
-                        in ["Lm", "Mn", "Sk", "Sm", "Zl", "Zp", "Zs"]   # 文字修饰符、数学符号、分隔符号
-                        or ord(char[0]) in range(0x370, 0x400)          # 希腊字母
-                    )
-                ):
-                    return True
-            return False
 
         ############################################################
         # A. 原文档解析
-        for child in ltpage:
-            if isinstance(child, LTChar):
-                cur_v = False
-                layout = self.layout[ltpage.pageid]
-                # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
-                h, w = layout.shape
-                # 读取当前字符在 layout 中的类别
-                cx, cy = np.clip(int(child.x0), 0, w - 1), np.clip(int(child.y0), 0, h - 1)
-                cls = layout[cy, cx]
-                # 锚定文档中 bullet 的位置
-                if child.get_text() == "•":
-                    cls = 0
-                # 判定当前字符是否属于公式
-                if (                                                                                        # 判定当前字符是否属于公式
-                    cls == 0                                                                                # 1. 类别为保留区域
-                    or (cls == xt_cls and len(sstk[-1].strip()) > 1 and child.size < pstk[-1].size * 0.79)  # 2. 角标字体，有 0.76 的角标和 0.799 的大写，这里用 0.79 取中，同时考虑首字母放大的情况
-                    or vflag(child.fontname, child.get_text())                                              # 3. 公式字体
-                    or (child.matrix[0] == 0 and child.matrix[3] == 0)                                      # 4. 垂直字体
-                ):
+        tick = time.perf_counter()
+        chars = getattr(ltpage, "chars", None)
+        if chars is None:   # 不是由 render_char 构建的页面，从 LTChar 重建
+            chars = PageChars.from_layout(ltpage)
+        chars.freeze()
+        others = [child for child in ltpage if not isinstance(child, LTChar)]
+        n = len(chars)
+        if n:
+            layout = self.layout[ltpage.pageid]
+            # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
+            h, w = layout.shape
+            # 读取整页字符在 layout 中的类别
+            cx = np.clip(chars.x0.astype(int), 0, w - 1)
+            cy = np.clip(chars.y0.astype(int), 0, h - 1)
+            clss = layout[cy, cx].tolist()
+            # 整页字符一次性判定公式字体/字符，以及垂直字体
+            vflags = self.classifier.classify_chars(chars).tolist()
+            verts = chars.vertical.tolist()
+        # 按列读取为 list，逐字符访问比 numpy 标量快
+        x0s, x1s = chars.x0.tolist(), chars.x1.tolist()
+        y0s, y1s = chars.y0.tolist(), chars.y1.tolist()
+        sizes, texts, seqs = chars.size.tolist(), chars.text, chars.seq.tolist()
+        cids, fidx = chars.cid.tolist(), chars.font.tolist()
+        oid = 0                         # 下一个待处理的非字符元素
+        for k in range(n + 1):
+            # 先处理在当前字符之前加入页面的线条和图表，保持原有的处理顺序
+            for child in others[oid:seqs[k] if k < n else len(others)]:
+                oid += 1
+                if isinstance(child, LTFigure):     # 图表
+                    pass
+                elif isinstance(child, LTLine):     # 线条
+                    layout = self.layout[ltpage.pageid]
+                    # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
+                    h, w = layout.shape
+                    # 读取当前线条在 layout 中的类别
+                    cx, cy = np.clip(int(child.x0), 0, w - 1), np.clip(int(child.y0), 0, h - 1)
+                    cls = layout[cy, cx]
+                    if vstk and cls == xt_cls:      # 公式线条
+                        vlstk.append(child)
+                    else:                           # 全局线条
+                        lstk.append(child)
+            if k == n:
+                break
+            text = texts[k]
+            cur_v = False
+            cls = clss[k]
+            # 锚定文档中 bullet 的位置
+            if text == "•":
+                cls = 0
+            # 判定当前字符是否属于公式
+            if (                                                                                        # 判定当前字符是否属于公式
+                cls == 0                                                                                # 1. 类别为保留区域
+                or (cls == xt_cls and len(sstk[-1].strip()) > 1 and sizes[k] < pstk[-1].size * 0.79)  # 2. 角标字体，有 0.76 的角标和 0.799 的大写，这里用 0.79 取中，同时考虑首字母放大的情况
+                or vflags[k]                                                                          # 3. 公式字体
+                or verts[k]                                                                           # 4. 垂直字体
+            ):
+                cur_v = True
+            # 判定括号组是否属于公式
+            if not cur_v:
+                if vstk and text == "(":
                     cur_v = True
-                # 判定括号组是否属于公式
-                if not cur_v:
-                    if vstk and child.get_text() == "(":
-                        cur_v = True
-                        vbkt += 1
-                    if vbkt and child.get_text() == ")":
-                        cur_v = True
-                        vbkt -= 1
-                if (                                                        # 判定当前公式是否结束
-                    not cur_v                                               # 1. 当前字符不属于公式
-                    or cls != xt_cls                                        # 2. 当前字符与前一个字符不属于同一段落
-                    # or (abs(child.x0 - xt.x0) > vmax and cls != 0)        # 3. 段落内换行，可能是一长串斜体的段落，也可能是段内分式换行，这里设个阈值进行区分
-                    # 禁止纯公式（代码）段落换行，直到文字开始再重开文字段落，保证只存在两种情况
-                    # A. 纯公式（代码）段落（锚定绝对位置）sstk[-1]=="" -> sstk[-1]=="{v*}"
-                    # B. 文字开头段落（排版相对位置）sstk[-1]!=""
-                    or (sstk[-1] != "" and abs(child.x0 - xt.x0) > vmax)    # 因为 cls==xt_cls==0 一定有 sstk[-1]==""，所以这里不需要再判定 cls!=0
-                ):
-                    if vstk:
-                        if (                                                # 根据公式右侧的文字修正公式的纵向偏移
-                            not cur_v                                       # 1. 当前字符不属于公式
-                            and cls == xt_cls                               # 2. 当前字符与前一个字符属于同一段落
-                            and child.x0 > max([vch.x0 for vch in vstk])    # 3. 当前字符在公式右侧
-                        ):
-                            vfix = vstk[0].y0 - child.y0
-                        if sstk[-1] == "":
-                            xt_cls = -1 # 禁止纯公式段落（sstk[-1]=="{v*}"）的后续连接，但是要考虑新字符和后续字符的连接，所以这里修改的是上个字符的类别
-                        sstk[-1] += f"{{v{len(var)}}}"
-                        var.append(vstk)
-                        varl.append(vlstk)
-                        varf.append(vfix)
-                        vstk = []
-                        vlstk = []
-                        vfix = 0
-                # 当前字符不属于公式或当前字符是公式的第一个字符
-                if not vstk:
-                    if cls == xt_cls:               # 当前字符与前一个字符属于同一段落
-                        if child.x0 > xt.x1 + 1:    # 添加行内空格
-                            sstk[-1] += " "
-                        elif child.x1 < xt.x0:      # 添加换行空格并标记原文段落存在换行
-                            sstk[-1] += " "
-                            pstk[-1].brk = True
-                    else:                           # 根据当前字符构建一个新的段落
-                        sstk.append("")
-                        pstk.append(Paragraph(child.y0, child.x0, child.x0, child.x0, child.y0, child.y1, child.size, False))
-                if not cur_v:                                               # 文字入栈
-                    if (                                                    # 根据当前字符修正段落属性
-                        child.size > pstk[-1].size                          # 1. 当前字符比段落字体大
-                        or len(sstk[-1].strip()) == 1                       # 2. 当前字符为段落第二个文字（考虑首字母放大的情况）
-                    ) and child.get_text() != " ":                          # 3. 当前字符不是空格
-                        pstk[-1].y -= child.size - pstk[-1].size            # 修正段落初始纵坐标，假设两个不同大小字符的上边界对齐
-                        pstk[-1].size = child.size
-                    sstk[-1] += child.get_text()
-                else:                                                       # 公式入栈
-                    if (                                                    # 根据公式左侧的文字修正公式的纵向偏移
-                        not vstk                                            # 1. 当前字符是公式的第一个字符
+                    vbkt += 1
+                if vbkt and text == ")":
+                    cur_v = True
+                    vbkt -= 1
+            if (                                                            # 判定当前公式是否结束
+                not cur_v                                                   # 1. 当前字符不属于公式
+                or cls != xt_cls                                            # 2. 当前字符与前一个字符不属于同一段落
+                # or (abs(x0s[k] - x0s[xt]) > vmax and cls != 0)          # 3. 段落内换行，可能是一长串斜体的段落，也可能是段内分式换行，这里设个阈值进行区分
+                # 禁止纯公式（代码）段落换行，直到文字开始再重开文字段落，保证只存在两种情况
+                # A. 纯公式（代码）段落（锚定绝对位置）sstk[-1]=="" -> sstk[-1]=="{v*}"
+                # B. 文字开头段落（排版相对位置）sstk[-1]!=""
+                or (sstk[-1] != "" and abs(x0s[k] - x0s[xt]) > vmax)      # 因为 cls==xt_cls==0 一定有 sstk[-1]==""，所以这里不需要再判定 cls!=0
+            ):
+                if vstk:
+                    if (                                                    # 根据公式右侧的文字修正公式的纵向偏移
+                        not cur_v                                           # 1. 当前字符不属于公式
                         and cls == xt_cls                                   # 2. 当前字符与前一个字符属于同一段落
-                        and child.x0 > xt.x0                                # 3. 前一个字符在公式左侧
+                        and x0s[k] > max([x0s[j] for j in vstk])      # 3. 当前字符在公式右侧
                     ):
-                        vfix = child.y0 - xt.y0
-                    vstk.append(child)
-                # 更新段落边界，因为段落内换行之后可能是公式开头，所以要在外边处理
-                pstk[-1].x0 = min(pstk[-1].x0, child.x0)
-                pstk[-1].x1 = max(pstk[-1].x1, child.x1)
-                pstk[-1].y0 = min(pstk[-1].y0, child.y0)
-                pstk[-1].y1 = max(pstk[-1].y1, child.y1)
-                # 更新上一个字符
-                xt = child
-                xt_cls = cls
-            elif isinstance(child, LTFigure):   # 图表
-                pass
-            elif isinstance(child, LTLine):     # 线条
-                layout = self.layout[ltpage.pageid]
-                # ltpage.height 可能是 fig 里面的高度，这里统一用 layout.shape
-                h, w = layout.shape
-                # 读取当前线条在 layout 中的类别
-                cx, cy = np.clip(int(child.x0), 0, w - 1), np.clip(int(child.y0), 0, h - 1)
-                cls = layout[cy, cx]
-                if vstk and cls == xt_cls:      # 公式线条
-                    vlstk.append(child)
-                else:                           # 全局线条
-                    lstk.append(child)
-            else:
-                pass
+                        vfix = y0s[vstk[0]] - y0s[k]
+                    if sstk[-1] == "":
+                        xt_cls = -1 # 禁止纯公式段落（sstk[-1]=="{v*}"）的后续连接，但是要考虑新字符和后续字符的连接，所以这里修改的是上个字符的类别
+                    sstk[-1] += f"{{v{len(var)}}}"
+                    var.append(vstk)
+                    varl.append(vlstk)
+                    varf.append(vfix)
+                    vstk = []
+                    vlstk = []
+                    vfix = 0
+            # 当前字符不属于公式或当前字符是公式的第一个字符
+            if not vstk:
+                if cls == xt_cls:                   # 当前字符与前一个字符属于同一段落
+                    if x0s[k] > x1s[xt] + 1:      # 添加行内空格
+                        sstk[-1] += " "
+                    elif x1s[k] < x0s[xt]:        # 添加换行空格并标记原文段落存在换行
+                        sstk[-1] += " "
+                        pstk[-1].brk = True
+                else:                               # 根据当前字符构建一个新的段落
+                    sstk.append("")
+                    pstk.append(Paragraph(y0s[k], x0s[k], x0s[k], x0s[k], y0s[k], y1s[k], sizes[k], False))
+            if not cur_v:                                               # 文字入栈
+                if (                                                    # 根据当前字符修正段落属性
+                    sizes[k] > pstk[-1].size                          # 1. 当前字符比段落字体大
+                    or len(sstk[-1].strip()) == 1                       # 2. 当前字符为段落第二个文字（考虑首字母放大的情况）
+                ) and text != " ":                                      # 3. 当前字符不是空格
+                    pstk[-1].y -= sizes[k] - pstk[-1].size            # 修正段落初始纵坐标，假设两个不同大小字符的上边界对齐
+                    pstk[-1].size = sizes[k]
+                sstk[-1] += text
+            else:                                                       # 公式入栈
+                if (                                                    # 根据公式左侧的文字修正公式的纵向偏移
+                    not vstk                                            # 1. 当前字符是公式的第一个字符
+                    and cls == xt_cls                                   # 2. 当前字符与前一个字符属于同一段落
+                    and x0s[k] > x0s[xt]                              # 3. 前一个字符在公式左侧
+                ):
+                    vfix = y0s[k] - y0s[xt]
+                vstk.append(k)
+            # 更新段落边界，因为段落内换行之后可能是公式开头，所以要在外边处理
+            pstk[-1].x0 = min(pstk[-1].x0, x0s[k])
+            pstk[-1].x1 = max(pstk[-1].x1, x1s[k])
+            pstk[-1].y0 = min(pstk[-1].y0, y0s[k])
+            pstk[-1].y1 = max(pstk[-1].y1, y1s[k])
+            # 更新上一个字符
+            xt = k
+            xt_cls = cls
         # 处理结尾
         if vstk:    # 公式出栈
             sstk[-1] += f"{{v{len(var)}}}"
@@ -343,41 +582,55 @@ class TranslateConverter(PDFConverterEx):
             varf.append(vfix)
         log.debug("\n==========[VSTACK]==========\n")
         for id, v in enumerate(var):  # 计算公式宽度
-            l = max([vch.x1 for vch in v]) - v[0].x0
-            log.debug(f'< {l:.1f} {v[0].x0:.1f} {v[0].y0:.1f} {v[0].cid} {v[0].fontname} {len(varl[id])} > v{id} = {"".join([ch.get_text() for ch in v])}')
+            l = max([x1s[j] for j in v]) - x0s[v[0]]
+            log.debug(f'< {l:.1f} {x0s[v[0]]:.1f} {y0s[v[0]]:.1f} {chars.cid[v[0]]} {chars.fontname(v[0])} {len(varl[id])} > v{id} = {"".join([texts[j] for j in v])}')
             vlen.append(l)
 
         ############################################################
         # B. 段落翻译
         log.debug("\n==========[SSTACK]==========\n")
+        tick = self.add_timing("parse", tick)
 
-        @retry(wait=wait_fixed(1))
         def worker(s: str):  # 多线程翻译
-            if not s.strip() or re.match(r"^\{v\d+\}$", s):  # 空白和公式不翻译
-                return s
             try:
-                new = self.translator.translate(s)
-                return new
-            except BaseException as e:
+                return self.retry_policy.call(self.translator.translate, s)
+            except RetryExhaustedError as e:  # 重试耗尽，保留原文
+                log.warning(f"Paragraph left untranslated: {e}")
+                with self.stats_lock:
+                    self.stats["failed"] += 1
+                record_usage(failed=1)
+                return self.retry_policy.marker + s
+            except BaseException as e:  # 不可重试的错误，终止整个文档
                 if log.isEnabledFor(logging.DEBUG):
                     log.exception(e)
                 else:
                     log.exception(e, exc_info=False)
                 raise e
+        fn = self.dry_run_worker if self.dry_run else worker
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.thread
         ) as executor:
-            news = list(executor.map(worker, sstk))
+            futures = [self.submit_paragraph(executor, fn, s) for s in sstk]
+            try:
+                news = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        tick = self.add_timing("translate", tick)
+        if self.dry_run:  # 试运行只统计段落，不排版
+            return b""
 
         ############################################################
         # C. 新文档排版
+
         def raw_string(fcur: str, cstk: str):  # 编码字符串
             if fcur == self.noto_name:
-                return "".join(["%04x" % self.noto.has_glyph(ord(c)) for c in cstk])
+                return hex_codes([self.noto.has_glyph(ord(c)) for c in cstk], True)
             elif isinstance(self.fontmap[fcur], PDFCIDFont):  # 判断编码长度
-                return "".join(["%04x" % ord(c) for c in cstk])
+                return hex_codes([ord(c) for c in cstk], True)
             else:
-                return "".join(["%02x" % ord(c) for c in cstk])
+                return hex_codes([ord(c) for c in cstk], False)
 
         # 根据目标语言获取默认行距
         LANG_LINEHEIGHT_MAP = {
@@ -386,13 +639,7 @@ class TranslateConverter(PDFConverterEx):
         }
         default_line_height = LANG_LINEHEIGHT_MAP.get(self.translator.lang_out.lower(), 1.1) # 小语种默认1.1
         _x, _y = 0, 0
-        ops_list = []
-
-        def gen_op_txt(font, size, x, y, rtxt):
-            return f"/{font} {size:f} Tf 1 0 0 1 {x:f} {y:f} Tm [<{rtxt}>] TJ "
-
-        def gen_op_line(x, y, xlen, ylen, linewidth):
-            return f"ET q 1 0 0 1 {x:f} {y:f} cm [] 0 d 0 J {linewidth:f} w 0 0 m {xlen:f} {ylen:f} l S Q BT "
+        writer = ContentStreamWriter()
 
         for id, new in enumerate(news):
             x: float = pstk[id].x                       # 段落初始横坐标
@@ -407,27 +654,25 @@ class TranslateConverter(PDFConverterEx):
             lidx = 0                                    # 记录换行次数
             tx = x
             fcur_ = fcur
-            ptr = 0
             log.debug(f"< {y} {x} {x0} {x1} {size} {brk} > {sstk[id]} | {new}")
 
             ops_vals: list[dict] = []
 
-            while ptr < len(new):
-                vy_regex = re.match(
-                    r"\{\s*v([\d\s]+)\}", new[ptr:], re.IGNORECASE
-                )  # 匹配 {vn} 公式标记
+            # 文字逐字符排版，公式标记整体排版
+            for item in chain.from_iterable(tokenize_placeholders(new)):
+                is_v = isinstance(item, int)
                 mod = 0  # 文字修饰符
-                if vy_regex:  # 加载公式
-                    ptr += len(vy_regex.group(0))
+                if is_v:  # 加载公式
+                    vid = item
                     try:
-                        vid = int(vy_regex.group(1).replace(" ", ""))
                         adv = vlen[vid]
-                    except Exception:
+                    except IndexError:
                         continue  # 翻译器可能会自动补个越界的公式标记
-                    if var[vid][-1].get_text() and unicodedata.category(var[vid][-1].get_text()[0]) in ["Lm", "Mn", "Sk"]:  # 文字修饰符
-                        mod = var[vid][-1].width
+                    vlast = var[vid][-1]
+                    if texts[vlast] and unicodedata.category(texts[vlast][0]) in ["Lm", "Mn", "Sk"]:  # 文字修饰符
+                        mod = x1s[vlast] - x0s[vlast]
                 else:  # 加载文字
-                    ch = new[ptr]
+                    ch = item
                     fcur_ = None
                     try:
                         if fcur_ is None and self.fontmap["tiro"].to_unichr(ord(ch)) == ch:
@@ -440,10 +685,9 @@ class TranslateConverter(PDFConverterEx):
                         adv = self.noto.char_lengths(ch, size)[0]
                     else:
                         adv = self.fontmap[fcur_].char_width(ord(ch)) * size
-                    ptr += 1
                 if (                                # 输出文字缓冲区
                     fcur_ != fcur                   # 1. 字体更新
-                    or vy_regex                     # 2. 插入公式
+                    or is_v                         # 2. 插入公式
                     or x + adv > x1 + 0.1 * size    # 3. 到达右边界（可能一整行都被符号化，这里需要考虑浮点误差）
                 ):
                     if cstk:
@@ -460,30 +704,32 @@ class TranslateConverter(PDFConverterEx):
                 if brk and x + adv > x1 + 0.1 * size:  # 到达右边界且原文段落存在换行
                     x = x0
                     lidx += 1
-                if vy_regex:  # 插入公式
+                if is_v:  # 插入公式
                     fix = 0
                     if fcur is not None:  # 段落内公式修正纵向偏移
                         fix = varf[vid]
-                    for vch in var[vid]:  # 排版公式字符
-                        vc = chr(vch.cid)
+                    v0 = var[vid][0]
+                    for j in var[vid]:  # 排版公式字符
+                        vc = chr(cids[j])
+                        vfont = self.fontid[chars.fonts[fidx[j]]]
                         ops_vals.append({
                             "type": OpType.TEXT,
-                            "font": self.fontid[vch.font],
-                            "size": vch.size,
-                            "x": x + vch.x0 - var[vid][0].x0,
-                            "dy": fix + vch.y0 - var[vid][0].y0,
-                            "rtxt": raw_string(self.fontid[vch.font], vc),
+                            "font": vfont,
+                            "size": sizes[j],
+                            "x": x + x0s[j] - x0s[v0],
+                            "dy": fix + y0s[j] - y0s[v0],
+                            "rtxt": raw_string(vfont, vc),
                             "lidx": lidx
                         })
                         if log.isEnabledFor(logging.DEBUG):
-                            lstk.append(LTLine(0.1, (_x, _y), (x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0)))
-                            _x, _y = x + vch.x0 - var[vid][0].x0, fix + y + vch.y0 - var[vid][0].y0
+                            lstk.append(LTLine(0.1, (_x, _y), (x + x0s[j] - x0s[v0], fix + y + y0s[j] - y0s[v0])))
+                            _x, _y = x + x0s[j] - x0s[v0], fix + y + y0s[j] - y0s[v0]
                     for l in varl[vid]:  # 排版公式线条
                         if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
                             ops_vals.append({
                                 "type": OpType.LINE,
-                                "x": l.pts[0][0] + x - var[vid][0].x0,
-                                "dy": l.pts[0][1] + fix - var[vid][0].y0,
+                                "x": l.pts[0][0] + x - x0s[v0],
+                                "dy": l.pts[0][1] + fix - y0s[v0],
                                 "linewidth": l.linewidth,
                                 "xlen": l.pts[1][0] - l.pts[0][0],
                                 "ylen": l.pts[1][1] - l.pts[0][1],
@@ -523,16 +769,75 @@ class TranslateConverter(PDFConverterEx):
 
             for vals in ops_vals:
                 if vals["type"] == OpType.TEXT:
-                    ops_list.append(gen_op_txt(vals["font"], vals["size"], vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["rtxt"]))
+                    writer.text(vals["font"], vals["size"], vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["rtxt"])
                 elif vals["type"] == OpType.LINE:
-                    ops_list.append(gen_op_line(vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["xlen"], vals["ylen"], vals["linewidth"]))
+                    writer.line(vals["x"], vals["dy"] + y - vals["lidx"] * size * line_height, vals["xlen"], vals["ylen"], vals["linewidth"])
 
         for l in lstk:  # 排版全局线条
             if l.linewidth < 5:  # hack 有的文档会用粗线条当图片背景
-                ops_list.append(gen_op_line(l.pts[0][0], l.pts[0][1], l.pts[1][0] - l.pts[0][0], l.pts[1][1] - l.pts[0][1], l.linewidth))
+                writer.line(l.pts[0][0], l.pts[0][1], l.pts[1][0] - l.pts[0][0], l.pts[1][1] - l.pts[0][1], l.linewidth)
 
-        ops = f"BT {''.join(ops_list)}ET "
-        return ops
+        self.add_timing("typeset", tick)
+        return writer.getvalue()
+
+
+# 匹配 {vn} 公式标记，翻译器可能会在标记内插入空格或改变大小写
+PLACEHOLDER_RE = re.compile(r"\{\s*v([\d\s]+)\}", re.IGNORECASE)
+
+
+def tokenize_placeholders(text: str):
+    """将译文切分为文字片段和公式标记
+
+    文字片段为 str，公式标记为只含公式序号的 tuple，无法解析的标记直接丢弃。
+    """
+    pos = 0
+    for m in PLACEHOLDER_RE.finditer(text):
+        if m.start() > pos:
+            yield text[pos:m.start()]
+        pos = m.end()
+        try:
+            yield (int(m.group(1).replace(" ", "")),)
+        except ValueError:
+            pass
+    if pos < len(text):
+        yield text[pos:]
+
+
+def hex_codes(codes: list[int], wide: bool) -> bytes:
+    """将字符编码转为十六进制字符串，wide 为双字节编码"""
+    try:
+        buf = array("H" if wide else "B", codes)
+    except OverflowError:  # 超出编码长度时按原样输出
+        fmt = "%04x" if wide else "%02x"
+        return "".join([fmt % c for c in codes]).encode()
+    if wide and sys.byteorder == "little":
+        buf.byteswap()
+    return buf.tobytes().hex().encode()
+
+
+class ContentStreamWriter:
+    """文字和线条指令流的二进制写入器
+
+    坐标统一保留三位小数，字体和字号未变化时不重复输出 Tf。
+    Tf 属于图形状态，线条指令中的 ET/BT 和 q/Q 不会改变它。
+    """
+
+    def __init__(self) -> None:
+        self.buf = bytearray(b"BT ")
+        self.font: str = None
+        self.size: float = None
+
+    def text(self, font: str, size: float, x: float, y: float, rtxt: bytes) -> None:
+        if font != self.font or size != self.size:
+            self.buf += b"/%s %.3f Tf " % (font.encode(), size)
+            self.font, self.size = font, size
+        self.buf += b"1 0 0 1 %.3f %.3f Tm [<%s>] TJ " % (x, y, rtxt)
+
+    def line(self, x: float, y: float, xlen: float, ylen: float, linewidth: float) -> None:
+        self.buf += b"ET q 1 0 0 1 %.3f %.3f cm [] 0 d 0 J %.3f w 0 0 m %.3f %.3f l S Q BT " % (x, y, linewidth, xlen, ylen)
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buf + b"ET ")
 
 
 class OpType(Enum):
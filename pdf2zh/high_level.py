@@ -1,11 +1,13 @@
 """Functions that can be used for the most common use-cases for pdf2zh.six"""
 
 import asyncio
+import functools
 import io
 import os
 import re
 import sys
 import tempfile
+import time
 import logging
 from asyncio import CancelledError
 from pathlib import Path
@@ -25,6 +27,8 @@ from pymupdf import Document, Font
 from pdf2zh.converter import TranslateConverter
 from pdf2zh.doclayout import OnnxModel
 from pdf2zh.pdfinterp import PDFPageInterpreterEx
+from pdf2zh.translator import BaseTranslator
+from pdf2zh.usage import UsageAccumulator, collect as collect_usage
 
 from pdf2zh.config import ConfigManager
 from babeldoc.assets.assets import get_font_and_metadata
@@ -67,6 +71,24 @@ def check_files(files: List[str]) -> List[str]:
     return missing_files
 
 
+def page_timings(device: TranslateConverter, layout: float) -> dict:
+    """Seconds spent so far in each stage: layout detection, parsing, translation, typesetting."""
+    timings = dict(device.timings, layout=layout)
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+
+def partial_mono(doc_zh: Document, obj_patch: dict, pages: list[int]) -> bytes:
+    """
+    Monolingual document of the pages finished so far, while translate_patch
+    is still running.
+    """
+    doc = Document(stream=doc_zh.write())
+    for obj_id, ops_new in list(obj_patch.items()):
+        doc.update_stream(obj_id, ops_new)
+    doc.select(sorted(pages))
+    return doc.write(deflate=True, garbage=3, use_objstms=1)
+
+
 def translate_patch(
     inf: BinaryIO,
     pages: Optional[list[int]] = None,
@@ -85,6 +107,9 @@ def translate_patch(
     envs: Dict = None,
     prompt: Template = None,
     ignore_cache: bool = False,
+    usage: UsageAccumulator = None,
+    dry_run: bool = False,
+    translator: BaseTranslator = None,
     **kwarg: Any,
 ) -> None:
     rsrcmgr = PDFResourceManager()
@@ -103,6 +128,8 @@ def translate_patch(
         envs,
         prompt,
         ignore_cache,
+        dry_run,
+        translator,
     )
 
     assert device is not None
@@ -115,16 +142,27 @@ def translate_patch(
 
     parser = PDFParser(inf)
     doc = PDFDocument(parser)
-    with tqdm.tqdm(total=total_pages) as progress:
+    start = time.monotonic()
+    layout_time = 0.0
+    done_pages = []  # 已完成排版的页面
+    with tqdm.tqdm(total=total_pages) as progress, collect_usage(usage) as usage:
+        progress.pages_done = done_pages  # hack 已完成的页面
+        # hack 按需生成已完成页面的单语 PDF
+        progress.partial = lambda: partial_mono(doc_zh, obj_patch, done_pages)
         for pageno, page in enumerate(PDFPage.create_pages(doc)):
             if cancellation_event and cancellation_event.is_set():
                 raise CancelledError("task cancelled")
             if pages and (pageno not in pages):
                 continue
             progress.update()
+            progress.stats = device.report()  # hack 插入翻译统计
+            progress.usage = usage.summary()  # hack 插入当前文档的用量
+            progress.timings = page_timings(device, layout_time)  # hack 各阶段耗时
+            progress.set_postfix(progress.stats, refresh=False)
             if callback:
                 callback(progress)
             page.pageno = pageno
+            tick = time.perf_counter()
             pix = doc_zh[page.pageno].get_pixmap()
             image = np.fromstring(pix.samples, np.uint8).reshape(
                 pix.height, pix.width, 3
@@ -155,14 +193,23 @@ def translate_patch(
                     )
                     box[y0:y1, x0:x1] = 0
             layout[page.pageno] = box
+            layout_time += time.perf_counter() - tick
             # 新建一个 xref 存放新指令流
             page.page_xref = doc_zh.get_new_xref()  # hack 插入页面的新 xref
             doc_zh.update_object(page.page_xref, "<<>>")
             doc_zh.update_stream(page.page_xref, b"")
             doc_zh[page.pageno].set_contents(page.page_xref)
             interpreter.process_page(page)
+            done_pages.append(page.pageno)
+        progress.stats = device.report()  # 最后一页处理完后的统计
+        progress.usage = usage.summary()
+        progress.timings = page_timings(device, layout_time)
+        progress.set_postfix(progress.stats)
 
     device.close()
+    if dry_run:  # 试运行返回估算结果
+        return device.estimate(elapsed=time.monotonic() - start)
+    logger.info(f"Translation usage: {usage.summary()}")
     return obj_patch
 
 
@@ -182,13 +229,17 @@ def translate_stream(
     prompt: Template = None,
     skip_subset_fonts: bool = False,
     ignore_cache: bool = False,
+    return_usage: bool = False,
+    dry_run: bool = False,
+    translator: BaseTranslator = None,
     **kwarg: Any,
 ):
     font_list = [("tiro", None)]
+    usage = UsageAccumulator()  # 通过 locals() 传给 translate_patch
 
     font_path = download_remote_fonts(lang_out.lower())
     noto_name = NOTO_NAME
-    noto = Font(noto_name, font_path)
+    noto = load_font(noto_name, font_path)
     font_list.append((noto_name, font_path))
 
     doc_en = Document(stream=stream)
@@ -229,16 +280,76 @@ def translate_stream(
     fp = io.BytesIO()
 
     doc_zh.save(fp)
+    if dry_run:  # 只解析段落并返回估算结果，不生成 PDF
+        return translate_patch(fp, **locals())
     obj_patch: dict = translate_patch(fp, **locals())
 
     for obj_id, ops_new in obj_patch.items():
         # ops_old=doc_en.xref_stream(obj_id)
         # print(obj_id)
         # print(ops_old)
-        # print(ops_new.encode())
-        doc_zh.update_stream(obj_id, ops_new.encode())
+        # print(ops_new)
+        doc_zh.update_stream(obj_id, ops_new)
 
     doc_en.insert_file(doc_zh)
+    for id in range(page_count):
+        doc_en.move_page(page_count + id, id * 2 + 1)
+    if not skip_subset_fonts:
+        doc_zh.subset_fonts(fallback=True)
+        doc_en.subset_fonts(fallback=True)
+    result = (
+        doc_zh.write(deflate=True, garbage=3, use_objstms=1),
+        doc_en.write(deflate=True, garbage=3, use_objstms=1),
+    )
+    if return_usage:
+        return result + (usage.summary(),)
+    return result
+
+
+def shard_pages(
+    page_count: int, shard_size: int, pages: Optional[list[int]] = None
+) -> list[list[int]]:
+    """
+    Split the pages to translate into consecutive shards of ``shard_size`` pages,
+    each of which can be passed as ``pages`` to translate_stream.
+    """
+    if pages is None:
+        pages = list(range(page_count))
+    pages = sorted(p for p in set(pages) if 0 <= p < page_count)
+    shard_size = max(shard_size, 1)
+    return [pages[i : i + shard_size] for i in range(0, len(pages), shard_size)]
+
+
+def extract_pages(stream: bytes, pages: list[int]) -> bytes:
+    """Keep only ``pages`` of a translated document, e.g. the pages of one shard."""
+    doc = Document(stream=stream)
+    doc.select(pages)
+    return doc.write(deflate=True, garbage=3, use_objstms=1)
+
+
+def merge_shards(
+    stream: bytes,
+    shards: list[tuple[list[int], bytes]],
+    skip_subset_fonts: bool = False,
+) -> tuple[bytes, bytes]:
+    """
+    Assemble the mono and dual documents from the translated pages of each shard.
+    :param stream: the source document
+    :param shards: (pages, document holding exactly those translated pages)
+    """
+    doc_en = Document(stream=stream)
+    page_count = doc_en.page_count
+    translated = {}
+    for pages, shard_stream in shards:
+        shard = Document(stream=shard_stream)
+        for index, pageno in enumerate(pages):
+            translated[pageno] = (shard, index)
+    doc_zh = Document()
+    for pageno in range(page_count):  # 未翻译的页面使用原文
+        src, index = translated.get(pageno, (doc_en, pageno))
+        doc_zh.insert_pdf(src, from_page=index, to_page=index)
+    # 与 translate_stream 相同的双语排列：原文页、译文页交替
+    doc_en.insert_pdf(doc_zh)
     for id in range(page_count):
         doc_en.move_page(page_count + id, id * 2 + 1)
     if not skip_subset_fonts:
@@ -317,6 +428,9 @@ def translate(
     prompt: Template = None,
     skip_subset_fonts: bool = False,
     ignore_cache: bool = False,
+    return_usage: bool = False,
+    dry_run: bool = False,
+    translator: BaseTranslator = None,
     **kwarg: Any,
 ):
     if not files:
@@ -380,7 +494,12 @@ def translate(
         except Exception as e:
             logger.warning(f"Failed to clean temp file {file_path}", exc_info=True)
 
-        s_mono, s_dual = translate_stream(
+        if dry_run:
+            estimate = translate_stream(s_raw, **locals())
+            result_files.append({"file": filename, **estimate})
+            continue
+
+        s_mono, s_dual, *file_usage = translate_stream(
             s_raw,
             **locals(),
         )
@@ -392,11 +511,17 @@ def translate(
         doc_dual.write(s_dual)
         doc_mono.close()
         doc_dual.close()
-        result_files.append((str(file_mono), str(file_dual)))
+        result_files.append((str(file_mono), str(file_dual), *file_usage))
 
     return result_files
 
 
+@functools.lru_cache(maxsize=None)
+def load_font(name: str, path: str) -> Font:
+    """Font used for glyph checks and widths, parsed once per process."""
+    return Font(name, path)
+
+
 def download_remote_fonts(lang: str):
     lang = lang.lower()
     LANG_NAME_MAP = {
@@ -6,6 +6,7 @@ output it to plain text, html, xml or tags.
 from __future__ import annotations
 
 import argparse
+import json
 import logging
 import sys
 from string import Template
@@ -105,7 +106,8 @@ def create_parser() -> argparse.ArgumentParser:
         "-t",
         type=int,
         default=4,
-        help="The number of threads to execute translation.",
+        help="The maximum number of concurrent translation requests. "
+        "Concurrency is lowered automatically when the service rate limits.",
     )
     parse_params.add_argument(
         "--interactive",
@@ -191,6 +193,11 @@ def create_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Ignore cache and force retranslation.",
     )
+    parse_params.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only extract the paragraphs and print the estimated tokens, cost and time as JSON.",
+    )
 
     parse_params.add_argument(
         "--mcp", action="store_true", help="Launch pdf2zh MCP server in STDIO mode"
@@ -286,6 +293,7 @@ def main(args: Optional[List[str]] = None) -> int:
     if parsed_args.flask:
         from pdf2zh.backend import flask_app
 
+        ConfigManager.snapshot()  # 服务端只读取配置，不写回 config.json
         flask_app.run(port=11008)
         return 0
 
@@ -317,16 +325,17 @@ def main(args: Optional[List[str]] = None) -> int:
         mcp.run()
         return 0
 
-    print(parsed_args)
+    if not parsed_args.dry_run:  # 试运行时 stdout 只输出 JSON
+        print(parsed_args)
     if parsed_args.babeldoc:
         return yadt_main(parsed_args)
     if parsed_args.dir:
         untranlate_file = find_all_files_in_directory(parsed_args.files[0])
         parsed_args.files = untranlate_file
-        translate(model=ModelInstance.value, **vars(parsed_args))
-        return 0
 
-    translate(model=ModelInstance.value, **vars(parsed_args))
+    result = translate(model=ModelInstance.value, **vars(parsed_args))
+    if parsed_args.dry_run:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
     return 0
 
 
@@ -1,7 +1,14 @@
 import os
 import json
+import re
+import threading
 from datetime import datetime, timezone
-from typing import Dict, Optional, Any
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Any
+
+
+# 日付付きモデル名の接尾辞: "-2024-08-06" や "-0613"
+VERSION_SUFFIX = re.compile(r"-(\d{4}-\d{2}-\d{2}|\d{4})$")
 
 
 class PriceScraper:
@@ -36,6 +43,12 @@ class PriceScraper:
         "plamo-1.0-instruct": {"input": 0.0, "output": 0.0},
         "o3": {"input": 0.0, "output": 0.0}
     }
+
+    # 価格表のモデル名と異なる名前で呼ばれるモデルの別名
+    MODEL_ALIASES = {
+        "chatgpt-4o-latest": "gpt-4o",
+        "gpt-4-turbo-preview": "gpt-4-turbo",
+    }
     
     def fetch_pricing(self) -> Optional[Dict[str, Dict[str, float]]]:
         """
@@ -63,6 +76,14 @@ class PriceData:
         
         # ディレクトリの作成
         os.makedirs(os.path.dirname(self.price_file), exist_ok=True)
+
+        # メモリ上の価格表（ファイルの更新時刻が変わった時だけ読み直す）
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._table: Mapping[str, Mapping[str, float]] = MappingProxyType({})
+        self._aliases: Dict[str, str] = {}
+        self._resolved: Dict[str, Optional[Mapping[str, float]]] = {}
+        self._reload()
     
     def save_prices(self, prices: Dict[str, Dict[str, float]]) -> None:
         """
@@ -107,7 +128,47 @@ class PriceData:
         """
         return False
     
-    def get_price(self, model_name: str) -> Optional[Dict[str, float]]:
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.price_file).st_mtime
+        except OSError:
+            return None
+
+    def _reload(self) -> None:
+        """デフォルト価格にファイルの価格を重ねた価格表を作り直します。"""
+        mtime = self._file_mtime()
+        data = self.load_prices() if mtime is not None else None
+        table = {
+            model: MappingProxyType(dict(price))
+            for model, price in PriceScraper.DEFAULT_PRICES.items()
+        }
+        aliases = dict(PriceScraper.MODEL_ALIASES)
+        if data:
+            for model, price in data.get("prices", {}).items():
+                table[model] = MappingProxyType(dict(price))
+            aliases.update(data.get("aliases", {}))
+        with self._lock:
+            self._mtime = mtime
+            self._table = MappingProxyType(table)
+            self._aliases = aliases
+            self._resolved = {}
+
+    def _lookup(self, model_name: str) -> Optional[Mapping[str, float]]:
+        """完全一致、別名、"provider/model" 形式、日付付きモデル名の順に探します。"""
+        table = self._table
+        name = self._aliases.get(model_name, model_name)
+        if name in table:
+            return table[name]
+        name = name.rsplit("/", 1)[-1]
+        name = self._aliases.get(name, name)
+        if name in table:
+            return table[name]
+        # gpt-4o-2024-08-06 -> gpt-4o のように、日付・バージョンの接尾辞だけを取り除く
+        # （gpt-4.1-nano や o3-mini は別モデルなので gpt-4.1 や o3 の価格は使わない）
+        name = VERSION_SUFFIX.sub("", name)
+        return table.get(name)
+
+    def get_price(self, model_name: str) -> Optional[Mapping[str, float]]:
         """
         特定モデルの価格情報を取得
         
@@ -115,13 +176,14 @@ class PriceData:
             model_name: モデル名
             
         Returns:
-            Dict[str, float]: input/outputの価格情報
+            Mapping[str, float]: input/outputの価格情報（変更不可）
         """
-        data = self.load_prices()
-        if data is None:
-            return None
-        
-        return data.get("prices", {}).get(model_name)
+        if self._file_mtime() != self._mtime:
+            self._reload()
+        resolved = self._resolved
+        if model_name not in resolved:
+            resolved[model_name] = self._lookup(model_name)
+        return resolved[model_name]
     
     def update_if_needed(self) -> bool:
         """
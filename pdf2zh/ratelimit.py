@@ -0,0 +1,371 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+import openai
+import requests
+
+from pdf2zh.config import ConfigManager
+from pdf2zh.usage import record as record_usage
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Read the Retry-After delay (seconds) from an HTTP error, if the client exposes it."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status code carried by an openai/requests/httpx error."""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_overload(exc: BaseException) -> bool:
+    """Whether the error means the provider wants us to slow down (429 or timeout)."""
+    if isinstance(
+        exc,
+        (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            requests.exceptions.Timeout,
+            httpx.TimeoutException,
+            TimeoutError,
+        ),
+    ):
+        return True
+    return status_code(exc) == 429
+
+
+class UntranslatableError(Exception):
+    """The service answered, but the output is unusable and a retry would repeat it."""
+
+
+class RetryExhaustedError(Exception):
+    """Raised by RetryPolicy.call when a retryable error outlived the policy."""
+
+    def __init__(self, attempts: int, last: BaseException):
+        super().__init__(f"gave up after {attempts} attempts: {last!r}")
+        self.attempts = attempts
+        self.last = last
+
+
+DEFAULT_MARKER = "[untranslated] "
+
+
+class RetryPolicy:
+    """Bounded retry with full-jitter exponential backoff and an overall deadline.
+
+    Timeouts, connection errors, 429 and 5xx are retried. Other 4xx (bad key,
+    bad request) and programming errors are fatal and raised at once; anything
+    else, including malformed replies (JSONDecodeError, missing keys), is
+    treated as transient and ends with the untranslated marker.
+    """
+
+    FATAL = (TypeError, AttributeError, NameError, NotImplementedError)
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        deadline: float = 120.0,
+        marker: str = DEFAULT_MARKER,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.marker = marker  # 放弃翻译的段落保留原文，并加上此前缀
+
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        """Read RETRY_MAX_ATTEMPTS, RETRY_DEADLINE and UNTRANSLATED_MARKER."""
+        policy = cls()
+        max_attempts = ConfigManager.get("RETRY_MAX_ATTEMPTS")
+        deadline = ConfigManager.get("RETRY_DEADLINE")
+        marker = ConfigManager.get("UNTRANSLATED_MARKER")
+        if max_attempts:
+            policy.max_attempts = max(1, int(max_attempts))
+        if deadline:
+            policy.deadline = float(deadline)
+        if marker is not None:  # 设为 "" 时不加前缀
+            policy.marker = marker
+        return policy
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        if is_overload(exc):
+            return True
+        code = status_code(exc)
+        if code is not None:
+            return code >= 500
+        return not isinstance(exc, self.FATAL)
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        """Seconds to sleep after the ``attempt``-th failure (1-based)."""
+        delay = retry_after(exc)
+        if delay is None:
+            delay = random.uniform(
+                0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            )
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn(*args, **kwargs)
+            except UntranslatableError as e:
+                raise RetryExhaustedError(attempt, e) from e
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                if attempt >= self.max_attempts:
+                    raise RetryExhaustedError(attempt, e) from e
+                delay = self.delay(attempt, e)
+                if time.monotonic() - start + delay > self.deadline:
+                    raise RetryExhaustedError(attempt, e) from e
+                logger.warning(
+                    f"Translation failed ({e!r}), retrying in {delay:.1f}s "
+                    f"(attempt {attempt}/{self.max_attempts})"
+                )
+                record_usage(retries=1)
+                time.sleep(delay)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limiter for in-flight translation requests.
+
+    The limit grows by one per round of successful requests while latency stays
+    within ``latency_tolerance`` of the best latency seen, and is multiplied by
+    ``backoff`` on 429s or timeouts. A Retry-After delay blocks new requests
+    until it has passed.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial_limit: Optional[int] = None,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.5,
+        window: int = 100,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(initial_limit or self.max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._min_latency: Optional[float] = None
+        self._latency: Optional[float] = None
+        self._outcomes = deque(maxlen=window)  # True for throttled requests
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait <= 0 and self.inflight < int(self.limit):
+                    self.inflight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(
+        self, latency: Optional[float] = None, error: Optional[BaseException] = None
+    ) -> None:
+        with self._cond:
+            self.inflight -= 1
+            if error is not None and is_overload(error):
+                self._overload(retry_after(error))
+            elif error is None and latency is not None:
+                self._success(latency)
+            self._cond.notify_all()
+
+    def raise_max_limit(self, max_limit: int) -> None:
+        """Allow up to ``max_limit`` requests, e.g. for a document with more threads."""
+        with self._cond:
+            if max_limit > self.max_limit:
+                self.max_limit = max_limit
+                self._cond.notify_all()
+
+    def _success(self, latency: float) -> None:
+        self._outcomes.append(False)
+        self._latency = (
+            latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        )
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+        if latency <= self._min_latency * self.latency_tolerance:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _overload(self, delay: Optional[float]) -> None:
+        self._outcomes.append(True)
+        now = time.monotonic()
+        if delay:
+            self._blocked_until = max(self._blocked_until, now + delay)
+        # requests already in flight report the same congestion, decrease once per round trip
+        if now - self._last_decrease >= (self._latency or 1.0):
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._last_decrease = now
+            logger.info(f"Rate limited, reducing concurrency to {int(self.limit)}")
+
+    def state(self) -> dict:
+        with self._cond:
+            outcomes = list(self._outcomes)
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "throttle_rate": (
+                round(sum(outcomes) / len(outcomes), 3) if outcomes else 0.0
+            ),
+        }
+
+
+def estimate_tokens(text: str, include_output: bool = True) -> int:
+    """Rough token count of a request for ``text``: prompt plus a similar-sized answer.
+
+    With ``include_output=False`` only the tokens of ``text`` itself are counted.
+    """
+    tokens = max(1, len(text.encode("utf-8")) // 4)
+    return 2 * tokens if include_output else tokens
+
+
+def default_bucket_path() -> str:
+    cache_folder = os.path.join(os.path.expanduser("~"), ".cache", "pdf2zh")
+    os.makedirs(cache_folder, exist_ok=True)
+    return os.path.join(cache_folder, "ratelimit.v1.db")
+
+
+class TokenBucket:
+    """Token bucket stored in SQLite so that every process on the host shares it.
+
+    ``rate`` tokens are added per second up to ``capacity``. Each take is a single
+    ``BEGIN IMMEDIATE`` transaction, which serializes concurrent writers.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        rate: float,
+        capacity: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.path = path or default_bucket_path()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bucket"
+                " (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=wal")
+            self._local.conn = conn
+        return conn
+
+    def try_take(self, amount: float) -> float:
+        """Take ``amount`` tokens. Returns 0 on success, else the seconds to wait."""
+        amount = min(amount, self.capacity)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated FROM bucket WHERE key = ?", (self.key,)
+            ).fetchone()
+            if row is None:
+                tokens = self.capacity
+            else:
+                elapsed = max(0.0, now - row[1])
+                tokens = min(self.capacity, row[0] + elapsed * self.rate)
+            wait = 0.0 if tokens >= amount else (amount - tokens) / self.rate
+            if not wait:
+                tokens -= amount
+            conn.execute(
+                "INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)",
+                (self.key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def take(self, amount: float = 1) -> None:
+        """Block until ``amount`` tokens are available and take them."""
+        while True:
+            wait = self.try_take(amount)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class RateBudget:
+    """Requests-per-second and tokens-per-minute budget of one service."""
+
+    def __init__(
+        self, qps: Optional[TokenBucket] = None, tpm: Optional[TokenBucket] = None
+    ):
+        self.qps = qps
+        self.tpm = tpm
+
+    @classmethod
+    def from_config(
+        cls, name: str, path: Optional[str] = None
+    ) -> Optional["RateBudget"]:
+        """Read ``<NAME>_QPS`` and ``<NAME>_TPM`` from the config, None if neither is set."""
+        prefix = name.upper().replace("-", "_")
+        qps = ConfigManager.get(f"{prefix}_QPS")
+        tpm = ConfigManager.get(f"{prefix}_TPM")
+        if not qps and not tpm:
+            return None
+        return cls(
+            TokenBucket(f"{name}:qps", float(qps), path=path) if qps else None,
+            (
+                TokenBucket(f"{name}:tpm", float(tpm) / 60, float(tpm), path=path)
+                if tpm
+                else None
+            ),
+        )
+
+    def acquire(self, tokens: int) -> None:
+        if self.tpm is not None:
+            self.tpm.take(tokens)
+        if self.qps is not None:
+            self.qps.take(1)
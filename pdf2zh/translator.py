@@ -3,14 +3,16 @@ import json
 import logging
 import os
 import re
+import threading
+import time
 import unicodedata
 from copy import copy
 from string import Template
+from types import SimpleNamespace
 from typing import cast
 import deepl
 import ollama
 import openai
-import requests
 import xinference_client
 from azure.ai.translation.text import TextTranslationClient
 from azure.core.credentials import AzureKeyCredential
@@ -21,18 +23,156 @@ from tencentcloud.tmt.v20180321.models import (
 )
 from tencentcloud.tmt.v20180321.tmt_client import TmtClient
 
+from pdf2zh.batching import MicroBatcher
 from pdf2zh.cache import TranslationCache
 from pdf2zh.config import ConfigManager
 
+from pdf2zh.ratelimit import (
+    RateBudget,
+    UntranslatableError,
+    estimate_tokens,
+)
+from pdf2zh.transport import get_session
+from pdf2zh.usage import record as record_usage
 from pdf2zh.usage_logger import log_usage, check_daily_limit
 
 
-from tenacity import retry, retry_if_exception_type
-from tenacity import stop_after_attempt
-from tenacity import wait_exponential
+logger = logging.getLogger(__name__)
 
 
-logger = logging.getLogger(__name__)
+class StreamAbortedError(UntranslatableError):
+    """A streamed generation was cut off because its output was not a translation."""
+
+
+class StreamGuard:
+    """
+    Consume streamed LLM output incrementally, cancelling runaway generations
+    and recording time to first token. Enabled by LLM_STREAM in the config.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_ratio: float = 5.0,
+        min_length: int = 200,
+        allow_think: bool = True,
+    ):
+        self.enabled = enabled
+        self.max_ratio = max_ratio  # 输出长度超过输入的倍数时中止
+        self.min_length = min_length  # 短输入的最小输出长度上限
+        self.allow_think = allow_think  # 为 False 时出现 <think> 立即中止
+        self._lock = threading.Lock()
+        self._ttft_total = 0.0
+        self._streams = 0
+        self._aborted = 0
+
+    @classmethod
+    def from_config(cls) -> "StreamGuard":
+        def flag(value, default):
+            if value is None or value == "":
+                return default
+            return str(value).lower() in ("1", "true", "yes")
+
+        guard = cls(enabled=flag(ConfigManager.get("LLM_STREAM"), False))
+        guard.allow_think = flag(ConfigManager.get("LLM_ALLOW_THINK"), True)
+        if max_ratio := ConfigManager.get("LLM_STREAM_MAX_RATIO"):
+            guard.max_ratio = float(max_ratio)
+        return guard
+
+    def consume(self, stream, delta, text: str, start: float) -> str:
+        """
+        Join the text deltas of a stream.
+        :param stream: iterable of chunks, closed when the generation is aborted
+        :param delta: function returning the text of a chunk, or None
+        :param text: source text, used to bound the output length
+        :param start: time.monotonic() before the request was sent
+        :return: generated text
+        """
+        limit = max(self.min_length, len(text) * self.max_ratio)
+        parts = []
+        length = 0
+        checked_think = self.allow_think
+        try:
+            for chunk in stream:
+                piece = delta(chunk)
+                if not piece:
+                    continue
+                if not parts:
+                    with self._lock:
+                        self._streams += 1
+                        self._ttft_total += time.monotonic() - start
+                parts.append(piece)
+                length += len(piece)
+                if not checked_think:
+                    head = "".join(parts).lstrip()
+                    if head.startswith("<think>"):
+                        self._abort("thinking output while thinking is disabled")
+                    checked_think = len(head) >= len("<think>")
+                if length > limit:
+                    self._abort(
+                        f"output exceeded {limit:.0f} characters for a "
+                        f"{len(text)} character input"
+                    )
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()  # 关闭连接，服务端随之停止生成
+        return "".join(parts)
+
+    def _abort(self, reason: str):
+        with self._lock:
+            self._aborted += 1
+        raise StreamAbortedError(reason)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "ttft": round(self._ttft_total / self._streams, 3)
+                if self._streams
+                else 0.0,
+                "aborted": self._aborted,
+            }
+
+
+def load_glossary() -> dict[str, str]:
+    """
+    GLOSSARY from the config, either a {term: translation} object or
+    "term=translation" lines.
+    """
+    glossary = ConfigManager.get("GLOSSARY")
+    if not glossary:
+        return {}
+    if isinstance(glossary, dict):
+        return {str(k): str(v) for k, v in glossary.items()}
+    terms = {}
+    for line in str(glossary).splitlines():
+        if "=" in line:
+            k, v = line.split("=", 1)
+            terms[k.strip()] = v.strip()
+    return terms
+
+
+def cached_tokens(usage) -> int:
+    """Prompt tokens served from the provider's prompt cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None)
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)  # DeepSeek
+    return cached if isinstance(cached, int) else 0
+
+
+def log_response_usage(model: str, usage, start: float):
+    """Log the usage of an OpenAI-style completion; streamed responses may carry none."""
+    if usage is None:
+        return
+    log_usage(
+        usage.prompt_tokens + usage.completion_tokens,
+        model=model,
+        input_tokens=usage.prompt_tokens,
+        output_tokens=usage.completion_tokens,
+        cached_tokens=cached_tokens(usage),
+        elapsed=time.monotonic() - start,
+    )
 
 
 def remove_control_characters(s):
@@ -52,6 +192,10 @@ class BaseTranslator:
         self.lang_out = lang_out
         self.model = model
         self.ignore_cache = ignore_cache
+        self.limiter = None  # AdaptiveConcurrencyLimiter, set by the converter
+        self.stream_guard: StreamGuard | None = None  # set by streaming translators
+        self.glossary: dict[str, str] = {}  # 术语表，放在 system_prompt 中
+        self.budget = RateBudget.from_config(self.name)
 
         self.cache = TranslationCache(
             self.name,
@@ -67,18 +211,21 @@ class BaseTranslator:
         # Cannot use self.envs = copy(self.__class__.envs)
         # because if set_envs called twice, the second call will override the first call
         self.envs = copy(self.envs)
-        if ConfigManager.get_translator_by_name(self.name):
-            self.envs = ConfigManager.get_translator_by_name(self.name)
+        saved = ConfigManager.get_translator_by_name(self.name)
+        if saved:
+            # 复制一份，避免修改配置中的 dict
+            self.envs = copy(saved)
         needUpdate = False
         for key in self.envs:
             if key in os.environ:
                 self.envs[key] = os.environ[key]
                 needUpdate = True
-        if needUpdate:
-            ConfigManager.set_translator_by_name(self.name, self.envs)
         if envs is not None:
             for key in envs:
                 self.envs[key] = envs[key]
+            needUpdate = True
+        # 只在内容有变化时写回配置文件
+        if needUpdate and self.envs != saved:
             ConfigManager.set_translator_by_name(self.name, self.envs)
 
     def add_cache_impact_parameters(self, k: str, v):
@@ -98,12 +245,68 @@ class BaseTranslator:
         if not (self.ignore_cache or ignore_cache):
             cache = self.cache.get(text)
             if cache is not None:
+                record_usage(cache_hits=1)
                 return cache
 
-        translation = self.do_translate(text)
+        if self.budget is not None:
+            self.budget.acquire(estimate_tokens(text))
+        translation = self.call_service(self.do_translate, text)
         self.cache.set(text, translation)
         return translation
 
+    def call_service(self, fn, *args):
+        """
+        Call the service through the concurrency limiter, if one is set, and
+        count the request and its duration in the usage of the current run.
+        :param fn: do_translate or do_translate_batch
+        """
+        record_usage(requests=1)
+        limiter = self.limiter  # 释放时必须归还给获取时的 limiter
+        if limiter is not None:
+            limiter.acquire()
+        start = time.monotonic()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if limiter is not None:
+                limiter.release(error=e)
+            raise
+        finally:
+            record_usage(service_time=time.monotonic() - start)
+        if limiter is not None:
+            limiter.release(latency=time.monotonic() - start)
+        return result
+
+    def translate_batch(
+        self, texts: list[str], ignore_cache: bool = False
+    ) -> list[str]:
+        """
+        Translate several texts at once, only the uncached ones reach the service.
+        For library callers: the converter translates paragraph by paragraph, and
+        services that gain from batching group those calls with a MicroBatcher.
+        :param texts: texts to translate
+        :return: translated texts, in the same order
+        """
+        results: list[str | None] = [None] * len(texts)
+        misses: dict[str, list[int]] = {}
+        for i, text in enumerate(texts):
+            if not (self.ignore_cache or ignore_cache):
+                results[i] = self.cache.get(text)
+            if results[i] is None:
+                misses.setdefault(text, []).append(i)
+            else:
+                record_usage(cache_hits=1)
+        if misses:
+            pending = list(misses)
+            if self.budget is not None:
+                self.budget.acquire(sum(estimate_tokens(text) for text in pending))
+            translations = self.call_service(self.do_translate_batch, pending)
+            for text, translation in zip(pending, translations):
+                self.cache.set(text, translation)
+                for i in misses[text]:
+                    results[i] = translation
+        return results
+
     def do_translate(self, text: str) -> str:
         """
         Actual translate text, override this method
@@ -112,6 +315,15 @@ class BaseTranslator:
         """
         raise NotImplementedError
 
+    def do_translate_batch(self, texts: list[str]) -> list[str]:
+        """
+        Actual translate several texts, override this method if the service
+        has a batch API
+        :param texts: texts to translate
+        :return: translated texts
+        """
+        return [self.do_translate(text) for text in texts]
+
     def prompt(
         self, text: str, prompt_template: Template | None = None
     ) -> list[dict[str, str]]:
@@ -151,6 +363,72 @@ class BaseTranslator:
             },
         ]
 
+    def system_prompt(self) -> str:
+        """Instructions that do not depend on the text, sent as a stable prefix."""
+        prompt = (
+            "You are a professional, authentic machine translation engine. "
+            "Only Output the translated text, do not include any other text."
+            "\n\n"
+            f"Translate the markdown source text from the user to {self.lang_out}. "
+            "Keep the formula notation {v*} unchanged. "
+            "Output translation directly without any additional text."
+        )
+        if self.glossary:
+            terms = "\n".join(f"{k} -> {v}" for k, v in sorted(self.glossary.items()))
+            prompt += f"\n\nUse these translations for the following terms:\n{terms}"
+        return prompt
+
+    def split_prompt(
+        self, text: str, prompt_template: Template | None = None
+    ) -> list[dict[str, str]]:
+        """
+        Same request as prompt(), but with the instructions in a system message
+        that is identical for every paragraph, so servers can reuse its prompt cache.
+        A custom prompt template decides where the text goes, so it is kept as is.
+        """
+        if prompt_template is not None:
+            return self.prompt(text, prompt_template)
+        return [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": text},
+        ]
+
+    def batch_prompt(self, texts: list[str]) -> list[dict[str, str]]:
+        """Prompt translating several paragraphs in one request, see parse_batch()."""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are a professional, authentic machine translation engine. "
+                    "Translate each string of the JSON array from the user "
+                    f"to {self.lang_out}. "
+                    "Keep the formula notation {v*} unchanged. "
+                    'Answer with a JSON object {"translations": [...]} holding '
+                    "the translated strings in the same order."
+                ),
+            },
+            {"role": "user", "content": json.dumps(texts, ensure_ascii=False)},
+        ]
+
+    @staticmethod
+    def parse_batch(content: str, n: int) -> list[str] | None:
+        """Translations from a batch_prompt() answer, None if it is malformed."""
+        content = re.sub(r"^<think>.+?</think>", "", content, count=1, flags=re.DOTALL)
+        content = re.sub(r"^\s*```(?:json)?|```\s*$", "", content.strip())
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return None
+        if isinstance(data, dict):
+            data = data.get("translations")
+        if (
+            not isinstance(data, list)
+            or len(data) != n
+            or not all(isinstance(x, str) for x in data)
+        ):
+            return None
+        return [x.strip() for x in data]
+
     def __str__(self):
         return f"{self.name} {self.lang_in} {self.lang_out} {self.model}"
 
@@ -172,7 +450,7 @@ class GoogleTranslator(BaseTranslator):
 
     def __init__(self, lang_in, lang_out, model, ignore_cache=False, **kwargs):
         super().__init__(lang_in, lang_out, model, ignore_cache)
-        self.session = requests.Session()
+        self.session = get_session(self.name)
         self.endpoint = "https://translate.google.com/m"
         self.headers = {
             "User-Agent": "Mozilla/4.0 (compatible;MSIE 6.0;Windows NT 5.1;SV1;.NET CLR 1.1.4322;.NET CLR 2.0.50727;.NET CLR 3.0.04506.30)"  # noqa: E501
@@ -200,19 +478,23 @@ class BingTranslator(BaseTranslator):
     # https://github.com/immersive-translate/old-immersive-translate/blob/6df13da22664bea2f51efe5db64c63aca59c4e79/src/background/translationService.js
     name = "bing"
     lang_map = {"zh": "zh-Hans"}
+    sid_ttl = 600  # seconds, well within the page token's one-hour lifetime
 
     def __init__(self, lang_in, lang_out, model, ignore_cache=False, **kwargs):
         super().__init__(lang_in, lang_out, model, ignore_cache)
-        self.session = requests.Session()
+        self.session = get_session(self.name)
         self.endpoint = "https://www.bing.com/translator"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36 Edg/131.0.0.0",  # noqa: E501
         }
+        self._sid = None
+        self._sid_expires = 0.0
+        self._sid_lock = threading.Lock()
 
     def find_sid(self):
         response = self.session.get(self.endpoint)
         response.raise_for_status()
-        url = response.url[:-10]
+        url = str(response.url)[:-10]
         ig = re.findall(r"\"ig\":\"(.*?)\"", response.text)[0]
         iid = re.findall(r"data-iid=\"(.*?)\"", response.text)[-1]
         key, token = re.findall(
@@ -220,10 +502,41 @@ class BingTranslator(BaseTranslator):
         )[0]
         return url, ig, iid, key, token
 
-    def do_translate(self, text):
-        text = text[:1000]  # bing translate max length
-        url, ig, iid, key, token = self.find_sid()
-        response = self.session.post(
+    def get_sid(self, stale=None):
+        """
+        Cached session parameters, scraped again after sid_ttl.
+        :param stale: parameters rejected by the server, refreshed unless another
+            thread already replaced them
+        """
+        sid = self._sid
+        if self.sid_valid(sid, stale):
+            return sid  # 有效时不加锁，抓取页面期间其他线程不被阻塞
+        with self._sid_lock:  # 只由一个线程重新抓取，其余线程等待并复用结果
+            if not self.sid_valid(self._sid, stale):
+                self._sid = self.find_sid()
+                self._sid_expires = time.monotonic() + self.sid_ttl
+            return self._sid
+
+    def sid_valid(self, sid, stale) -> bool:
+        return (
+            sid is not None
+            and sid is not stale
+            and time.monotonic() < self._sid_expires
+        )
+
+    @staticmethod
+    def sid_rejected(response) -> bool:
+        # 令牌失效时返回 401/205，或者返回 {"statusCode": ...} 而不是翻译列表
+        if response.status_code in (205, 401, 403):
+            return True
+        try:
+            return isinstance(response.json(), dict)
+        except ValueError:
+            return False
+
+    def post_translate(self, sid, text):
+        url, ig, iid, key, token = sid
+        return self.session.post(
             f"{url}ttranslatev3?IG={ig}&IID={iid}",
             data={
                 "fromLang": self.lang_in,
@@ -234,6 +547,13 @@ class BingTranslator(BaseTranslator):
             },
             headers=self.headers,
         )
+
+    def do_translate(self, text):
+        text = text[:1000]  # bing translate max length
+        sid = self.get_sid()
+        response = self.post_translate(sid, text)
+        if self.sid_rejected(response):
+            response = self.post_translate(self.get_sid(stale=sid), text)
         response.raise_for_status()
         return response.json()[0]["translations"][0]["text"]
 
@@ -276,7 +596,7 @@ class DeepLXTranslator(BaseTranslator):
         self.set_envs(envs)
         super().__init__(lang_in, lang_out, model, ignore_cache)
         self.endpoint = self.envs["DEEPLX_ENDPOINT"]
-        self.session = requests.Session()
+        self.session = get_session(self.name)
         auth_key = self.envs["DEEPLX_ACCESS_TOKEN"]
         if auth_key:
             self.endpoint = f"{self.endpoint}?token={auth_key}"
@@ -323,19 +643,87 @@ class OllamaTranslator(BaseTranslator):
         self.client = ollama.Client(host=self.envs["OLLAMA_HOST"])
         self.prompt_template = prompt
         self.add_cache_impact_parameters("temperature", self.options["temperature"])
+        self.stream_guard = StreamGuard.from_config()
+        # 模型常驻时间，例如 "30m"、-1（一直驻留），未设置时使用服务端默认值
+        self.keep_alive = ConfigManager.get("OLLAMA_KEEP_ALIVE")
+        # 指令放在固定的 system 消息里，服务端可以复用 prompt 缓存
+        self.system_prompt_mode = str(
+            ConfigManager.get("OLLAMA_SYSTEM_PROMPT") or ""
+        ).lower() in ("1", "true", "yes")
+        if self.system_prompt_mode:
+            self.add_cache_impact_parameters("system_prompt", True)
+        # 每个请求合并翻译的段落数
+        self.batch_size = int(ConfigManager.get("OLLAMA_BATCH_SIZE") or 1)
+        self.batcher = None
+        if self.batch_size > 1:
+            self.add_cache_impact_parameters("batch", True)
+            self.batcher = MicroBatcher(self.do_translate_batch, self.batch_size)
+
+    def chat(self, messages, num_predict: int, **kwargs):
+        # 每个请求单独的 options，不修改共享的 self.options
+        options = dict(
+            self.options, num_predict=max(self.options["num_predict"], num_predict)
+        )
+        if self.keep_alive is not None and self.keep_alive != "":
+            try:
+                kwargs["keep_alive"] = float(self.keep_alive)
+            except ValueError:
+                kwargs["keep_alive"] = self.keep_alive
+        response = self.client.chat(
+            model=self.model, messages=messages, options=options, **kwargs
+        )
+        if not kwargs.get("stream"):  # 流式响应的用量在最后一个 chunk 中统计
+            self.record_chat_usage(response)
+        return response
+
+    @staticmethod
+    def record_chat_usage(response):
+        record_usage(
+            input_tokens=getattr(response, "prompt_eval_count", 0) or 0,
+            output_tokens=getattr(response, "eval_count", 0) or 0,
+        )
+
+    @classmethod
+    def stream_delta(cls, chunk):
+        if getattr(chunk, "done", False):  # 最后一个 chunk 带有整个请求的用量
+            cls.record_chat_usage(chunk)
+        return chunk.message.content
 
     def do_translate(self, text: str) -> str:
-        if (max_token := len(text) * 5) > self.options["num_predict"]:
-            self.options["num_predict"] = max_token
+        if self.batcher is not None:
+            return self.batcher(text)
+        return self.translate_one(text)
 
-        response = self.client.chat(
-            model=self.model,
-            messages=self.prompt(text, self.prompt_template),
-            options=self.options,
-        )
-        content = self._remove_cot_content(response.message.content or "")
+    def translate_one(self, text: str) -> str:
+        if self.system_prompt_mode:
+            messages = self.split_prompt(text, self.prompt_template)
+        else:
+            messages = self.prompt(text, self.prompt_template)
+
+        if self.stream_guard.enabled:
+            start = time.monotonic()
+            stream = self.chat(messages, len(text) * 5, stream=True)
+            content = self.stream_guard.consume(stream, self.stream_delta, text, start)
+        else:
+            response = self.chat(messages, len(text) * 5)
+            content = response.message.content or ""
+        content = self._remove_cot_content(content)
         return content.strip()
 
+    def do_translate_batch(self, texts: list[str]) -> list[str]:
+        if len(texts) == 1:
+            return [self.translate_one(texts[0])]
+        response = self.chat(
+            self.batch_prompt(texts),
+            sum(len(text) for text in texts) * 5,
+            format="json",
+        )
+        translations = self.parse_batch(response.message.content or "", len(texts))
+        if translations is None:  # 模型没有按格式回答，逐段重新翻译
+            logger.warning("Malformed batch response, translating one by one")
+            return [self.translate_one(text) for text in texts]
+        return translations
+
     @staticmethod
     def _remove_cot_content(content: str) -> str:
         """Remove text content with the thought chain from the chat response
@@ -376,15 +764,22 @@ class XinferenceTranslator(BaseTranslator):
                 xf_prompt = [
                     {
                         "role": "user",
-                        "content": xf_prompt[0]["content"]
-                        + "\n"
-                        + xf_prompt[1]["content"],
+                        "content": "\n".join(
+                            message["content"] for message in xf_prompt
+                        ),
                     }
                 ]
                 response = xf_model.chat(
                     generate_config=self.options,
                     messages=xf_prompt,
                 )
+                usage = response.get("usage") or {}  # 本地模型只统计 token，不计费
+                details = usage.get("prompt_tokens_details") or {}
+                record_usage(
+                    input_tokens=usage.get("prompt_tokens") or 0,
+                    output_tokens=usage.get("completion_tokens") or 0,
+                    cached_tokens=details.get("cached_tokens") or 0,
+                )
 
                 response = response["choices"][0]["message"]["content"].replace(
                     "<end_of_turn>", ""
@@ -406,6 +801,7 @@ class OpenAITranslator(BaseTranslator):
         "OPENAI_MODEL": "gpt-4o-mini",
     }
     CustomPrompt = True
+    stream_usage_warned = False  # 流式响应没有用量时只警告一次
 
     def __init__(
         self,
@@ -426,50 +822,72 @@ class OpenAITranslator(BaseTranslator):
         self.client = openai.OpenAI(
             base_url=base_url or self.envs["OPENAI_BASE_URL"],
             api_key=api_key or self.envs["OPENAI_API_KEY"],
+            max_retries=0,  # 重试和限流由 call_service 统一处理
         )
         self.prompttext = prompt
+        self.glossary = load_glossary()
         self.add_cache_impact_parameters("temperature", self.options["temperature"])
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
         think_filter_regex = r"^<think>.+?\n*(</think>|\n)*(</think>)\n*"
         self.add_cache_impact_parameters("think_filter_regex", think_filter_regex)
         self.think_filter_regex = re.compile(think_filter_regex, flags=re.DOTALL)
+        self.stream_guard = StreamGuard.from_config()
 
-    @retry(
-        retry=retry_if_exception_type(openai.RateLimitError),
-        stop=stop_after_attempt(100),
-        wait=wait_exponential(multiplier=1, min=1, max=15),
-        before_sleep=lambda retry_state: logger.warning(
-            f"RateLimitError, retrying in {retry_state.next_action.sleep} seconds... "
-            f"(Attempt {retry_state.attempt_number}/100)"
-        ),
-    )
     def do_translate(self, text) -> str:
         check_daily_limit()
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            **self.options,
-            messages=self.prompt(text, self.prompttext),
-        )
-        if not response.choices:
-            if hasattr(response, "error"):
-                raise ValueError("Error response from Service", response.error)
-        content = response.choices[0].message.content.strip()
-        content = self.think_filter_regex.sub("", content).strip()
-
-        input_tokens_used = response.usage.prompt_tokens
-        output_tokens_used = response.usage.completion_tokens
-        tokens_used = input_tokens_used + output_tokens_used
-        
+        start = time.monotonic()
+        if self.stream_guard.enabled:
+            content, usage = self.do_translate_stream(text)
+        else:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                **self.options,
+                messages=self.split_prompt(text, self.prompttext),
+            )
+            if not response.choices:
+                if hasattr(response, "error"):
+                    raise ValueError("Error response from Service", response.error)
+            content = response.choices[0].message.content
+            usage = response.usage
+        content = self.think_filter_regex.sub("", content.strip()).strip()
         # 動的な価格計算を使用
-        log_usage(
-            tokens_used,
+        log_response_usage(self.model, usage, start)
+        return content
+
+    def do_translate_stream(self, text):
+        """Streamed completion, returns the text and the usage reported at the end."""
+        start = time.monotonic()
+        messages = self.split_prompt(text, self.prompttext)
+        stream = self.client.chat.completions.create(
             model=self.model,
-            input_tokens=input_tokens_used,
-            output_tokens=output_tokens_used
+            **self.options,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
         )
-
-        return content
+        usage = []
+
+        def delta(chunk):
+            if getattr(chunk, "usage", None):
+                usage.append(chunk.usage)
+            return chunk.choices[0].delta.content if chunk.choices else None
+
+        content = self.stream_guard.consume(stream, delta, text, start)
+        if not usage:
+            # 部分 OpenAI 兼容服务不在流式响应中返回用量，按字符数估算
+            if not self.stream_usage_warned:
+                logger.warning(
+                    f"{self.model} reported no usage for streamed responses, "
+                    "token counts and cost are estimated"
+                )
+                self.stream_usage_warned = True
+            prompt = "".join(message["content"] for message in messages)
+            return content, SimpleNamespace(
+                prompt_tokens=estimate_tokens(prompt, include_output=False),
+                completion_tokens=estimate_tokens(content, include_output=False),
+            )
+        return content, usage[-1]
 
     def get_formular_placeholder(self, id: int):
         return "{{v" + str(id) + "}}"
@@ -512,17 +930,21 @@ class AzureOpenAITranslator(BaseTranslator):
             azure_deployment=model,
             api_version="2024-06-01",
             api_key=api_key,
+            max_retries=0,  # 重试和限流由 call_service 统一处理
         )
         self.prompttext = prompt
+        self.glossary = load_glossary()
         self.add_cache_impact_parameters("temperature", self.options["temperature"])
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
 
     def do_translate(self, text) -> str:
+        start = time.monotonic()
         response = self.client.chat.completions.create(
             model=self.model,
             **self.options,
-            messages=self.prompt(text, self.prompttext),
+            messages=self.split_prompt(text, self.prompttext),
         )
+        log_response_usage(self.model, response.usage, start)
         return response.choices[0].message.content.strip()
 
 
@@ -560,7 +982,7 @@ class ModelScopeTranslator(OpenAITranslator):
             ignore_cache=ignore_cache,
         )
         self.prompttext = prompt
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
 
 
 class ZhipuTranslator(OpenAITranslator):
@@ -589,22 +1011,21 @@ class ZhipuTranslator(OpenAITranslator):
             ignore_cache=ignore_cache,
         )
         self.prompttext = prompt
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
 
     def do_translate(self, text) -> str:
+        start = time.monotonic()
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 **self.options,
-                messages=self.prompt(text, self.prompttext),
+                messages=self.split_prompt(text, self.prompttext),
             )
         except openai.BadRequestError as e:
-            if (
-                json.loads(response.choices[0].message.content.strip())["error"]["code"]
-                == "1301"
-            ):
+            if str(e.code) == "1301":  # 内容审核拒绝，重试也不会成功
                 return "IRREPARABLE TRANSLATION ERROR"
             raise e
+        log_response_usage(self.model, response.usage, start)
         return response.choices[0].message.content.strip()
 
 
@@ -634,7 +1055,7 @@ class SiliconTranslator(OpenAITranslator):
             ignore_cache=ignore_cache,
         )
         self.prompttext = prompt
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
 
 
 class GeminiTranslator(OpenAITranslator):
@@ -663,7 +1084,7 @@ class GeminiTranslator(OpenAITranslator):
             ignore_cache=ignore_cache,
         )
         self.prompttext = prompt
-        self.add_cache_impact_parameters("prompt", self.prompt("", self.prompttext))
+        self.add_cache_impact_parameters("prompt", self.split_prompt("", self.prompttext))
 
 
 class AzureTranslator(BaseTranslator):
@@ -753,6 +1174,7 @@ class AnythingLLMTranslator(BaseTranslator):
             "Content-Type": "application/json",
         }
         self.prompttext = prompt
+        self.session = get_session(self.name)
 
     def do_translate(self, text):
         messages = self.prompt(text, self.prompttext)
@@ -762,7 +1184,7 @@ class AnythingLLMTranslator(BaseTranslator):
             "sessionId": "translation_expert",
         }
 
-        response = requests.post(
+        response = self.session.post(
             self.api_url, headers=self.headers, data=json.dumps(payload)
         )
         response.raise_for_status()
@@ -786,6 +1208,7 @@ class DifyTranslator(BaseTranslator):
         super().__init__(lang_out, lang_in, model, ignore_cache)
         self.api_url = self.envs["DIFY_API_URL"]
         self.api_key = self.envs["DIFY_API_KEY"]
+        self.session = get_session(self.name)
 
     def do_translate(self, text):
         headers = {
@@ -804,7 +1227,7 @@ class DifyTranslator(BaseTranslator):
         }
 
         # 向 Dify 服务器发送请求
-        response = requests.post(
+        response = self.session.post(
             self.api_url, headers=headers, data=json.dumps(payload)
         )
         response.raise_for_status()
@@ -827,43 +1250,49 @@ class ArgosTranslator(BaseTranslator):
             )
             raise
         super().__init__(lang_in, lang_out, model, ignore_cache)
-        lang_in = self.lang_map.get(lang_in.lower(), lang_in)
-        lang_out = self.lang_map.get(lang_out.lower(), lang_out)
-        self.lang_in = lang_in
-        self.lang_out = lang_out
-        argostranslate.package.update_package_index()
-        available_packages = argostranslate.package.get_available_packages()
-        try:
-            available_package = list(
-                filter(
-                    lambda x: x.from_code == self.lang_in
-                    and x.to_code == self.lang_out,
-                    available_packages,
+        self.translation = self.installed_translation()
+        if self.translation is None:  # 只有语言对未安装时才需要联网
+            argostranslate.package.update_package_index()
+            available_packages = argostranslate.package.get_available_packages()
+            try:
+                available_package = list(
+                    filter(
+                        lambda x: x.from_code == self.lang_in
+                        and x.to_code == self.lang_out,
+                        available_packages,
+                    )
+                )[0]
+            except Exception:
+                raise ValueError(
+                    "lang_in and lang_out pair not supported by Argos Translate."
                 )
-            )[0]
-        except Exception:
-            raise ValueError(
-                "lang_in and lang_out pair not supported by Argos Translate."
-            )
-        download_path = available_package.download()
-        argostranslate.package.install_from_path(download_path)
+            download_path = available_package.download()
+            argostranslate.package.install_from_path(download_path)
+            self.translation = self.installed_translation()
 
-    def translate(self, text: str, ignore_cache: bool = False):
-        # Translate
-        import argotranslate.translate  # noqa: F401
+    def installed_translation(self):
+        import argostranslate.translate
 
-        installed_languages = (
-            argostranslate.translate.get_installed_languages()  # noqa: F821
-        )
-        from_lang = list(filter(lambda x: x.code == self.lang_in, installed_languages))[
-            0
-        ]
-        to_lang = list(filter(lambda x: x.code == self.lang_out, installed_languages))[
-            0
-        ]
-        translation = from_lang.get_translation(to_lang)
-        translatedText = translation.translate(text)
-        return translatedText
+        languages = {
+            x.code: x for x in argostranslate.translate.get_installed_languages()
+        }
+        from_lang = languages.get(self.lang_in)
+        to_lang = languages.get(self.lang_out)
+        if from_lang is None or to_lang is None:
+            return None
+        return from_lang.get_translation(to_lang)
+
+    def do_translate(self, text):
+        return self.translation.translate(text)
+
+    def do_translate_batch(self, texts: list[str]) -> list[str]:
+        # Argos 按换行拆分段落，一次调用翻译整批文本
+        # Argos 内部仍逐段翻译，合并请求不会更快，所以 converter 不经 MicroBatcher 调用这里
+        lines = [" ".join(text.splitlines()) for text in texts]
+        translated = self.translation.translate("\n".join(lines)).split("\n")
+        if len(translated) != len(texts):
+            return super().do_translate_batch(texts)
+        return translated
 
 
 class GrokTranslator(OpenAITranslator):
@@ -1033,6 +1462,11 @@ class PlamoTranslator(BaseTranslator):
                 max_model_len=max_model_len,
                 max_num_batched_tokens=max_num_batched_tokens
             )
+            # 多个线程提交的段落合并成一次 generate 调用
+            self.batcher = MicroBatcher(
+                self.generate_vllm,
+                max_batch=int(ConfigManager.get("PLAMO_MAX_BATCH") or 32),
+            )
         elif backend == "mlx":
             try:
                 import mlx.core as mx
@@ -1048,6 +1482,7 @@ class PlamoTranslator(BaseTranslator):
                 tokenizer_config={"eos_token": self.stop_token, "trust_remote_code": True},
             )
             self.eos_token_id = self.tokenizer.convert_tokens_to_ids(self.stop_token)
+            self.mlx_lock = threading.Lock()  # MLX 推理不是线程安全的
         else:
             raise ValueError("backend must be either 'vllm' or 'mlx'")
         self.add_cache_impact_parameters("model", model)
@@ -1057,24 +1492,54 @@ class PlamoTranslator(BaseTranslator):
         """Map language code to Plamo's expected format"""
         return self._lang_map.get(lang.lower(), lang)
 
-    def do_translate(self, text):
+    def build_prompt(self, text):
         input_lang = self._get_lang_code(self.lang_in)
         output_lang = self._get_lang_code(self.lang_out)
-        prompt = f'''<|plamo:op|>dataset
+        return f'''<|plamo:op|>dataset
 translation
 <|plamo:op|>input lang={input_lang}
 {text}
 <|plamo:op|>output lang={output_lang}
 '''
-        if self.backend == "vllm":
-            sampling_params = self.vllm.SamplingParams(
-                temperature=0,
-                max_tokens=max(1024, len(text) * 2),
-                stop=[self.stop_token]
+
+    def generate_vllm(self, batch):
+        """Generate a batch of (prompt, max_tokens) requests in one vllm call."""
+        sampling_params = [
+            self.vllm.SamplingParams(
+                temperature=0, max_tokens=max_tokens, stop=[self.stop_token]
             )
-            responses = self.llm.generate([prompt], sampling_params=sampling_params)
-            translated_text = responses[0].outputs[0].text.strip()
-            return translated_text
+            for _, max_tokens in batch
+        ]
+        responses = self.llm.generate(
+            [prompt for prompt, _ in batch],
+            sampling_params=sampling_params,
+            use_tqdm=False,
+        )
+        return [response.outputs[0].text.strip() for response in responses]
+
+    def generate_mlx(self, prompt, max_new_tokens=1024):
+        """Greedy decoding; the KV cache holds the prefix so each step feeds one token."""
+        from mlx_lm.models.cache import make_prompt_cache
+
+        mx = self.mx
+        cache = make_prompt_cache(self.model)
+        # apply_chat_template 默认返回 token id
+        input_ids = prompt if isinstance(prompt, list) else self.tokenizer.encode(prompt)
+        tokens = mx.array([input_ids])
+        generated_ids = []
+        for _ in range(max_new_tokens):
+            logits = self.model(tokens, cache=cache)[0, -1]
+            next_token = int(mx.argmax(logits).item())
+            if next_token == self.eos_token_id:
+                break
+            generated_ids.append(next_token)
+            tokens = mx.array([[next_token]])
+        return self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+
+    def do_translate(self, text):
+        prompt = self.build_prompt(text)
+        if self.backend == "vllm":
+            return self.batcher((prompt, max(1024, len(text) * 2)))
         elif self.backend == "mlx":
             # Prepare chat template
             message = [{"role": "user", "content": prompt}]
@@ -1082,24 +1547,19 @@ translation
                 message,
                 add_generation_prompt=True,
             )
-            def generate_until_eos(model, tokenizer, prompt: str, eos_token_id=None, max_new_tokens=100):
-                import mlx.core as mx
-                input_ids = tokenizer.encode(prompt)
-                generated_ids = []
-                for _ in range(max_new_tokens):
-                    logits = model(mx.array([input_ids[:] + generated_ids]))[0]
-                    next_token_logits = logits[-1]
-                    next_token = int(mx.argmax(next_token_logits).item())
-                    generated_ids.append(next_token)
-                    if eos_token_id is not None and next_token == eos_token_id:
-                        break
-                output_text = tokenizer.decode(generated_ids, skip_special_tokens=True)
-                return output_text
-            output = generate_until_eos(self.model, self.tokenizer, prompt_str, self.eos_token_id, max_new_tokens=1024)
+            with self.mlx_lock:
+                output = self.generate_mlx(prompt_str, max_new_tokens=1024)
             return output.strip()
         else:
             raise ValueError("Unknown backend for PlamoTranslator")
 
+    def do_translate_batch(self, texts):
+        if self.backend == "vllm":
+            return self.generate_vllm(
+                [(self.build_prompt(text), max(1024, len(text) * 2)) for text in texts]
+            )
+        return super().do_translate_batch(texts)
+
 class QwenMtTranslator(OpenAITranslator):
     """
     Use Qwen-MT model from Aliyun. it's designed for translating.
@@ -1218,6 +1678,7 @@ class PlamoAPITranslator(BaseTranslator):
         self.client = openai.OpenAI(
             base_url=base_url,
             api_key=api_key,
+            max_retries=0,  # 重试和限流由 call_service 统一处理
         )
         
         # Set translation style if provided
@@ -1242,6 +1703,7 @@ class PlamoAPITranslator(BaseTranslator):
         self.add_cache_impact_parameters("base_url", base_url)
         if style:
             self.add_cache_impact_parameters("style", style)
+        self.stream_guard = StreamGuard.from_config()
     
     def _get_lang_name(self, lang_code):
         """Map language code to PLaMo's expected language name"""
@@ -1274,15 +1736,26 @@ class PlamoAPITranslator(BaseTranslator):
                 }
             ]
             
+            start = time.monotonic()
             response = self.client.chat.completions.create(
                 model=model_name,
                 messages=messages,
                 temperature=0.0,
                 max_tokens=15000,
-                stop=["<|plamo:op|>", "<|plamo:bos|>", "<|plamo:eos|>"]
+                stop=["<|plamo:op|>", "<|plamo:bos|>", "<|plamo:eos|>"],
+                stream=self.stream_guard.enabled,
             )
             
-            output = response.choices[0].message.content
+            if self.stream_guard.enabled:
+                output = self.stream_guard.consume(
+                    response,
+                    lambda chunk: chunk.choices[0].delta.content if chunk.choices else None,
+                    text,
+                    start,
+                )
+            else:
+                output = response.choices[0].message.content
+                log_response_usage(model_name, response.usage, start)
             return output.strip()
         else:
             # 既存のモデル用のコード
@@ -1299,16 +1772,27 @@ translation
 <|plamo:op|>output lang={output_lang}"""
             
             # Use completions API as shown in the example
+            start = time.monotonic()
             response = self.client.completions.create(
                 prompt=message,
                 model=model_name,
                 temperature=0.0,
                 max_tokens=min(5096, len(text) * 3),  # Adjust based on input length
                 stop=["<|plamo:op|>"],
+                stream=self.stream_guard.enabled,
             )
             
             # Extract the output from the response
-            output = response.choices[0].text
+            if self.stream_guard.enabled:
+                output = self.stream_guard.consume(
+                    response,
+                    lambda chunk: chunk.choices[0].text if chunk.choices else None,
+                    text,
+                    start,
+                )
+            else:
+                output = response.choices[0].text
+                log_response_usage(model_name, response.usage, start)
             
             # If the response contains a newline, split and take everything after the first line
             if "\n" in output:
@@ -0,0 +1,165 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from string import Template
+from typing import Dict, Optional
+
+from pdf2zh.config import ConfigManager
+from pdf2zh.translator import (
+    AnythingLLMTranslator,
+    ArgosTranslator,
+    AzureOpenAITranslator,
+    AzureTranslator,
+    BaseTranslator,
+    BingTranslator,
+    DeepLTranslator,
+    DeepLXTranslator,
+    DeepseekTranslator,
+    DifyTranslator,
+    GeminiTranslator,
+    GoogleTranslator,
+    GrokTranslator,
+    GroqTranslator,
+    ModelScopeTranslator,
+    OllamaTranslator,
+    OpenAIlikedTranslator,
+    OpenAITranslator,
+    PlamoAPITranslator,
+    PlamoTranslator,
+    QwenMtTranslator,
+    SiliconTranslator,
+    TencentTranslator,
+    XinferenceTranslator,
+    ZhipuTranslator,
+)
+
+logger = logging.getLogger(__name__)
+
+TRANSLATORS = [
+    GoogleTranslator,
+    BingTranslator,
+    DeepLTranslator,
+    DeepLXTranslator,
+    OllamaTranslator,
+    XinferenceTranslator,
+    AzureOpenAITranslator,
+    OpenAITranslator,
+    ZhipuTranslator,
+    ModelScopeTranslator,
+    SiliconTranslator,
+    GeminiTranslator,
+    AzureTranslator,
+    TencentTranslator,
+    DifyTranslator,
+    AnythingLLMTranslator,
+    ArgosTranslator,
+    GrokTranslator,
+    GroqTranslator,
+    DeepseekTranslator,
+    OpenAIlikedTranslator,
+    QwenMtTranslator,
+    PlamoTranslator,
+    PlamoAPITranslator,
+]
+
+DEFAULT_POOL_SIZE = 4
+
+
+def create_translator(
+    service: str,
+    lang_in: str,
+    lang_out: str,
+    envs: Optional[Dict] = None,
+    prompt: Optional[Template] = None,
+    ignore_cache: bool = False,
+) -> BaseTranslator:
+    """Construct a new translator for ``service``, e.g. "ollama:gemma2:9b"."""
+    # e.g. "ollama:gemma2:9b" -> ["ollama", "gemma2:9b"]
+    param = service.split(":", 1)
+    service_name = param[0]
+    service_model = param[1] if len(param) > 1 else None
+    for translator in TRANSLATORS:
+        if service_name == translator.name:
+            return translator(
+                lang_in,
+                lang_out,
+                service_model,
+                envs=envs or {},
+                prompt=prompt,
+                ignore_cache=ignore_cache,
+            )
+    raise ValueError("Unsupported translation service")
+
+
+class TranslatorPool:
+    """
+    Keeps warm translator instances, keyed by everything that goes into their
+    construction. Clients, HTTP pools and local models are then reused across
+    documents instead of being rebuilt for every ``translate_patch``.
+    The least recently used instance is dropped once ``size`` is exceeded.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size
+        self._translators: "OrderedDict[tuple, BaseTranslator]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        service, lang_in, lang_out, envs=None, prompt=None, ignore_cache=False
+    ) -> tuple:
+        return (
+            service,
+            lang_in,
+            lang_out,
+            json.dumps(envs or {}, sort_keys=True, default=str),
+            prompt.template if prompt is not None else None,
+            bool(ignore_cache),
+        )
+
+    def get(
+        self,
+        service: str,
+        lang_in: str,
+        lang_out: str,
+        envs: Optional[Dict] = None,
+        prompt: Optional[Template] = None,
+        ignore_cache: bool = False,
+    ) -> BaseTranslator:
+        key = self.key(service, lang_in, lang_out, envs, prompt, ignore_cache)
+        with self._lock:  # 本地模型加载较慢，同一时间只构造一个，避免重复加载
+            translator = self._translators.get(key)
+            if translator is not None:
+                self._translators.move_to_end(key)
+                return translator
+            translator = create_translator(
+                service, lang_in, lang_out, envs, prompt, ignore_cache
+            )
+            self._translators[key] = translator
+            size = self.size or int(
+                ConfigManager.get("TRANSLATOR_POOL_SIZE") or DEFAULT_POOL_SIZE
+            )
+            while len(self._translators) > max(size, 1):
+                _, evicted = self._translators.popitem(last=False)
+                logger.debug(f"Evicted translator {evicted}")
+            return translator
+
+    def clear(self):
+        with self._lock:
+            self._translators.clear()
+
+
+pool = TranslatorPool()
+
+
+def get_translator(
+    service: str,
+    lang_in: str,
+    lang_out: str,
+    envs: Optional[Dict] = None,
+    prompt: Optional[Template] = None,
+    ignore_cache: bool = False,
+) -> BaseTranslator:
+    """Warm translator from the process-wide pool."""
+    return pool.get(service, lang_in, lang_out, envs, prompt, ignore_cache)
@@ -0,0 +1,171 @@
+import logging
+import threading
+from typing import Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from pdf2zh.config import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+_lock = threading.Lock()
+_pool_size = DEFAULT_POOL_SIZE
+_sessions: Dict[str, "requests.Session | HTTP2Session"] = {}
+
+
+def timeouts() -> tuple[float, float]:
+    """(connect, read) timeouts from HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT."""
+    connect = ConfigManager.get("HTTP_CONNECT_TIMEOUT") or DEFAULT_CONNECT_TIMEOUT
+    read = ConfigManager.get("HTTP_READ_TIMEOUT") or DEFAULT_READ_TIMEOUT
+    return float(connect), float(read)
+
+
+def http2_enabled() -> bool:
+    if str(ConfigManager.get("HTTP2") or "").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2 is enabled but h2 is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to requests that set none."""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class HTTP2Session:
+    """Minimal requests-style wrapper around an HTTP/2 httpx client."""
+
+    def __init__(self, pool_size: int):
+        self._lock = threading.Lock()
+        self._inflight: Dict[httpx.Client, int] = {}  # 各 client 进行中的请求数
+        self._retired = set()
+        self.client = self._client(pool_size)
+
+    @staticmethod
+    def _client(pool_size: int) -> httpx.Client:
+        connect, read = timeouts()
+        return httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            follow_redirects=True,
+        )
+
+    def resize(self, pool_size: int):
+        """
+        Swap in a client with a larger pool. Translators keep this session, so it
+        is never replaced; the old client is closed once its in-flight requests
+        have finished.
+        """
+        with self._lock:
+            old, self.client = self.client, self._client(pool_size)
+            if self._inflight.get(old):
+                self._retired.add(old)
+                old = None
+        if old is not None:
+            old.close()
+
+    def request(self, method, url, data=None, **kwargs):
+        if isinstance(data, (str, bytes)):  # httpx 中原始请求体使用 content
+            kwargs["content"] = data
+            data = None
+        with self._lock:
+            client = self.client
+            self._inflight[client] = self._inflight.get(client, 0) + 1
+        try:
+            return client.request(method, url, data=data, **kwargs)
+        finally:
+            with self._lock:
+                self._inflight[client] -= 1
+                retired = False
+                if not self._inflight[client]:
+                    del self._inflight[client]
+                    retired = client in self._retired
+                    self._retired.discard(client)
+            if retired:  # 换下的 client 在最后一个请求结束后关闭
+                client.close()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            clients, self._retired = [*self._retired, self.client], set()
+        for client in clients:
+            client.close()
+
+
+def _mount(session: requests.Session, pool_size: int):
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeouts(),
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def configure(pool_size: Optional[int] = None):
+    """
+    Size the connection pools for ``pool_size`` concurrent requests per host.
+    Existing sessions are resized in place; the pool never shrinks below the default.
+    """
+    global _pool_size
+    size = max(DEFAULT_POOL_SIZE, pool_size or 0)
+    with _lock:
+        if size <= _pool_size:
+            return
+        _pool_size = size
+        for name, session in list(_sessions.items()):
+            if isinstance(session, requests.Session):
+                _mount(session, size)
+            else:
+                session.resize(size)
+
+
+def get_session(name: str = "default") -> "requests.Session | HTTP2Session":
+    """
+    Keep-alive session shared by every translator of the service ``name`` in this
+    process, so connections are reused across paragraphs and documents.
+    """
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            if http2_enabled():
+                session = HTTP2Session(_pool_size)
+            else:
+                session = requests.Session()
+                _mount(session, _pool_size)
+            _sessions[name] = session
+        return session
+
+
+def reset():
+    """Close all shared sessions, e.g. after fork. Translators holding them must be rebuilt."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
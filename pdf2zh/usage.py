@@ -0,0 +1,88 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Optional
+
+# 当前文档的用量累加器，由 translate_patch 设置，翻译线程通过 copy_context 继承
+_current: contextvars.ContextVar[Optional["UsageAccumulator"]] = contextvars.ContextVar(
+    "pdf2zh_usage", default=None
+)
+
+
+class UsageAccumulator:
+    """Token, request and cost counters of one translation run (one document)."""
+
+    FIELDS = (
+        "requests",
+        "cache_hits",
+        "retries",
+        "failed",
+        "input_tokens",
+        "output_tokens",
+        "cached_tokens",
+        "cost",
+        "service_time",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._end: Optional[float] = None
+        self.counters = dict.fromkeys(self.FIELDS, 0)
+        self.counters["cost"] = 0.0
+        self.counters["service_time"] = 0.0
+
+    def add(self, **amounts):
+        with self._lock:
+            for key, value in amounts.items():
+                self.counters[key] += value or 0
+
+    def finish(self):
+        self._end = time.monotonic()
+
+    def summary(self) -> dict:
+        with self._lock:
+            summary = dict(self.counters)
+        summary["cost"] = round(summary["cost"], 6)
+        summary["service_time"] = round(summary["service_time"], 3)
+        summary["elapsed"] = round((self._end or time.monotonic()) - self._start, 3)
+        return summary
+
+
+def merge_summaries(summaries: list) -> dict:
+    """Usage of a document translated in shards: counters add up, elapsed is the longest shard."""
+    merged = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            if key == "elapsed":
+                merged[key] = max(merged.get(key, 0), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    for key in ("cost", "service_time"):
+        if key in merged:
+            merged[key] = round(merged[key], 6 if key == "cost" else 3)
+    return merged
+
+
+def current() -> Optional[UsageAccumulator]:
+    return _current.get()
+
+
+def record(**amounts):
+    """Add to the accumulator of the current run; a no-op outside of one."""
+    usage = _current.get()
+    if usage is not None:
+        usage.add(**amounts)
+
+
+@contextlib.contextmanager
+def collect(usage: Optional[UsageAccumulator] = None):
+    """Make ``usage`` (or a new accumulator) the current one inside the block."""
+    usage = usage if usage is not None else UsageAccumulator()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+        usage.finish()
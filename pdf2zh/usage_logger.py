@@ -1,51 +1,208 @@
 import os
+import sqlite3
+import threading
+import time
 from datetime import datetime, timezone
-from filelock import FileLock
 from typing import Optional
 from .price_scraper import PriceData
+from .usage import record as record_usage
 
 # ログファイルのパス
 LOG_DIR = os.path.expanduser("~/.llm_usage_log")
-LOG_FILE = os.path.join(LOG_DIR, "openai.txt")
-LOCK_FILE = os.path.join(LOG_DIR, "openai.txt.lock")
+LOG_FILE = os.path.join(LOG_DIR, "openai.txt")  # 旧形式のテキストログ（移行用）
+LEDGER_FILE = "usage.db"
+
+# 1日のトークン上限（これを超えると check_daily_limit で終了）
+DAILY_TOKEN_LIMIT = 990000
+# 他プロセスの記録を取り込むため、日次合計を再集計する間隔（秒）
+REFRESH_INTERVAL = 5.0
 
 # 価格データマネージャーの初期化
 price_data = PriceData()
+# 価格が見つからず警告済みのモデル
+_unpriced_models = set()
 
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+def calculate_cost(model: str, input_tokens: int, output_tokens: int,
+                   cached_tokens: int = 0) -> float:
     """
     モデルとトークン数から料金を計算
     
     Args:
         model: 使用したモデル名
-        input_tokens: 入力トークン数
+        input_tokens: 入力トークン数（キャッシュ済みトークンを含む）
         output_tokens: 出力トークン数
+        cached_tokens: プロンプトキャッシュから読まれた入力トークン数
         
     Returns:
         float: 計算されたコスト（ドル）
     """
-    # 価格情報の更新チェック
-    price_data.update_if_needed()
-    
     # モデルの価格を取得
     prices = price_data.get_price(model)
     if prices is None:
-        # 価格が見つからない場合はデフォルト価格を使用
-        print(f"Warning: Price not found for model {model}. Using default.")
+        # 価格が見つからない場合はデフォルト価格を使用（警告はモデルごとに1回だけ）
+        if model not in _unpriced_models:
+            _unpriced_models.add(model)
+            print(f"Warning: Price not found for model {model}. Using default.")
         prices = {"input": 0.01, "output": 0.03}  # デフォルト価格
     
     # コストを計算（価格は1Mトークンあたり）
-    input_cost = (input_tokens / 1_000_000) * prices["input"]
+    # キャッシュ済みトークンは cached_input の価格（未設定の場合は通常の入力価格）
+    cached_price = prices.get("cached_input", prices["input"])
+    input_cost = ((input_tokens - cached_tokens) / 1_000_000) * prices["input"]
+    input_cost += (cached_tokens / 1_000_000) * cached_price
     output_cost = (output_tokens / 1_000_000) * prices["output"]
     
     return input_cost + output_cost
 
 
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class UsageLedger:
+    """
+    SQLite (WAL) に使用量を1リクエスト1行で追記する台帳。
+
+    追記は INSERT 1回で済み、ファイル全体の読み書きやロックは不要です。
+    当日の合計はメモリに保持し、他プロセスの記録は REFRESH_INTERVAL ごとに再集計します。
+    """
+
+    def __init__(self, path: str, refresh_interval: float = REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._day = None
+        self._daily = {"tokens": 0, "cost": 0.0}
+        self._refreshed = 0.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " id INTEGER PRIMARY KEY,"
+            " ts REAL NOT NULL,"
+            " day TEXT NOT NULL,"
+            " model TEXT,"
+            " input_tokens INTEGER,"
+            " output_tokens INTEGER,"
+            " cached_tokens INTEGER NOT NULL DEFAULT 0,"
+            " tokens INTEGER NOT NULL,"
+            " cost REAL NOT NULL,"
+            " elapsed REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS usage_day ON usage (day)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=wal")
+            conn.execute("PRAGMA synchronous=normal")
+            self._local.conn = conn
+        return conn
+
+    def append(self, tokens: int, cost: float, model: Optional[str] = None,
+               input_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+               cached_tokens: int = 0, elapsed: Optional[float] = None) -> None:
+        """1件の使用量を追記し、当日の合計に加算します。"""
+        day = _today()
+        self._connect().execute(
+            "INSERT INTO usage (ts, day, model, input_tokens, output_tokens,"
+            " cached_tokens, tokens, cost, elapsed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), day, model, input_tokens, output_tokens,
+             cached_tokens, tokens, cost, elapsed),
+        )
+        with self._lock:
+            if self._day == day:
+                self._daily["tokens"] += tokens
+                self._daily["cost"] += cost
+
+    def refresh(self) -> None:
+        """当日の合計をデータベースから再集計します（他プロセスの記録を含む）。"""
+        day = _today()
+        tokens, cost = self._connect().execute(
+            "SELECT COALESCE(SUM(tokens), 0), COALESCE(SUM(cost), 0) FROM usage"
+            " WHERE day = ?",
+            (day,),
+        ).fetchone()
+        with self._lock:
+            self._day = day
+            self._daily = {"tokens": tokens, "cost": cost}
+            self._refreshed = time.monotonic()
+
+    def daily(self) -> dict:
+        """当日の合計 {"tokens", "cost"}。通常はメモリの値を返すだけです。"""
+        with self._lock:
+            stale = (
+                self._day != _today()
+                or time.monotonic() - self._refreshed >= self.refresh_interval
+            )
+        if stale:
+            self.refresh()
+        with self._lock:
+            return dict(self._daily)
+
+    def total(self) -> dict:
+        tokens, cost = self._connect().execute(
+            "SELECT COALESCE(SUM(tokens), 0), COALESCE(SUM(cost), 0) FROM usage"
+        ).fetchone()
+        return {"tokens": tokens, "cost": cost}
+
+    def throughput(self, model: Optional[str], limit: int = 200) -> Optional[dict]:
+        """
+        モデルの直近 limit 件のリクエストから平均処理時間を求めます。
+        記録がない場合は None を返します。
+        """
+        count, seconds = self._connect().execute(
+            "SELECT COUNT(*), AVG(elapsed) FROM (SELECT elapsed FROM usage"
+            " WHERE model = ? AND elapsed IS NOT NULL ORDER BY id DESC LIMIT ?)",
+            (model, limit),
+        ).fetchone()
+        if not count:
+            return None
+        return {"requests": count, "seconds_per_request": seconds}
+
+    def import_text_log(self, log_file: str) -> None:
+        """旧形式のテキストログの日次合計を1日1行として取り込みます。"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM usage LIMIT 1").fetchone():
+            return
+        with open(log_file, "r") as f:
+            for line in f:
+                if not line.startswith("Daily:"):
+                    continue
+                date, tok, cst, *_ = line.strip().split(", ")
+                conn.execute(
+                    "INSERT INTO usage (ts, day, model, tokens, cost)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (time.time(), date.split(": ")[2], "legacy",
+                     int(tok.split(": ")[1]), float(cst.split(": ")[1])),
+                )
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> UsageLedger:
+    """LOG_DIR にある使用量台帳を返します（初回のみ作成）。"""
+    global _ledger
+    path = os.path.join(LOG_DIR, LEDGER_FILE)
+    with _ledger_lock:
+        if _ledger is None or _ledger.path != path:
+            _ledger = UsageLedger(path)
+            legacy = os.path.join(LOG_DIR, os.path.basename(LOG_FILE))
+            if os.path.exists(legacy):
+                _ledger.import_text_log(legacy)
+        return _ledger
+
+
 def log_usage(tokens: int, cost: Optional[float] = None, model: Optional[str] = None,
-              input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+              input_tokens: Optional[int] = None, output_tokens: Optional[int] = None,
+              cached_tokens: int = 0, elapsed: Optional[float] = None):
     """
-    使用量をログファイルに記録します。
+    使用量を台帳に記録します。
     
     Args:
         tokens: 消費した総トークン数
@@ -53,97 +210,31 @@ def log_usage(tokens: int, cost: Optional[float] = None, model: Optional[str] =
         model: 使用したモデル名（cost自動計算時に必要）
         input_tokens: 入力トークン数（cost自動計算時に必要）
         output_tokens: 出力トークン数（cost自動計算時に必要）
+        cached_tokens: プロンプトキャッシュから読まれた入力トークン数
+        elapsed: リクエストにかかった秒数
     """
     # コストが指定されていない場合は計算
     if cost is None:
         if model is None or input_tokens is None or output_tokens is None:
             raise ValueError("Cost calculation requires model, input_tokens, and output_tokens")
-        cost = calculate_cost(model, input_tokens, output_tokens)
-    # ディレクトリ作成
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
-
-    # 初期値
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    daily_usage = {"date": today, "tokens": tokens, "cost": cost}
-    total_usage = {"tokens": tokens, "cost": cost}
-
-    # ファイルロックを使用して排他的アクセスを確保
-    lock = FileLock(LOCK_FILE, timeout=10)
-    try:
-        with lock:
-            # ファイルが存在すれば読み込んで更新
-            if os.path.exists(LOG_FILE):
-                with open(LOG_FILE, "r") as f:
-                    lines = f.readlines()
-                    today_found = False
-                    for line in lines:
-                        if line.startswith("Daily:"):
-                            # 日次使用量を解析
-                            date, tok, cst = line.split(", ")
-                            if date.split(": ")[2] == today:
-                                today_found = True
-                                daily_usage["tokens"] += int(tok.split(": ")[1])
-                                daily_usage["cost"] += float(cst.split(": ")[1])
-                        elif line.startswith("Total:"):
-                            # 合計使用量を解析
-                            tok, cst = line.split(", ")
-                            total_usage["tokens"] += int(tok.split(": ")[2])
-                            total_usage["cost"] += float(cst.split(": ")[1])
-
-            # 今日の記録がなければ初期値を設定
-            if not today_found:
-                daily_usage["tokens"] = tokens
-                daily_usage["cost"] = cost
-
-            # ログファイルを更新
-            with open(LOG_FILE, "w") as f:
-                # Total行を最初に書き込む
-                f.write(
-                    f"Total: tokens: {total_usage['tokens']}, cost: {total_usage['cost']:.4f}\n\n"
-                )
-                # 既存のDaily行を再書き込み（今日の分は除く）
-                if 'lines' in locals():
-                    for line in lines:
-                        if line.startswith("Daily:"):
-                            date_str = line.split(", ")[0].split(": ")[2]
-                            if date_str != today:
-                                f.write(line)
-                # 今日の記録を一番下に追加または更新
-                f.write(
-                    f"Daily: date: {daily_usage['date']}, tokens: {daily_usage['tokens']}, cost: {daily_usage['cost']:.4f}\n"
-                )
-    except TimeoutError:
-        print("Warning: Could not acquire lock for usage log within timeout period.")
+        if cached_tokens:
+            cost = calculate_cost(model, input_tokens, output_tokens, cached_tokens)
+        else:
+            cost = calculate_cost(model, input_tokens, output_tokens)
+    get_ledger().append(tokens, cost, model, input_tokens, output_tokens,
+                        cached_tokens, elapsed)
+    # 実行中のドキュメントの集計にも加算
+    record_usage(input_tokens=input_tokens or 0, output_tokens=output_tokens or 0,
+                 cached_tokens=cached_tokens, cost=cost)
 
 
 def check_daily_limit():
     """
     1日のトークン数が100万トークンを超えそうな場合、エラーメッセージを表示します。
     """
-    if not os.path.exists(LOG_FILE):
-        return
-
-    lock = FileLock(LOCK_FILE, timeout=5)
-    try:
-        with lock:
-            with open(LOG_FILE, "r") as f:
-                lines = f.readlines()
-                for line in lines:
-                    if line.startswith("Daily:"):
-                        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-                        parts = line.split(", ")
-                        date = parts[0]
-                        tok = parts[1]
-                        if date.split(": ")[2] == today:
-                            tokens = int(tok.split(": ")[1])
-                            if tokens > 990000:
-                                print(
-                                    "Warning: Daily token limit exceeded (1,000,000 tokens)."
-                                )
-                                exit()
-    except TimeoutError:
-        print("Warning: Could not check daily limit due to lock timeout.")
+    if get_ledger().daily()["tokens"] > DAILY_TOKEN_LIMIT:
+        print("Warning: Daily token limit exceeded (1,000,000 tokens).")
+        exit()
 
 
 # テストコード
@@ -155,8 +246,7 @@ if __name__ == "__main__":
     # ログを記録
     log_usage(test_tokens, test_cost)
 
-    # ログファイルの内容を表示
-    lock = FileLock(LOCK_FILE)
-    with lock:
-        with open(LOG_FILE, "r") as f:
-            print(f.read())
+    # 集計を表示
+    ledger = get_ledger()
+    print(f"Total: {ledger.total()}")
+    print(f"Daily: {ledger.daily()}")
@@ -0,0 +1,196 @@
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from pymupdf import Document
+
+from pdf2zh.blobstore import LocalBlobStore
+
+try:
+    from pdf2zh import backend
+except ImportError:  # celery 和 flask 是可选依赖
+    backend = None
+
+
+def make_pdf(texts):
+    doc = Document()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.write()
+
+
+def page_texts(stream):
+    return [page.get_text().strip() for page in Document(stream=stream)]
+
+
+def fake_translate_stream(stream, callback=None, pages=None, **kwargs):
+    """把 pages 中的页面转为大写，代替真正的翻译"""
+    pages = range(Document(stream=stream).page_count) if pages is None else pages
+    texts = [
+        text.upper() if pageno in pages else text
+        for pageno, text in enumerate(page_texts(stream))
+    ]
+    callback(
+        SimpleNamespace(n=len(pages), total=len(pages), timings={"translate": 1.0})
+    )
+    doc = make_pdf(texts)
+    return doc, doc, {"requests": len(pages), "elapsed": 1.0}
+
+
+@unittest.skipIf(backend is None, "celery and flask are not installed")
+class TestBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.store = LocalBlobStore(self.tmp)
+        # eager 模式：任务和 chord 在当前进程中同步执行，结果保存在内存中
+        conf = backend.celery_app.conf
+        eager = dict(
+            task_always_eager=True,
+            task_store_eager_result=True,
+            broker_url="memory://",
+            result_backend="cache+memory://",
+        )
+        self.addCleanup(conf.update, {key: conf[key] for key in eager})
+        conf.update(eager)
+        for patcher in (
+            mock.patch.object(backend, "get_blobstore", return_value=self.store),
+            mock.patch.object(
+                backend, "translate_stream", side_effect=fake_translate_stream
+            ),
+            mock.patch.object(backend, "warm_up"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = backend.flask_app.test_client()
+
+    def submit(self, texts, **args):
+        data = dict(lang_in="en", lang_out="zh", service="google", **args)
+        response = self.client.post(
+            "/v1/translate",
+            data={
+                "file": (io.BytesIO(make_pdf(texts)), "example.pdf"),
+                "data": json.dumps(data),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def test_translate(self):
+        id = self.submit(["one", "two"])["id"]
+        status = self.client.get(f"/v1/translate/{id}").json
+        self.assertEqual(status["state"], "SUCCESS")
+        self.assertEqual(status["usage"]["requests"], 2)
+        mono = self.client.get(f"/v1/translate/{id}/mono")
+        self.assertEqual(page_texts(mono.data), ["ONE", "TWO"])
+        # 源文件在任务结束后删除，只留下结果
+        self.assertEqual(
+            sorted(p.name for p in self.store.root.joinpath(id).iterdir()),
+            ["dual.pdf", "mono.pdf"],
+        )
+
+    def test_sharded(self):
+        submitted = self.submit(["a", "b", "c", "d", "e"], shard_size=2)
+        id = submitted["id"]
+        self.assertEqual(submitted["shards"], 3)
+        manifest = {
+            "shards": [
+                {"id": f"{id}-{index}", "pages": pages}
+                for index, pages in enumerate([[0, 1], [2, 3], [4]])
+            ]
+        }
+        status = self.client.get(f"/v1/translate/{id}").json
+        self.assertEqual(status["state"], "SUCCESS")
+        self.assertEqual(status["usage"], {"requests": 5, "elapsed": 1.0})
+        self.assertEqual(status["timings"], {"translate": 3.0})
+        mono = self.client.get(f"/v1/translate/{id}/mono")
+        self.assertEqual(page_texts(mono.data), ["A", "B", "C", "D", "E"])
+        dual = self.client.get(f"/v1/translate/{id}/dual")
+        self.assertEqual(page_texts(dual.data)[:4], ["a", "A", "b", "B"])
+
+        progress = backend.sharded_progress(manifest)
+        self.assertEqual((progress["n"], progress["total"]), (5, 5))
+        self.assertEqual((progress["done"], progress["shards"]), (3, 3))
+        self.assertEqual(progress["partial_pages"], 5)
+        # 合并后删除源文件、分片和清单
+        names = sorted(p.name for p in self.store.root.joinpath(id).iterdir())
+        self.assertEqual(names, ["dual.pdf", "mono.pdf"])
+
+        self.client.delete(f"/v1/translate/{id}")
+        self.assertEqual(list(self.store.root.joinpath(id).iterdir()), [])
+
+    def test_expired_sharded_result(self):
+        id = self.submit(["a", "b", "c"], shard_size=2)["id"]
+        # 结果过期，只剩下旧版本遗留的清单
+        backend.celery_app.AsyncResult(id).forget()
+        manifest = {"shards": [{"id": f"{id}-0", "pages": [0, 1]}]}
+        self.store.put(backend.manifest_key(id), json.dumps(manifest).encode())
+        self.assertEqual(
+            self.client.get(f"/v1/translate/{id}").json["state"], "PENDING"
+        )
+        self.assertEqual(self.client.get(f"/v1/translate/{id}/events").status_code, 404)
+
+    def test_failed_job_cleaned_up(self):
+        backend.translate_stream.side_effect = RuntimeError("service down")
+        id = self.submit(["one", "two"])["id"]
+        self.assertEqual(
+            self.client.get(f"/v1/translate/{id}").json["state"], "FAILURE"
+        )
+        # 失败的任务也要删除源文件和部分结果，事件流随之结束
+        self.assertEqual(list(self.store.root.joinpath(id).iterdir()), [])
+        events = self.client.get(f"/v1/translate/{id}/events").get_data(as_text=True)
+        self.assertTrue(events.startswith("event: failure\n"))
+
+    def test_failed_shard_cleaned_up(self):
+        # eager 模式下 chord 会在提交时抛出分片的异常，这里逐个执行分片
+        id = "job"
+        key = self.store.put(backend.blob_key(id, "source"), make_pdf("abcde"))
+        shards = [[0, 1], [2, 3], [4]]
+        manifest = {
+            "shards": [
+                {"id": f"{id}-{index}", "pages": pages}
+                for index, pages in enumerate(shards)
+            ]
+        }
+        self.store.put(backend.manifest_key(id), json.dumps(manifest).encode())
+
+        def run(index):
+            return backend.translate_shard_task.apply(
+                (key, id, index, shards[index], {}), task_id=f"{id}-{index}"
+            )
+
+        def translate(stream, pages=None, **kwargs):
+            if 2 in pages:
+                raise RuntimeError("service down")
+            if 4 in pages:  # 最后一个分片翻译期间另一个分片失败
+                self.assertEqual(run(1).state, "FAILURE")
+            return fake_translate_stream(stream, pages=pages, **kwargs)
+
+        backend.translate_stream.side_effect = translate
+        self.assertEqual(run(0).state, "SUCCESS")
+        self.assertEqual(run(2).state, "SUCCESS")
+        # 失败前后完成的分片、源文件和清单都被删除
+        self.assertEqual(list(self.store.root.joinpath(id).iterdir()), [])
+        self.assertFalse(backend.task_exists(id))
+
+    def test_single_shard_not_split(self):
+        submitted = self.submit(["a", "b"], shard_size=5)
+        self.assertNotIn("shards", submitted)
+        self.assertIsNone(backend.read_manifest(submitted["id"]))
+
+    def test_events(self):
+        id = self.submit(["one"])["id"]
+        response = self.client.get(f"/v1/translate/{id}/events")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertTrue(response.get_data(as_text=True).startswith("event: success\n"))
+        self.assertEqual(
+            self.client.get("/v1/translate/unknown/events").status_code, 404
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf2zh.batching import MicroBatcher
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_concurrent_submissions_are_batched(self):
+        batches = []
+
+        def generate(prompts):
+            batches.append(list(prompts))
+            time.sleep(0.01)
+            return [prompt.upper() for prompt in prompts]
+
+        batcher = MicroBatcher(generate, max_batch=8, max_wait=0.2)
+        texts = [f"paragraph {i}" for i in range(16)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(batcher, texts))
+        self.assertEqual(results, [text.upper() for text in texts])
+        self.assertLess(len(batches), len(texts))
+        self.assertTrue(all(len(batch) <= 8 for batch in batches))
+        self.assertEqual(sorted(sum(batches, [])), sorted(texts))
+
+    def test_max_wait_dispatches_partial_batch(self):
+        batcher = MicroBatcher(lambda items: [x * 2 for x in items], max_wait=0.01)
+        self.assertEqual(batcher(21), 42)
+
+    def test_errors_reach_every_caller(self):
+        started = threading.Event()
+
+        def generate(prompts):
+            started.set()
+            raise RuntimeError("out of memory")
+
+        batcher = MicroBatcher(generate, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        self.assertTrue(started.is_set())
+        # 出错后仍然可以继续处理
+        batcher.fn = lambda items: items
+        self.assertEqual(batcher(7), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
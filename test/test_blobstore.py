@@ -0,0 +1,81 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pdf2zh import blobstore
+from pdf2zh.blobstore import LocalBlobStore, from_url
+
+
+class TestLocalBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = LocalBlobStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_put_bytes_and_stream(self):
+        self.assertEqual(
+            self.store.put("job/source.pdf", b"%PDF-1.7"), "job/source.pdf"
+        )
+        self.assertEqual(self.store.get("job/source.pdf"), b"%PDF-1.7")
+        self.store.put("job/mono.pdf", io.BytesIO(b"mono"))
+        with self.store.open("job/mono.pdf") as f:
+            self.assertEqual(f.read(), b"mono")
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.root, "job"))),
+            ["mono.pdf", "source.pdf"],
+        )
+
+    def test_missing_and_delete(self):
+        with self.assertRaises(KeyError):
+            self.store.open("job/dual.pdf")
+        self.store.put("job/dual.pdf", b"dual")
+        self.store.delete("job/dual.pdf")
+        self.store.delete("job/dual.pdf")  # 不存在时忽略
+        with self.assertRaises(KeyError):
+            self.store.get("job/dual.pdf")
+
+    def test_rejects_keys_outside_root(self):
+        with self.assertRaises(ValueError):
+            self.store.put("../escape.pdf", b"x")
+
+
+class TestFromUrl(unittest.TestCase):
+    def test_local(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.assertEqual(from_url(root).root, LocalBlobStore(root).root)
+        self.assertEqual(from_url(f"file://{root}").root, LocalBlobStore(root).root)
+
+    def test_s3(self):
+        boto3 = mock.Mock()
+        with (
+            mock.patch.dict("sys.modules", {"boto3": boto3}),
+            mock.patch(
+                "pdf2zh.blobstore.ConfigManager.get", return_value="http://minio:9000"
+            ),
+        ):
+            store = from_url("s3://pdfs/jobs/")
+        boto3.client.assert_called_once_with("s3", endpoint_url="http://minio:9000")
+        self.assertEqual(store.bucket, "pdfs")
+        self.assertEqual(store.object_key("a/mono.pdf"), "jobs/a/mono.pdf")
+        store.put("a/mono.pdf", b"mono")
+        store.client.put_object.assert_called_once_with(
+            Bucket="pdfs", Key="jobs/a/mono.pdf", Body=b"mono"
+        )
+
+    def test_default_is_cached(self):
+        with (
+            mock.patch.object(blobstore, "_store", None),
+            mock.patch("pdf2zh.blobstore.from_url") as create,
+        ):
+            self.assertIs(blobstore.get_blobstore(), blobstore.get_blobstore())
+        create.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
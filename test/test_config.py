@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from pdf2zh.config import ConfigManager
+from pdf2zh.translator import BaseTranslator
+
+
+class EnvTranslator(BaseTranslator):
+    name = "envtest"
+    envs = {"ENVTEST_KEY": None, "ENVTEST_MODEL": "small"}
+
+    def __init__(self, envs=None):
+        self.set_envs(envs)
+        self.budget = None
+
+
+class TestConfigManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = Path(self.tmp) / "config.json"
+        self.path.write_text(json.dumps({"A": "1"}), encoding="utf-8")
+        self.old_instance = ConfigManager._instance
+        ConfigManager.custome_config(str(self.path))
+
+    def tearDown(self):
+        ConfigManager._instance = self.old_instance
+        shutil.rmtree(self.tmp)
+
+    def read(self):
+        return json.loads(self.path.read_text(encoding="utf-8"))
+
+    def test_atomic_save(self):
+        ConfigManager.set("B", "2")
+        self.assertEqual(self.read(), {"A": "1", "B": "2"})
+        self.assertEqual(os.listdir(self.tmp), ["config.json"])
+
+    def test_get_never_writes(self):
+        mtime = self.path.stat().st_mtime_ns
+        with mock.patch.dict(os.environ, {"FROM_ENV": "x"}):
+            self.assertEqual(ConfigManager.get("FROM_ENV"), "x")
+        self.assertIsNone(ConfigManager.get("FROM_ENV"))
+        self.assertEqual(ConfigManager.get("MISSING", "default"), "default")
+        self.assertIsNone(ConfigManager.get("MISSING"))
+        self.assertEqual(self.path.stat().st_mtime_ns, mtime)
+        ConfigManager.set("B", "2")
+        self.assertEqual(self.read(), {"A": "1", "B": "2"})
+
+    def test_snapshot_never_writes(self):
+        ConfigManager.snapshot()
+        mtime = self.path.stat().st_mtime_ns
+        with mock.patch.dict(os.environ, {"FROM_ENV": "x"}):
+            self.assertEqual(ConfigManager.get("FROM_ENV"), "x")
+        self.assertEqual(ConfigManager.get("MISSING", "default"), "default")
+        ConfigManager.set("B", "2")
+        self.assertEqual(ConfigManager.get("B"), "2")
+        self.assertEqual(self.path.stat().st_mtime_ns, mtime)
+        self.assertEqual(self.read(), {"A": "1"})
+
+    def test_snapshot_without_file(self):
+        self.path.unlink()
+        ConfigManager.snapshot()
+        self.assertTrue(ConfigManager.read_only())
+        self.assertIsNone(ConfigManager.get("A"))
+        self.assertFalse(self.path.exists())
+
+    def test_set_envs_writes_only_changes(self):
+        with mock.patch.object(ConfigManager, "_save_config") as save:
+            EnvTranslator(envs={"ENVTEST_KEY": "k"})
+            self.assertEqual(save.call_count, 1)
+            translator = EnvTranslator(envs={"ENVTEST_KEY": "k"})
+            EnvTranslator()
+            self.assertEqual(save.call_count, 1)
+        # 修改实例的 envs 不影响配置
+        translator.envs["ENVTEST_KEY"] = "other"
+        self.assertEqual(
+            ConfigManager.get_translator_by_name("envtest")["ENVTEST_KEY"], "k"
+        )
+
+    def test_snapshot_keeps_translator_envs_per_instance(self):
+        ConfigManager.snapshot()
+        first = EnvTranslator(envs={"ENVTEST_KEY": "k1"})
+        second = EnvTranslator()
+        self.assertEqual(first.envs["ENVTEST_KEY"], "k1")
+        self.assertIsNone(second.envs["ENVTEST_KEY"])
+        self.assertIsNone(ConfigManager.get_translator_by_name("envtest"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,18 @@
 import unittest
 from unittest.mock import Mock, patch, MagicMock
+import numpy as np
 from pdfminer.layout import LTPage, LTChar, LTLine
 from pdfminer.pdfinterp import PDFResourceManager
-from pdf2zh.converter import PDFConverterEx, TranslateConverter
+from pdf2zh.converter import (
+    ContentStreamWriter,
+    FormulaClassifier,
+    PageChars,
+    PDFConverterEx,
+    TranslateConverter,
+    hex_codes,
+    tokenize_placeholders,
+)
+from pdf2zh.translator import GoogleTranslator
 
 
 class TestPDFConverterEx(unittest.TestCase):
@@ -25,8 +35,12 @@ class TestPDFConverterEx(unittest.TestCase):
         mock_font.to_unichr.return_value = "A"
         mock_font.char_width.return_value = 10
         mock_font.char_disp.return_value = (0, 0)
+        mock_font.is_vertical.return_value = False
+        mock_font.get_descent.return_value = 0
+        mock_font.fontname = "mock_font"
         graphic_state = Mock()
-        self.converter.cur_item = Mock()
+        self.converter.cur_item = LTPage(1, (0, 0, 100, 200))
+        self.converter.cur_item.chars = PageChars()
         result = self.converter.render_char(
             mock_matrix,
             mock_font,
@@ -38,6 +52,11 @@ class TestPDFConverterEx(unittest.TestCase):
             graphicstate=graphic_state,
         )
         self.assertEqual(result, 120.0)  # Expected text width
+        chars = self.converter.cur_item.chars.freeze()
+        self.assertEqual(chars.text, ["A"])
+        self.assertEqual(chars.cid.tolist(), [65])
+        self.assertEqual(chars.fontname(0), "mock_font")
+        self.assertEqual(chars.seq.tolist(), [0])
 
 
 class TestTranslateConverter(unittest.TestCase):
@@ -94,6 +113,121 @@ class TestTranslateConverter(unittest.TestCase):
         self.converter.thread = 1
         result = self.converter.receive_layout(ltpage)
         self.assertIsNotNone(result)
+        self.assertEqual(set(self.converter.timings), {"parse", "translate", "typeset"})
+        self.assertTrue(all(t >= 0 for t in self.converter.timings.values()))
+
+    def test_dry_run_skips_typesetting(self):
+        ltpage = LTPage(1, (0, 0, 500, 500))
+        ltpage.add(LTLine(0.1, (0, 0), (10, 20)))
+        mock_layout = MagicMock()
+        mock_layout.shape = (100, 100)
+        mock_layout.__getitem__.return_value = -1
+        self.converter.layout = [None, mock_layout]
+        self.converter.thread = 1
+        self.converter.dry_run = True
+        self.assertEqual(self.converter.receive_layout(ltpage), b"")
+        self.assertEqual(self.converter.timings["typeset"], 0.0)
+
+    def test_receive_layout_splits_formulas(self):
+        # 两个段落：正文中有公式字体的 x 和角标 i，第二段为纯文本
+        ltpage = LTPage(1, (0, 0, 500, 500))
+        ltpage.chars = PageChars()
+        x = 10
+        for text, fontname, size, y0 in [
+            *[(c, "Times", 10, 100) for c in "Let "],
+            ("x", "CMMI10", 10, 100),
+            ("i", "Times", 6, 97),
+            *[(c, "Times", 10, 100) for c in " be"],
+        ]:
+            width = size / 2
+            ltpage.chars.append(
+                text, x, y0, x + width, y0 + size, size, 0, None, False, 0, fontname
+            )
+            x += width
+        for i, text in enumerate("Done"):
+            ltpage.chars.append(
+                text, 10 + i * 5, 300, 15 + i * 5, 310, 10, 0, None, False, 0, "Times"
+            )
+        layout = np.ones((500, 500), dtype=int)
+        layout[200:] = 2  # 第二段属于另一个版面区域
+        self.converter.layout = {1: layout}
+        self.converter.thread = 1
+        self.converter.dry_run = True
+        with patch.object(
+            self.converter, "dry_run_worker", side_effect=lambda s: s
+        ) as worker:
+            self.converter.receive_layout(ltpage)
+        self.assertEqual(
+            [c.args[0] for c in worker.call_args_list], ["Let {v0} be", "Done"]
+        )
+
+    def test_paragraph_dedupe(self):
+        import concurrent.futures
+
+        calls = []
+
+        def worker(s):
+            calls.append(s)
+            return s.upper()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                self.converter.submit_paragraph(executor, worker, s)
+                for s in ["Header text", "Header  text ", "{v0}", " ", "Body"]
+            ]
+            news = [future.result() for future in futures]
+        self.assertEqual(news, ["HEADER TEXT", "HEADER TEXT", "{v0}", " ", "BODY"])
+        # 跨页面的重复段落直接复用结果
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            future = self.converter.submit_paragraph(executor, worker, "Header text")
+            self.assertEqual(future.result(), "HEADER TEXT")
+        self.assertEqual(sorted(calls), ["Body", "Header text"])
+        self.assertEqual(
+            self.converter.stats, {"paragraphs": 4, "unique": 2, "failed": 0}
+        )
+
+    def test_dry_run_estimate(self):
+        import concurrent.futures
+
+        translator = GoogleTranslator("en", "zh", None)
+        translator.cache = Mock()
+        converter = TranslateConverter(
+            self.rsrcmgr,
+            thread=2,
+            layout=self.layout,
+            lang_in="en",
+            lang_out="zh",
+            service="google",
+            dry_run=True,
+            translator=translator,
+        )
+        self.assertIs(converter.translator, translator)
+        converter.translator.cache.get.side_effect = lambda s: (
+            "缓存" if s == "Cached" else None
+        )
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            for s in ["Cached", "Body text", "Body  text", "{v0}", "More"]:
+                converter.submit_paragraph(executor, converter.dry_run_worker, s)
+        self.assertEqual(converter.stats["cached"], 1)
+        self.assertEqual(converter.stats["characters"], len("Body text") + len("More"))
+
+        ledger = Mock()
+        ledger.throughput.return_value = {"requests": 10, "seconds_per_request": 2.0}
+        with (
+            patch("pdf2zh.converter.get_ledger", return_value=ledger),
+            patch(
+                "pdf2zh.converter.price_data.get_price",
+                return_value={"input": 1.0, "output": 2.0},
+            ),
+        ):
+            estimate = converter.estimate(elapsed=3.0)
+        self.assertEqual(estimate["paragraphs"], 4)
+        self.assertEqual(estimate["unique"], 3)
+        self.assertEqual(estimate["requests"], 2)
+        self.assertEqual(estimate["output_tokens"], 3)
+        self.assertEqual(estimate["input_tokens"], 3)  # 非 LLM 服务没有提示词开销
+        self.assertEqual(estimate["cost"], round(3 / 1e6 * 1.0 + 3 / 1e6 * 2.0, 6))
+        self.assertEqual(estimate["seconds"], 3.0 + 2 * 2.0 / 2)
 
     def test_invalid_translation_service(self):
         with self.assertRaises(ValueError):
@@ -106,5 +240,79 @@ class TestTranslateConverter(unittest.TestCase):
             )
 
 
+class TestFormulaClassifier(unittest.TestCase):
+    def test_latex_font(self):
+        classifier = FormulaClassifier()
+        self.assertTrue(classifier("ABCDEF+CMMI10", "x"))
+        self.assertTrue(classifier(b"ABCDEF+CMSY10", "a"))
+        self.assertFalse(classifier("ABCDEF+CMR10", "a"))
+        self.assertFalse(classifier(b"\xff\xfe", "a"))
+
+    def test_char_rules(self):
+        classifier = FormulaClassifier()
+        self.assertTrue(classifier("Times", "(cid:12)"))
+        self.assertTrue(classifier("Times", "α"))
+        self.assertTrue(classifier("Times", "∑"))
+        self.assertFalse(classifier("Times", " "))
+        self.assertFalse(classifier("Times", ""))
+        self.assertFalse(classifier("Times", "a"))
+
+    def test_custom_patterns(self):
+        classifier = FormulaClassifier(vfont="Times", vchar="[0-9]")
+        self.assertTrue(classifier("ABCDEF+Times-Roman", "a"))
+        self.assertFalse(classifier("ABCDEF+CMMI10", "a"))
+        self.assertTrue(classifier("Arial", "7"))
+        self.assertFalse(classifier("Arial", "α"))
+
+    def test_classify_page(self):
+        classifier = FormulaClassifier()
+        chars = PageChars()
+        for fontname, text in [("CMMI10", "x"), ("CMR10", "a"), ("CMR10", "α")]:
+            chars.append(text, 0, 0, 1, 1, 10, 0, None, False, 0, fontname=fontname)
+        flags = classifier.classify_chars(chars.freeze())
+        self.assertEqual(flags.tolist(), [True, False, True])
+        self.assertEqual(classifier._font_cache, {"CMMI10": True, "CMR10": False})
+
+
+class TestTokenizePlaceholders(unittest.TestCase):
+    def test_text_and_placeholders(self):
+        tokens = list(tokenize_placeholders("a {v0} b{ V 1 2 }c{v3}"))
+        self.assertEqual(tokens, ["a ", (0,), " b", (12,), "c", (3,)])
+
+    def test_invalid_placeholder_dropped(self):
+        self.assertEqual(list(tokenize_placeholders("x{v }y")), ["x", "y"])
+        self.assertEqual(list(tokenize_placeholders("{vx}")), ["{vx}"])
+        self.assertEqual(list(tokenize_placeholders("")), [])
+
+    def test_long_paragraph(self):
+        text = "word {v1} " * 500
+        tokens = list(tokenize_placeholders(text))
+        self.assertEqual(len(tokens), 1001)
+        self.assertEqual(
+            "".join(t for t in tokens if isinstance(t, str)), "word  " * 500
+        )
+
+
+class TestContentStreamWriter(unittest.TestCase):
+    def test_hex_codes(self):
+        self.assertEqual(hex_codes([0x41, 0x42], False), b"4142")
+        self.assertEqual(hex_codes([0x41, 0x3042], True), b"00413042")
+        self.assertEqual(hex_codes([0x141], False), b"141")
+
+    def test_font_switch_reuse(self):
+        writer = ContentStreamWriter()
+        writer.text("tiro", 10, 1, 2, b"41")
+        writer.text("tiro", 10, 3.5, 2, b"42")
+        writer.line(0, 0, 10, 0, 1)
+        writer.text("noto", 10, 5, 2, b"0043")
+        self.assertEqual(
+            writer.getvalue(),
+            b"BT /tiro 10.000 Tf 1 0 0 1 1.000 2.000 Tm [<41>] TJ "
+            b"1 0 0 1 3.500 2.000 Tm [<42>] TJ "
+            b"ET q 1 0 0 1 0.000 0.000 cm [] 0 d 0 J 1.000 w 0 0 m 10.000 0.000 l S Q BT "
+            b"/noto 10.000 Tf 1 0 0 1 5.000 2.000 Tm [<0043>] TJ ET ",
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
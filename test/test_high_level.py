@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import Mock
+
+from pymupdf import Document
+
+from pdf2zh.high_level import (
+    extract_pages,
+    merge_shards,
+    page_timings,
+    partial_mono,
+    shard_pages,
+)
+
+
+def make_pdf(texts):
+    doc = Document()
+    for text in texts:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.write()
+
+
+def page_texts(stream):
+    return [page.get_text().strip() for page in Document(stream=stream)]
+
+
+class TestSharding(unittest.TestCase):
+    def test_shard_pages(self):
+        self.assertEqual(shard_pages(5, 2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(shard_pages(5, 10), [[0, 1, 2, 3, 4]])
+        self.assertEqual(shard_pages(5, 2, pages=[4, 0, 3, 9]), [[0, 3], [4]])
+        self.assertEqual(shard_pages(0, 2), [])
+
+    def test_extract_pages(self):
+        stream = make_pdf(["a", "b", "c"])
+        self.assertEqual(page_texts(extract_pages(stream, [0, 2])), ["a", "c"])
+
+    def test_merge_shards(self):
+        source = make_pdf(["one", "two", "three", "four"])
+        shards = [
+            ([0, 1], make_pdf(["un", "deux"])),
+            ([3], make_pdf(["quatre"])),
+        ]
+        mono, dual = merge_shards(source, shards, skip_subset_fonts=True)
+        # 第三页不在任何分片中，保留原文
+        self.assertEqual(page_texts(mono), ["un", "deux", "three", "quatre"])
+        self.assertEqual(
+            page_texts(dual),
+            ["one", "un", "two", "deux", "three", "three", "four", "quatre"],
+        )
+
+
+class TestProgress(unittest.TestCase):
+    def test_partial_mono(self):
+        doc = Document(stream=make_pdf(["one", "two", "three"]))
+        # 用第二页的内容流替换第一页，模拟已翻译的页面
+        obj_patch = {doc[0].get_contents()[0]: doc[1].read_contents()}
+        stream = partial_mono(doc, obj_patch, [2, 0])
+        self.assertEqual(page_texts(stream), ["two", "three"])
+        # 原文档不受影响
+        self.assertEqual(doc.page_count, 3)
+        self.assertEqual(doc[0].get_text().strip(), "one")
+
+    def test_page_timings(self):
+        device = Mock(timings={"parse": 0.12345, "translate": 2.0, "typeset": 0.5})
+        self.assertEqual(
+            page_timings(device, 1.23456),
+            {"parse": 0.123, "translate": 2.0, "typeset": 0.5, "layout": 1.235},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
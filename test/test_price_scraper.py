@@ -1,3 +1,4 @@
+import os
 import pytest
 from unittest.mock import patch, MagicMock
 import json
@@ -106,4 +107,49 @@ class TestPriceScraper:
         # 価格を保存しても自動更新は無効
         test_prices = {"gpt-4": {"input": 30.0, "output": 60.0}}
         price_data.save_prices(test_prices)
-        assert price_data.update_if_needed() is False
\ No newline at end of file
+        assert price_data.update_if_needed() is False
+
+    def test_get_price_prefix_and_alias(self, tmp_path):
+        """日付付きモデル名・別名・プロバイダー付きモデル名の価格取得テスト"""
+        price_data = PriceData(tmp_path / "openai_pricing.json")
+
+        # ファイルがなくてもデフォルト価格を使う
+        assert price_data.get_price("gpt-4o") == {"input": 2.5, "output": 10.0}
+        assert price_data.get_price("gpt-4o-2024-08-06") == {"input": 2.5, "output": 10.0}
+        assert price_data.get_price("gpt-4o-mini-2024-07-18") == {"input": 0.15, "output": 0.6}
+        assert price_data.get_price("openai/gpt-4.1-mini") == {"input": 0.4, "output": 1.6}
+        assert price_data.get_price("chatgpt-4o-latest") == {"input": 2.5, "output": 10.0}
+        # "-" 区切りでないものは一致させない
+        assert price_data.get_price("gpt-4oo") is None
+
+    def test_get_price_does_not_match_variants(self, tmp_path):
+        """接尾辞が日付・バージョンでない派生モデルは別モデルとして扱うテスト"""
+        price_data = PriceData(tmp_path / "openai_pricing.json")
+
+        assert price_data.get_price("gpt-4-0613") == {"input": 30.0, "output": 60.0}
+        assert price_data.get_price("gpt-3.5-turbo-1106") == {"input": 0.5, "output": 1.5}
+        assert price_data.get_price("gpt-4.1-nano") is None
+        assert price_data.get_price("gpt-4.1-nano-2025-04-14") is None
+        assert price_data.get_price("o3-mini") is None
+        assert price_data.get_price("gpt-4o-audio-preview") is None
+
+    def test_get_price_reloads_on_change(self, tmp_path):
+        """ファイルが更新された時だけ読み直すテスト"""
+        price_file = tmp_path / "openai_pricing.json"
+        price_data = PriceData(price_file)
+        price_data.save_prices({"my-model": {"input": 1.0, "output": 2.0}})
+
+        with patch.object(price_data, "load_prices", wraps=price_data.load_prices) as load:
+            assert price_data.get_price("my-model") == {"input": 1.0, "output": 2.0}
+            assert price_data.get_price("my-model") == {"input": 1.0, "output": 2.0}
+            assert load.call_count == 1
+
+        price_data.save_prices({"my-model": {"input": 3.0, "output": 4.0}})
+        os.utime(price_file, (0, 12345))
+        assert price_data.get_price("my-model") == {"input": 3.0, "output": 4.0}
+
+    def test_price_table_is_immutable(self, tmp_path):
+        """価格表は変更できない"""
+        price_data = PriceData(tmp_path / "openai_pricing.json")
+        with pytest.raises(TypeError):
+            price_data.get_price("gpt-4")["input"] = 0
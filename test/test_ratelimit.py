@@ -0,0 +1,276 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from pdf2zh import cache
+from pdf2zh.ratelimit import (
+    AdaptiveConcurrencyLimiter,
+    RateBudget,
+    RetryExhaustedError,
+    RetryPolicy,
+    TokenBucket,
+    UntranslatableError,
+    estimate_tokens,
+    is_overload,
+    retry_after,
+)
+from pdf2zh.translator import BaseTranslator
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+class ThrottledTranslator(BaseTranslator):
+    name = "throttled"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = []
+
+    def do_translate(self, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        return text.upper()
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(retry_after(http_error(429, {"Retry-After": "3"})), 3.0)
+
+    def test_milliseconds(self):
+        exc = http_error(429, {"retry-after-ms": "1500", "Retry-After": "3"})
+        self.assertEqual(retry_after(exc), 1.5)
+
+    def test_http_date_in_past(self):
+        exc = http_error(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(retry_after(exc), 0.0)
+
+    def test_missing(self):
+        self.assertIsNone(retry_after(http_error(429)))
+        self.assertIsNone(retry_after(ValueError("boom")))
+
+    def test_is_overload(self):
+        self.assertTrue(is_overload(http_error(429)))
+        self.assertTrue(is_overload(requests.exceptions.ReadTimeout()))
+        self.assertFalse(is_overload(http_error(500)))
+        self.assertFalse(is_overload(ValueError("boom")))
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    def test_acquire_up_to_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(2)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(limiter.state()["inflight"], 2)
+        limiter.release(latency=0.1)
+        self.assertEqual(limiter.state()["inflight"], 1)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveConcurrencyLimiter(8)
+        limiter.acquire()
+        limiter.release(error=http_error(429))
+        self.assertEqual(limiter.state()["limit"], 4)
+        # 同一轮内的其他 429 不再重复降低
+        limiter.acquire()
+        limiter.release(error=http_error(429))
+        self.assertEqual(limiter.state()["limit"], 4)
+        self.assertEqual(limiter.state()["throttle_rate"], 1.0)
+
+    def test_min_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(2, initial_limit=1)
+        with mock.patch(
+            "pdf2zh.ratelimit.time.monotonic", side_effect=[10, 10, 20, 20]
+        ):
+            for _ in range(2):
+                limiter.acquire()
+                limiter.release(error=http_error(429))
+        self.assertEqual(limiter.state()["limit"], 1)
+
+    def test_additive_increase(self):
+        limiter = AdaptiveConcurrencyLimiter(4, initial_limit=1)
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(latency=0.1)
+        self.assertEqual(limiter.state()["limit"], 4)
+
+    def test_no_increase_when_latency_grows(self):
+        limiter = AdaptiveConcurrencyLimiter(4, initial_limit=2)
+        limiter.acquire()
+        limiter.release(latency=0.1)
+        limit = limiter.limit
+        limiter.acquire()
+        limiter.release(latency=1.0)
+        self.assertEqual(limiter.limit, limit)
+
+    def test_retry_after_blocks(self):
+        limiter = AdaptiveConcurrencyLimiter(4)
+        limiter.acquire()
+        limiter.release(error=http_error(429, {"Retry-After": "5"}))
+        with mock.patch.object(limiter._cond, "wait", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                limiter.acquire()
+        self.assertEqual(limiter.state()["inflight"], 0)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("pdf2zh.ratelimit.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_classification(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.is_retryable(http_error(429)))
+        self.assertTrue(policy.is_retryable(http_error(503)))
+        self.assertTrue(policy.is_retryable(requests.exceptions.ConnectTimeout()))
+        self.assertTrue(policy.is_retryable(RuntimeError("unknown")))
+        self.assertFalse(policy.is_retryable(http_error(401)))
+        self.assertFalse(policy.is_retryable(TypeError("bad argument")))
+        # 格式错误的响应可能是临时的，重试后再放弃
+        self.assertTrue(policy.is_retryable(json.JSONDecodeError("bad", "", 0)))
+        self.assertTrue(policy.is_retryable(KeyError("translations")))
+        self.assertTrue(policy.is_retryable(IndexError("list index out of range")))
+
+    def test_retry_until_success(self):
+        fn = mock.Mock(side_effect=[http_error(500), http_error(429), "ok"])
+        self.assertEqual(RetryPolicy().call(fn, "text"), "ok")
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_fatal_raises_immediately(self):
+        fn = mock.Mock(side_effect=http_error(401))
+        with self.assertRaises(requests.HTTPError):
+            RetryPolicy().call(fn)
+        fn.assert_called_once()
+        self.sleep.assert_not_called()
+
+    def test_malformed_response_retried(self):
+        fn = mock.Mock(side_effect=[json.JSONDecodeError("bad", "", 0), "ok"])
+        self.assertEqual(RetryPolicy().call(fn), "ok")
+        fn = mock.Mock(side_effect=KeyError("translations"))
+        with self.assertRaises(RetryExhaustedError):
+            RetryPolicy(max_attempts=2).call(fn)
+        self.assertEqual(fn.call_count, 2)
+
+    def test_untranslatable_not_retried(self):
+        fn = mock.Mock(side_effect=UntranslatableError("runaway output"))
+        with self.assertRaises(RetryExhaustedError):
+            RetryPolicy().call(fn)
+        fn.assert_called_once()
+
+    def test_max_attempts(self):
+        fn = mock.Mock(side_effect=http_error(502))
+        with self.assertRaises(RetryExhaustedError) as cm:
+            RetryPolicy(max_attempts=3).call(fn)
+        self.assertEqual(cm.exception.attempts, 3)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_deadline(self):
+        fn = mock.Mock(side_effect=http_error(429, {"Retry-After": "60"}))
+        with self.assertRaises(RetryExhaustedError):
+            RetryPolicy(deadline=30).call(fn)
+        fn.assert_called_once()
+
+    def test_jittered_backoff(self):
+        policy = RetryPolicy(base_delay=1, max_delay=8)
+        for attempt in range(1, 8):
+            self.assertLessEqual(policy.delay(attempt, http_error(500)), 8)
+        self.assertEqual(policy.delay(1, http_error(429, {"Retry-After": "2"})), 2)
+
+    def test_marker_from_config(self):
+        with mock.patch("pdf2zh.ratelimit.ConfigManager.get", return_value=None):
+            self.assertEqual(RetryPolicy.from_config().marker, "[untranslated] ")
+        config = {"UNTRANSLATED_MARKER": ""}
+        with mock.patch("pdf2zh.ratelimit.ConfigManager.get", side_effect=config.get):
+            self.assertEqual(RetryPolicy.from_config().marker, "")
+
+
+def take_in_process(path, results):
+    bucket = TokenBucket("shared", 1, 5, path=path)
+    results.put(sum(bucket.try_take(1) == 0 for _ in range(5)))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket("test", 2, 4, path=self.path)
+        with mock.patch("pdf2zh.ratelimit.time.time", return_value=100.0):
+            for _ in range(4):
+                self.assertEqual(bucket.try_take(1), 0)
+            self.assertEqual(bucket.try_take(1), 0.5)
+        with mock.patch("pdf2zh.ratelimit.time.time", return_value=100.5):
+            self.assertEqual(bucket.try_take(1), 0)
+
+    def test_amount_larger_than_capacity(self):
+        bucket = TokenBucket("test", 1, 10, path=self.path)
+        self.assertEqual(bucket.try_take(100), 0)
+
+    def test_shared_across_processes(self):
+        TokenBucket("shared", 1, 5, path=self.path).take(3)
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=take_in_process, args=(self.path, results)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(results.get(timeout=5), 2)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("a" * 40), 20)
+        self.assertEqual(estimate_tokens("a" * 40, include_output=False), 10)
+        self.assertEqual(estimate_tokens("", include_output=False), 1)
+
+    def test_budget_from_config(self):
+        config = {"OPENAI_QPS": "2", "OPENAI_TPM": 600}
+        with mock.patch("pdf2zh.ratelimit.ConfigManager.get", side_effect=config.get):
+            self.assertIsNone(RateBudget.from_config("bing", path=self.path))
+            budget = RateBudget.from_config("openai", path=self.path)
+        self.assertEqual(budget.qps.rate, 2)
+        self.assertEqual(budget.tpm.rate, 10)
+        self.assertEqual(budget.tpm.capacity, 600)
+
+
+class TestTranslatorLimiter(unittest.TestCase):
+    def setUp(self):
+        self.test_db = cache.init_test_db()
+
+    def tearDown(self):
+        cache.clean_test_db(self.test_db)
+
+    def test_translate_feeds_limiter(self):
+        translator = ThrottledTranslator("en", "zh", "test", False)
+        translator.limiter = AdaptiveConcurrencyLimiter(4)
+        translator.errors.append(http_error(429))
+        with self.assertRaises(requests.HTTPError):
+            translator.translate("hello")
+        self.assertEqual(translator.limiter.state()["limit"], 2)
+        self.assertEqual(translator.translate("hello"), "HELLO")
+        self.assertEqual(translator.limiter.state()["inflight"], 0)
+
+    def test_translate_takes_budget(self):
+        translator = ThrottledTranslator("en", "zh", "test", False)
+        translator.budget = mock.Mock()
+        translator.translate("hello world")
+        translator.translate("hello world")
+        translator.budget.acquire.assert_called_once_with(4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,31 @@
+import json
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from textwrap import dedent
+from urllib.parse import parse_qs
 from unittest import mock
 
+import openai
 from ollama import ResponseError as OllamaResponseError
 
 from pdf2zh import cache
 from pdf2zh.config import ConfigManager
-from pdf2zh.translator import BaseTranslator, OllamaTranslator, OpenAIlikedTranslator
+from pdf2zh.translator import (
+    AzureOpenAITranslator,
+    BaseTranslator,
+    BingTranslator,
+    OllamaTranslator,
+    OpenAIlikedTranslator,
+    PlamoAPITranslator,
+    StreamAbortedError,
+    StreamGuard,
+    XinferenceTranslator,
+    ZhipuTranslator,
+    cached_tokens,
+    load_glossary,
+)
+from pdf2zh.usage import collect as collect_usage
 
 # Since it is necessary to test whether the functionality meets the expected requirements,
 # private functions and private methods are allowed to be called.
@@ -77,6 +96,16 @@ class TestTranslator(unittest.TestCase):
         another_result = translator.translate(text)
         self.assertNotEqual(second_result, another_result)
 
+    def test_translate_batch(self):
+        translator = AutoIncreaseTranslator("en", "zh", "test", False)
+        self.assertEqual(translator.translate("cached"), "1")
+        results = translator.translate_batch(["a", "cached", "b", "a"])
+        self.assertEqual(results, ["2", "1", "3", "2"])
+        # 批量翻译的结果同样写入缓存
+        self.assertEqual(translator.translate("b"), "3")
+        self.assertEqual(translator.translate_batch(["a", "b"]), ["2", "3"])
+        self.assertEqual(translator.n, 3)
+
     def test_base_translator_throw(self):
         translator = BaseTranslator("en", "zh", "test", False)
         with self.assertRaises(NotImplementedError):
@@ -91,6 +120,84 @@ class TestOpenAIlikedTranslator(unittest.TestCase):
             "OPENAILIKED_MODEL": "test_model",
         }
 
+    @mock.patch("pdf2zh.translator.check_daily_limit")
+    @mock.patch("pdf2zh.translator.log_usage")
+    def test_cacheable_prompt_prefix(self, mock_log_usage, _):
+        translator = OpenAIlikedTranslator(
+            lang_in="en", lang_out="zh", model=None, envs=self.default_envs
+        )
+        translator.glossary = {"transformer": "Transformer"}
+        response = mock.Mock()
+        response.choices = [mock.Mock()]
+        response.choices[0].message.content = "译文"
+        response.usage.prompt_tokens = 1200
+        response.usage.completion_tokens = 10
+        response.usage.prompt_tokens_details.cached_tokens = 1024
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.completions.create.return_value = response
+            translator.do_translate("first paragraph")
+            first = mock_client.chat.completions.create.call_args.kwargs["messages"]
+            translator.do_translate("second paragraph")
+            second = mock_client.chat.completions.create.call_args.kwargs["messages"]
+        # 固定的 system 前缀在前，段落文本在后
+        self.assertEqual(first[0], second[0])
+        self.assertIn("transformer -> Transformer", first[0]["content"])
+        self.assertEqual(second[-1], {"role": "user", "content": "second paragraph"})
+        self.assertEqual(mock_log_usage.call_args.kwargs["cached_tokens"], 1024)
+
+    @mock.patch("pdf2zh.translator.check_daily_limit")
+    def test_rate_limit_left_to_retry_policy(self, _):
+        translator = OpenAIlikedTranslator(
+            lang_in="en", lang_out="zh", model=None, envs=self.default_envs
+        )
+        response = mock.Mock(status_code=429, headers={})
+        error = openai.RateLimitError("rate limited", response=response, body=None)
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.completions.create.side_effect = error
+            with self.assertRaises(openai.RateLimitError):
+                translator.do_translate("paragraph")
+        # 429 交给 RetryPolicy 处理，翻译器内部不再重试
+        mock_client.chat.completions.create.assert_called_once()
+
+    @mock.patch("pdf2zh.translator.check_daily_limit")
+    @mock.patch("pdf2zh.translator.log_usage")
+    def test_stream_without_usage(self, mock_log_usage, _):
+        translator = OpenAIlikedTranslator(
+            lang_in="en", lang_out="zh", model=None, envs=self.default_envs
+        )
+        translator.stream_guard = StreamGuard(enabled=True)
+        chunks = [
+            mock.Mock(usage=None, choices=[mock.Mock(delta=mock.Mock(content=piece))])
+            for piece in ["天空", "是蓝色的"]
+        ]
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.completions.create.return_value = iter(chunks)
+            with self.assertLogs("pdf2zh.translator", "WARNING"):
+                self.assertEqual(translator.do_translate("The sky is blue"), "天空是蓝色的")
+        # 服务未返回用量时按字符数估算，不中断翻译
+        kwargs = mock_log_usage.call_args.kwargs
+        self.assertGreater(kwargs["input_tokens"], 0)
+        self.assertEqual(kwargs["output_tokens"], len("天空是蓝色的".encode()) // 4)
+
+    def test_cached_tokens(self):
+        usage = mock.Mock(spec=["prompt_tokens_details"])
+        usage.prompt_tokens_details.cached_tokens = 512
+        self.assertEqual(cached_tokens(usage), 512)
+        usage = mock.Mock(spec=["prompt_cache_hit_tokens"], prompt_cache_hit_tokens=64)
+        self.assertEqual(cached_tokens(usage), 64)
+        self.assertEqual(cached_tokens(mock.Mock(spec=[])), 0)
+
+    def test_load_glossary(self):
+        with mock.patch(
+            "pdf2zh.translator.ConfigManager.get",
+            return_value="attention = 注意力\nbad line\nLLM=大语言模型",
+        ):
+            self.assertEqual(
+                load_glossary(), {"attention": "注意力", "LLM": "大语言模型"}
+            )
+        with mock.patch("pdf2zh.translator.ConfigManager.get", return_value=None):
+            self.assertEqual(load_glossary(), {})
+
     def test_missing_base_url_raises_error(self):
         """测试缺失 OPENAILIKED_BASE_URL 时抛出异常"""
         ConfigManager.clear()
@@ -152,6 +259,72 @@ class TestOpenAIlikedTranslator(unittest.TestCase):
         self.assertIsNone(translator.envs["OPENAILIKED_API_KEY"])
 
 
+def chat_response(content, prompt_tokens=100, completion_tokens=20, cached=64):
+    response = mock.Mock()
+    response.choices = [mock.Mock()]
+    response.choices[0].message.content = content
+    response.choices[0].text = content
+    response.usage.prompt_tokens = prompt_tokens
+    response.usage.completion_tokens = completion_tokens
+    response.usage.prompt_tokens_details.cached_tokens = cached
+    return response
+
+
+@mock.patch("pdf2zh.translator.log_usage")
+class TestUsageReporting(unittest.TestCase):
+    def assert_logged(self, mock_log_usage, model):
+        mock_log_usage.assert_called_once()
+        self.assertEqual(mock_log_usage.call_args.args, (120,))
+        kwargs = mock_log_usage.call_args.kwargs
+        self.assertEqual(kwargs["model"], model)
+        self.assertEqual(kwargs["input_tokens"], 100)
+        self.assertEqual(kwargs["output_tokens"], 20)
+        self.assertEqual(kwargs["cached_tokens"], 64)
+
+    def test_zhipu(self, mock_log_usage):
+        translator = ZhipuTranslator("en", "zh", None, envs={"ZHIPU_API_KEY": "k"})
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.completions.create.return_value = chat_response("译文")
+            self.assertEqual(translator.do_translate("text"), "译文")
+        self.assert_logged(mock_log_usage, "glm-4-flash")
+
+    @mock.patch("pdf2zh.translator.openai.AzureOpenAI")
+    def test_azure_openai(self, mock_azure, mock_log_usage):
+        translator = AzureOpenAITranslator(
+            "en", "zh", None, envs={"AZURE_OPENAI_BASE_URL": "https://x"}
+        )
+        client = mock_azure.return_value
+        client.chat.completions.create.return_value = chat_response("译文")
+        self.assertEqual(translator.do_translate("text"), "译文")
+        self.assert_logged(mock_log_usage, "gpt-4o-mini")
+
+    def test_plamo_api(self, mock_log_usage):
+        with mock.patch("builtins.print"):  # 初始化时输出调试信息
+            translator = PlamoAPITranslator(
+                "en", "ja", None, envs={"PLAMO_TRANSLATE_API_KEY": "k"}
+            )
+        translator.stream_guard = StreamGuard(enabled=False)
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.completions.create.return_value = chat_response("訳文")
+            self.assertEqual(translator.do_translate("text"), "訳文")
+        self.assert_logged(mock_log_usage, "plamo-2.0-translate")
+
+    @mock.patch("pdf2zh.translator.xinference_client.RESTfulClient")
+    def test_xinference(self, mock_client, mock_log_usage):
+        translator = XinferenceTranslator("en", "zh", None)
+        mock_client.return_value.get_model.return_value.chat.return_value = {
+            "choices": [{"message": {"content": "译文"}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20},
+        }
+        with collect_usage() as usage:
+            self.assertEqual(translator.do_translate("text"), "译文")
+        summary = usage.summary()
+        self.assertEqual(summary["input_tokens"], 100)
+        self.assertEqual(summary["output_tokens"], 20)
+        self.assertEqual(summary["cost"], 0)  # 本地模型不计费
+        mock_log_usage.assert_not_called()
+
+
 class TestOllamaTranslator(unittest.TestCase):
     def test_do_translate(self):
         translator = OllamaTranslator(lang_in="en", lang_out="zh", model="test:3b")
@@ -184,6 +357,78 @@ class TestOllamaTranslator(unittest.TestCase):
             with self.assertRaises(OllamaResponseError):
                 mock_client.chat()
 
+    def test_per_request_options_and_keep_alive(self):
+        translator = OllamaTranslator(lang_in="en", lang_out="zh", model="test:3b")
+        translator.keep_alive = "30m"
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.return_value.message.content = "译文"
+            translator.do_translate("x" * 1000)
+            kwargs = mock_client.chat.call_args.kwargs
+            self.assertEqual(kwargs["options"]["num_predict"], 5000)
+            self.assertEqual(kwargs["keep_alive"], "30m")
+            # 长段落不会改变其他请求使用的共享配置
+            self.assertEqual(translator.options["num_predict"], 2000)
+            translator.keep_alive = "-1"
+            translator.do_translate("short")
+            self.assertEqual(mock_client.chat.call_args.kwargs["keep_alive"], -1)
+
+    def test_system_prompt_mode(self):
+        translator = OllamaTranslator(lang_in="en", lang_out="zh", model="test:3b")
+        translator.system_prompt_mode = True
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.return_value.message.content = "译文"
+            translator.do_translate("first")
+            first = mock_client.chat.call_args.kwargs["messages"]
+            translator.do_translate("second")
+            second = mock_client.chat.call_args.kwargs["messages"]
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[0]["role"], "system")
+        self.assertEqual(second[1], {"role": "user", "content": "second"})
+
+    def test_do_translate_batch(self):
+        translator = OllamaTranslator(lang_in="en", lang_out="zh", model="test:3b")
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.return_value.message.content = (
+                '{"translations": ["一", "二"]}'
+            )
+            self.assertEqual(translator.do_translate_batch(["one", "two"]), ["一", "二"])
+            self.assertEqual(mock_client.chat.call_count, 1)
+            self.assertEqual(mock_client.chat.call_args.kwargs["format"], "json")
+            # 格式错误时逐段翻译
+            mock_client.chat.return_value.message.content = '{"translations": ["一"]}'
+            translator.do_translate_batch(["one", "two"])
+            self.assertEqual(mock_client.chat.call_count, 4)
+
+    def test_parse_batch(self):
+        parse = OllamaTranslator.parse_batch
+        self.assertEqual(parse('```json\n["a", "b"]\n```', 2), ["a", "b"])
+        self.assertEqual(parse('<think>..</think>{"translations": [" a"]}', 1), ["a"])
+        self.assertIsNone(parse("not json", 1))
+        self.assertIsNone(parse('{"translations": [1]}', 1))
+
+    def test_do_translate_stream(self):
+        translator = OllamaTranslator(lang_in="en", lang_out="zh", model="test:3b")
+        translator.stream_guard = StreamGuard(enabled=True)
+        chunks = [
+            mock.Mock(message=mock.Mock(content=piece), done=False)
+            for piece in ["<think>\n</think>", "天空呈现", "蓝色"]
+        ]
+        chunks.append(
+            mock.Mock(
+                message=mock.Mock(content=""),
+                done=True,
+                prompt_eval_count=100,
+                eval_count=20,
+            )
+        )
+        with mock.patch.object(translator, "client") as mock_client:
+            mock_client.chat.return_value = iter(chunks)
+            with collect_usage() as usage:
+                self.assertEqual("天空呈现蓝色", translator.do_translate("The sky"))
+            self.assertTrue(mock_client.chat.call_args.kwargs["stream"])
+        summary = usage.summary()
+        self.assertEqual((summary["input_tokens"], summary["output_tokens"]), (100, 20))
+
     def test_remove_cot_content(self):
         fake_cot_resp_text = dedent(
             """\
@@ -224,5 +469,141 @@ class TestOllamaTranslator(unittest.TestCase):
         )
 
 
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.consumed += 1
+            yield piece
+
+    def close(self):
+        self.closed = True
+
+
+class TestStreamGuard(unittest.TestCase):
+    def test_consume(self):
+        guard = StreamGuard(enabled=True)
+        stream = FakeStream(["天空", None, "是蓝色的"])
+        content = guard.consume(stream, lambda c: c, "The sky is blue", 0)
+        self.assertEqual(content, "天空是蓝色的")
+        self.assertTrue(stream.closed)
+        self.assertEqual(guard.state()["aborted"], 0)
+        self.assertGreater(guard.state()["ttft"], 0)
+
+    def test_abort_runaway_output(self):
+        guard = StreamGuard(enabled=True, max_ratio=2, min_length=10)
+        stream = FakeStream(["repeat "] * 100)
+        with self.assertRaises(StreamAbortedError):
+            guard.consume(stream, lambda c: c, "short text", 0)
+        self.assertTrue(stream.closed)
+        self.assertLess(stream.consumed, 10)
+        self.assertEqual(guard.state()["aborted"], 1)
+
+    def test_abort_think_when_disabled(self):
+        guard = StreamGuard(enabled=True, allow_think=False)
+        stream = FakeStream(["\n<thi", "nk>", "Let me think"] + ["..."] * 50)
+        with self.assertRaises(StreamAbortedError):
+            guard.consume(stream, lambda c: c, "text", 0)
+        self.assertEqual(stream.consumed, 2)
+        # 允许思考时保留完整输出，由调用方过滤
+        guard = StreamGuard(enabled=True)
+        stream = FakeStream(["<think>", "x</think>", "ok"])
+        content = guard.consume(stream, lambda c: c, "text", 0)
+        self.assertEqual(content, "<think>x</think>ok")
+
+
+class BingStub(BaseHTTPRequestHandler):
+    """Serves the same page and API shape as www.bing.com/translator."""
+
+    token = "token-1"
+    page_loads = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        BingStub.page_loads += 1
+        body = (
+            '<script>var _G={"ig":"IG123"};'
+            f'var params_AbusePreventionHelper = [1700000000,"{BingStub.token}",3600000];'
+            '</script><div data-iid="translator.5023"></div>'
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        form = parse_qs(self.rfile.read(length).decode())
+        if form["token"][0] != BingStub.token:
+            result = {"statusCode": 205}
+        else:
+            result = [{"translations": [{"text": form["text"][0].upper()}]}]
+        body = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestBingTranslator(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), BingStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        BingStub.token = "token-1"
+        BingStub.page_loads = 0
+        self.translator = BingTranslator("en", "zh", None)
+        self.translator.endpoint = (
+            f"http://127.0.0.1:{self.server.server_address[1]}/translator"
+        )
+
+    def test_sid_reused(self):
+        for text in ["one", "two", "three"]:
+            self.assertEqual(self.translator.do_translate(text), text.upper())
+        self.assertEqual(BingStub.page_loads, 1)
+
+    def test_sid_refreshed_on_rejection(self):
+        self.assertEqual(self.translator.do_translate("one"), "ONE")
+        BingStub.token = "token-2"
+        self.assertEqual(self.translator.do_translate("two"), "TWO")
+        self.assertEqual(BingStub.page_loads, 2)
+
+    def test_sid_expires(self):
+        self.translator.do_translate("one")
+        self.translator._sid_expires = 0
+        self.translator.do_translate("two")
+        self.assertEqual(BingStub.page_loads, 2)
+
+    def test_valid_sid_not_blocked_by_refresh(self):
+        sid = self.translator.get_sid()
+        with self.translator._sid_lock:  # 另一个线程正在重新抓取
+            self.assertIs(self.translator.get_sid(), sid)
+
+    def test_sid_thread_safe(self):
+        threads = [
+            threading.Thread(target=self.translator.do_translate, args=(str(i),))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(BingStub.page_loads, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from string import Template
+import threading
+from unittest import mock
+
+from pdfminer.pdfinterp import PDFResourceManager
+
+from pdf2zh.converter import TranslateConverter
+from pdf2zh.translator import GoogleTranslator
+from pdf2zh.translator_pool import TranslatorPool, create_translator
+
+
+class TestTranslatorPool(unittest.TestCase):
+    def test_create_translator(self):
+        translator = create_translator("google", "en", "zh")
+        self.assertIsInstance(translator, GoogleTranslator)
+        with self.assertRaises(ValueError):
+            create_translator("InvalidService", "en", "zh")
+
+    def test_reuses_instances(self):
+        pool = TranslatorPool(size=4)
+        first = pool.get("google", "en", "zh")
+        self.assertIs(pool.get("google", "en", "zh", envs={}), first)
+        self.assertIsNot(pool.get("google", "en", "ja"), first)
+        self.assertIsNot(pool.get("google", "en", "zh", ignore_cache=True), first)
+
+    def test_key_includes_envs_and_prompt(self):
+        key = TranslatorPool.key
+        self.assertEqual(
+            key("openai", "en", "zh", {"A": "1", "B": None}),
+            key("openai", "en", "zh", {"B": None, "A": "1"}),
+        )
+        self.assertNotEqual(
+            key("openai", "en", "zh", {"A": "1"}),
+            key("openai", "en", "zh", {"A": "2"}),
+        )
+        self.assertNotEqual(
+            key("openai", "en", "zh", prompt=Template("a $text")),
+            key("openai", "en", "zh", prompt=Template("b $text")),
+        )
+
+    def test_evicts_least_recently_used(self):
+        pool = TranslatorPool(size=2)
+        with mock.patch(
+            "pdf2zh.translator_pool.create_translator",
+            side_effect=lambda *args: mock.Mock(),
+        ) as create:
+            zh = pool.get("google", "en", "zh")
+            pool.get("google", "en", "ja")
+            pool.get("google", "en", "zh")
+            pool.get("google", "en", "ko")  # 淘汰 ja
+            self.assertIs(pool.get("google", "en", "zh"), zh)
+            pool.get("google", "en", "ja")
+        self.assertEqual(create.call_count, 4)
+
+
+class TestSharedLimiter(unittest.TestCase):
+    def converter(self, translator, thread):
+        return TranslateConverter(
+            PDFResourceManager(), thread=thread, service="google", translator=translator
+        )
+
+    def test_limiter_created_once(self):
+        translator = GoogleTranslator("en", "zh", None)
+        self.converter(translator, 2)
+        limiter = translator.limiter
+        self.converter(translator, 8)
+        self.assertIs(translator.limiter, limiter)
+        self.assertEqual(limiter.max_limit, 8)
+        # 线程数较少的文档不会降低上限
+        self.converter(translator, 4)
+        self.assertEqual(limiter.max_limit, 8)
+
+    def test_release_goes_to_acquiring_limiter(self):
+        translator = GoogleTranslator("en", "zh", None)
+        self.converter(translator, 2)
+        started, finish = threading.Event(), threading.Event()
+
+        def slow(text):
+            started.set()
+            finish.wait(5)
+            return text
+
+        thread = threading.Thread(target=translator.call_service, args=(slow, "a"))
+        thread.start()
+        started.wait(5)
+        old = translator.limiter
+        translator.limiter = mock.Mock()  # 请求进行中 limiter 被替换
+        finish.set()
+        thread.join()
+        self.assertEqual(old.state()["inflight"], 0)
+        translator.limiter.release.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
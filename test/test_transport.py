@@ -0,0 +1,112 @@
+import unittest
+from unittest import mock
+
+import httpx
+import requests
+
+from pdf2zh import transport
+
+
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        transport.reset()
+        patcher = mock.patch.object(
+            transport, "_pool_size", transport.DEFAULT_POOL_SIZE
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(transport.reset)
+        config = mock.patch("pdf2zh.transport.ConfigManager.get", return_value=None)
+        config.start()
+        self.addCleanup(config.stop)
+
+    def test_session_shared_per_service(self):
+        session = transport.get_session("google")
+        self.assertIsInstance(session, requests.Session)
+        self.assertIs(transport.get_session("google"), session)
+        self.assertIsNot(transport.get_session("bing"), session)
+
+    def test_pool_follows_thread_count(self):
+        session = transport.get_session("google")
+        transport.configure(pool_size=32)
+        adapter = session.get_adapter("https://translate.google.com")
+        self.assertEqual(adapter._pool_maxsize, 32)
+        # 线程数较小时保留默认大小
+        transport.configure(pool_size=4)
+        adapter = transport.get_session("deeplx").get_adapter("https://x")
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+    def test_default_timeout(self):
+        session = transport.get_session("google")
+        with mock.patch(
+            "requests.adapters.HTTPAdapter.send", side_effect=requests.Timeout
+        ) as send:
+            with self.assertRaises(requests.Timeout):
+                session.get("https://translate.google.com/m")
+            self.assertEqual(
+                send.call_args.kwargs["timeout"],
+                (transport.DEFAULT_CONNECT_TIMEOUT, transport.DEFAULT_READ_TIMEOUT),
+            )
+            with self.assertRaises(requests.Timeout):
+                session.get("https://translate.google.com/m", timeout=5)
+            self.assertEqual(send.call_args.kwargs["timeout"], 5)
+
+    def mock_http2(self, handler):
+        """HTTP2Session whose clients answer with ``handler`` (h2 is optional)."""
+        client = mock.patch.object(
+            transport.HTTP2Session,
+            "_client",
+            side_effect=lambda size: httpx.Client(
+                transport=httpx.MockTransport(handler)
+            ),
+        )
+        client.start()
+        self.addCleanup(client.stop)
+        enabled = mock.patch("pdf2zh.transport.http2_enabled", return_value=True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+
+    def test_http2_session_accepts_requests_arguments(self):
+        seen = {}
+
+        def handler(request):
+            seen["body"] = request.content
+            return httpx.Response(200, json={"ok": True})
+
+        self.mock_http2(handler)
+        session = transport.get_session("openai")
+        response = session.post("https://example.com", data='{"a": 1}')
+        self.assertEqual(seen["body"], b'{"a": 1}')
+        self.assertEqual(response.json(), {"ok": True})
+
+    def test_http2_session_survives_resize(self):
+        self.mock_http2(lambda request: httpx.Response(200, json={"ok": True}))
+        session = transport.get_session("openai")  # 翻译器持有的引用
+        old_client = session.client
+        transport.configure(pool_size=32)
+        self.assertIs(transport.get_session("openai"), session)
+        self.assertIsNot(session.client, old_client)
+        self.assertTrue(old_client.is_closed)  # 没有进行中的请求，立即关闭
+        self.assertEqual(session.get("https://example.com").json(), {"ok": True})
+        transport.reset()
+        self.assertTrue(session.client.is_closed)
+
+    def test_http2_resize_waits_for_inflight_requests(self):
+        clients = []
+
+        def handler(request):
+            clients.append(session.client)
+            transport.configure(pool_size=32)  # 请求进行中扩容
+            self.assertFalse(clients[0].is_closed)
+            return httpx.Response(200, json={"ok": True})
+
+        self.mock_http2(handler)
+        session = transport.get_session("openai")
+        self.assertEqual(session.get("https://example.com").json(), {"ok": True})
+        self.assertTrue(clients[0].is_closed)  # 最后一个请求结束后关闭
+        self.assertFalse(session.client.is_closed)
+        self.assertEqual(session._retired, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import concurrent.futures
+import contextvars
+import unittest
+from unittest import mock
+
+import requests
+
+from pdf2zh import cache, usage
+from pdf2zh.batching import MicroBatcher
+from pdf2zh.ratelimit import RetryPolicy
+from pdf2zh.translator import BaseTranslator
+
+
+class UpperTranslator(BaseTranslator):
+    name = "upper"
+
+    def do_translate(self, text):
+        return text.upper()
+
+
+class TestUsageAccumulator(unittest.TestCase):
+    def test_record_outside_run_is_ignored(self):
+        usage.record(requests=1)
+        self.assertIsNone(usage.current())
+
+    def test_collect(self):
+        with usage.collect() as run:
+            usage.record(requests=2, cost=0.5)
+            usage.record(input_tokens=10)
+            self.assertIs(usage.current(), run)
+        self.assertIsNone(usage.current())
+        summary = run.summary()
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["input_tokens"], 10)
+        self.assertEqual(summary["cost"], 0.5)
+        self.assertGreaterEqual(summary["elapsed"], 0)
+
+    def test_runs_are_separate(self):
+        with usage.collect() as first:
+            usage.record(requests=1)
+        with usage.collect() as second:
+            usage.record(requests=3)
+        self.assertEqual(first.summary()["requests"], 1)
+        self.assertEqual(second.summary()["requests"], 3)
+
+    def test_merge_summaries(self):
+        merged = usage.merge_summaries(
+            [
+                {"requests": 2, "cost": 0.1, "elapsed": 10.0},
+                {"requests": 3, "cost": 0.2, "elapsed": 30.0},
+            ]
+        )
+        self.assertEqual(merged, {"requests": 5, "cost": 0.3, "elapsed": 30.0})
+
+    def test_worker_threads_with_copied_context(self):
+        with usage.collect() as run:
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                for _ in range(8):
+                    executor.submit(
+                        contextvars.copy_context().run, usage.record, requests=1
+                    )
+        self.assertEqual(run.summary()["requests"], 8)
+
+    def test_micro_batcher_keeps_context(self):
+        def translate(items):
+            usage.record(requests=1)
+            return items
+
+        batcher = MicroBatcher(translate, max_batch=4, max_wait=0.01)
+        with usage.collect() as run:
+            self.assertEqual(batcher("a"), "a")
+        self.assertEqual(run.summary()["requests"], 1)
+
+
+class TestTranslatorUsage(unittest.TestCase):
+    def setUp(self):
+        self.test_db = cache.init_test_db()
+
+    def tearDown(self):
+        cache.clean_test_db(self.test_db)
+
+    def test_requests_and_cache_hits(self):
+        translator = UpperTranslator("en", "zh", "test", False)
+        with usage.collect() as run:
+            translator.translate("hello")
+            translator.translate("hello")
+            translator.translate_batch(["hello", "world"])
+        summary = run.summary()
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["cache_hits"], 2)
+
+    def test_retries(self):
+        response = requests.Response()
+        response.status_code = 503
+        fn = mock.Mock(side_effect=[requests.HTTPError(response=response), "ok"])
+        with mock.patch("pdf2zh.ratelimit.time.sleep"), usage.collect() as run:
+            RetryPolicy().call(fn)
+        self.assertEqual(run.summary()["retries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,14 @@ import pytest
 import os
 import tempfile
 import shutil
+import sqlite3
 from datetime import datetime, timezone, timedelta
 from unittest.mock import patch, MagicMock
-from pdf2zh.usage_logger import log_usage, calculate_cost, check_daily_limit
+from pdf2zh.usage_logger import (
+    UsageLedger, calculate_cost, check_daily_limit, get_ledger, log_usage
+)
 from pdf2zh.price_scraper import PriceData
+from pdf2zh.usage import collect
 
 
 class TestUsageLogger:
@@ -35,36 +39,57 @@ class TestUsageLogger:
             # デフォルト価格: (1000/1M * 0.01) + (500/1M * 0.03) = 0.00001 + 0.000015 = 0.000025
             assert abs(cost - 0.000025) < 0.000001
 
-    @patch('pdf2zh.usage_logger.LOG_DIR')
-    @patch('pdf2zh.usage_logger.LOG_FILE')
-    @patch('pdf2zh.usage_logger.LOCK_FILE')
-    def test_log_usage_with_cost(self, mock_lock, mock_file, mock_dir, temp_log_dir):
+    def test_unknown_model_warns_once(self, capsys):
+        """価格不明の警告はモデルごとに1回だけ表示する"""
+        with patch.object(PriceData, 'get_price', return_value=None):
+            calculate_cost("unknown-model-warn", 1000, 500)
+            calculate_cost("unknown-model-warn", 1000, 500)
+        assert capsys.readouterr().out.count("unknown-model-warn") == 1
+
+    def test_calculate_cost_with_cached_tokens(self):
+        """キャッシュ済み入力トークンのコスト計算テスト"""
+        with patch.object(PriceData, 'get_price') as mock_get_price:
+            mock_get_price.return_value = {"input": 10.0, "output": 30.0, "cached_input": 2.5}
+            # (200/1M * 10) + (800/1M * 2.5) + (500/1M * 30) = 0.002 + 0.002 + 0.015
+            cost = calculate_cost("gpt-4o", 1000, 500, cached_tokens=800)
+            assert abs(cost - 0.019) < 0.0001
+
+            # cached_input がない場合は通常の入力価格
+            mock_get_price.return_value = {"input": 10.0, "output": 30.0}
+            cost = calculate_cost("gpt-4", 1000, 500, cached_tokens=800)
+            assert abs(cost - 0.025) < 0.0001
+
+    @pytest.fixture
+    def ledger_dir(self, temp_log_dir):
+        """台帳の保存先を一時ディレクトリに切り替える"""
+        with patch('pdf2zh.usage_logger.LOG_DIR', temp_log_dir):
+            yield temp_log_dir
+
+    def test_log_usage_with_cost(self, ledger_dir):
         """コスト指定でのログ記録テスト"""
-        mock_dir.return_value = temp_log_dir
-        mock_file.return_value = os.path.join(temp_log_dir, "openai.txt")
-        mock_lock.return_value = os.path.join(temp_log_dir, "openai.txt.lock")
-        
-        # ログ記録
         log_usage(1000, 0.05)
-        
-        # ファイルの確認
-        log_file = os.path.join(temp_log_dir, "openai.txt")
-        assert os.path.exists(log_file)
-        
-        with open(log_file, 'r') as f:
-            content = f.read()
-            assert "Total: tokens: 1000, cost: 0.0500" in content
-            assert "Daily:" in content
-
-    @patch('pdf2zh.usage_logger.LOG_DIR')
-    @patch('pdf2zh.usage_logger.LOG_FILE')
-    @patch('pdf2zh.usage_logger.LOCK_FILE')
+
+        assert os.path.exists(os.path.join(ledger_dir, "usage.db"))
+        ledger = get_ledger()
+        assert ledger.total() == {"tokens": 1000, "cost": 0.05}
+        assert ledger.daily()["tokens"] == 1000
+
+    @patch('pdf2zh.usage_logger.calculate_cost')
+    def test_log_usage_feeds_run_usage(self, mock_calc, ledger_dir):
+        """実行中のドキュメントの集計にも加算されることのテスト"""
+        mock_calc.return_value = 0.02
+        with collect() as usage:
+            log_usage(1500, model="gpt-4o", input_tokens=1000, output_tokens=500,
+                      cached_tokens=200)
+        summary = usage.summary()
+        assert summary["input_tokens"] == 1000
+        assert summary["output_tokens"] == 500
+        assert summary["cached_tokens"] == 200
+        assert summary["cost"] == 0.02
+
     @patch('pdf2zh.usage_logger.calculate_cost')
-    def test_log_usage_with_auto_calc(self, mock_calc, mock_lock, mock_file, mock_dir, temp_log_dir):
+    def test_log_usage_with_auto_calc(self, mock_calc, ledger_dir):
         """自動コスト計算でのログ記録テスト"""
-        mock_dir.return_value = temp_log_dir
-        mock_file.return_value = os.path.join(temp_log_dir, "openai.txt")
-        mock_lock.return_value = os.path.join(temp_log_dir, "openai.txt.lock")
         mock_calc.return_value = 0.025
         
         # ログ記録（コスト自動計算）
@@ -73,41 +98,65 @@ class TestUsageLogger:
         # calculate_costが呼ばれたことを確認
         mock_calc.assert_called_once_with("gpt-4", 1000, 500)
         
-        # ファイルの確認
-        log_file = os.path.join(temp_log_dir, "openai.txt")
-        with open(log_file, 'r') as f:
-            content = f.read()
-            assert "Total: tokens: 1500, cost: 0.0250" in content
+        row = sqlite3.connect(os.path.join(ledger_dir, "usage.db")).execute(
+            "SELECT model, input_tokens, output_tokens, cached_tokens, tokens, cost FROM usage"
+        ).fetchone()
+        assert row == ("gpt-4", 1000, 500, 0, 1500, 0.025)
 
     def test_log_usage_missing_params(self):
         """必要なパラメータが不足している場合のテスト"""
         with pytest.raises(ValueError, match="Cost calculation requires"):
             log_usage(1000)  # costもmodelも指定なし
 
-    @patch('pdf2zh.usage_logger.LOG_DIR')
-    @patch('pdf2zh.usage_logger.LOG_FILE')
-    @patch('pdf2zh.usage_logger.LOCK_FILE')
-    def test_check_daily_limit(self, mock_lock, mock_file, mock_dir, temp_log_dir):
+    def test_check_daily_limit(self, ledger_dir):
         """日次制限チェックのテスト"""
-        mock_dir.return_value = temp_log_dir
-        log_file = os.path.join(temp_log_dir, "openai.txt")
-        mock_file.return_value = log_file
-        mock_lock.return_value = os.path.join(temp_log_dir, "openai.txt.lock")
-        
-        # 制限内のログファイル作成
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        with open(log_file, 'w') as f:
-            f.write(f"Total: tokens: 500000, cost: 5.0000\\n\\n")
-            f.write(f"Daily: date: {today}, tokens: 500000, cost: 5.0000\\n")
+        log_usage(500000, 5.0)
         
         # エラーなし
         check_daily_limit()
         
-        # 制限超過のログファイル作成
-        with open(log_file, 'w') as f:
-            f.write(f"Total: tokens: 1000000, cost: 10.0000\\n\\n")
-            f.write(f"Daily: date: {today}, tokens: 995000, cost: 9.9500\\n")
+        # 制限超過
+        log_usage(495000, 4.95)
         
         # SystemExitが発生することを確認
         with pytest.raises(SystemExit):
-            check_daily_limit()
\ No newline at end of file
+            check_daily_limit()
+
+    def test_daily_total_in_memory(self, ledger_dir):
+        """日次合計はメモリから読み、他プロセスの記録は再集計で取り込む"""
+        ledger = get_ledger()
+        log_usage(100, 0.01)
+        assert ledger.daily()["tokens"] == 100
+
+        # 別プロセスの記録
+        other = UsageLedger(ledger.path)
+        other.append(50, 0.005)
+        with patch.object(ledger, "refresh", wraps=ledger.refresh) as refresh:
+            assert ledger.daily()["tokens"] == 100
+            refresh.assert_not_called()
+        ledger._refreshed = 0
+        assert ledger.daily()["tokens"] == 150
+
+    def test_throughput(self, ledger_dir):
+        """モデルごとの平均処理時間のテスト"""
+        ledger = get_ledger()
+        assert ledger.throughput("gpt-4o") is None
+        ledger.append(100, 0.01, "gpt-4o", 50, 50, elapsed=1.0)
+        ledger.append(100, 0.01, "gpt-4o", 50, 50, elapsed=3.0)
+        ledger.append(100, 0.01, "gpt-4o-mini", 50, 50, elapsed=10.0)
+        ledger.append(100, 0.01, "gpt-4o")  # elapsed なしは除外
+        assert ledger.throughput("gpt-4o") == {"requests": 2, "seconds_per_request": 2.0}
+        assert ledger.throughput("gpt-4o", limit=1)["seconds_per_request"] == 3.0
+
+    def test_import_text_log(self, ledger_dir):
+        """旧形式のテキストログからの移行テスト"""
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+        with open(os.path.join(ledger_dir, "openai.txt"), 'w') as f:
+            f.write("Total: tokens: 1500, cost: 0.0300\n\n")
+            f.write(f"Daily: date: {yesterday}, tokens: 1000, cost: 0.0200\n")
+            f.write(f"Daily: date: {today}, tokens: 500, cost: 0.0100, cached: 0\n")
+
+        ledger = get_ledger()
+        assert ledger.daily()["tokens"] == 500
+        assert ledger.total()["tokens"] == 1500